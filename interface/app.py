@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import subprocess
 import sys
 from pathlib import Path
 
@@ -12,7 +11,31 @@ if str(SRC_DIR) not in sys.path:
     sys.path.append(str(SRC_DIR))
 
 # Importa os módulos LOCAIS
-from modules import styles, auth, db_manager
+from modules import styles, auth, db_manager, job_manager, log_reader
+
+# --- Execuções do main.py em segundo plano ---
+@st.cache_resource
+def obter_gerenciador():
+    """Gerenciador único do processo: todas as sessões veem a mesma execução."""
+    return job_manager.GerenciadorExecucoes()
+
+def mostrar_execucao(execucao, linhas=30):
+    if execucao.em_andamento:
+        st.info(f"⏳ Verificação em andamento há {execucao.duracao_s}s...")
+    elif execucao.status == 'Sucesso':
+        st.success(f"Sucesso! ({execucao.duracao_s}s)")
+    else:
+        st.error(f"Erro na execução (código {execucao.codigo_saida}, {execucao.duracao_s}s)")
+    st.code("\n".join(list(execucao.linhas)[-linhas:]), language="log")
+
+@st.fragment(run_every=2)
+def acompanhar_execucao(gerenciador):
+    """Atualiza só este trecho a cada 2s enquanto a execução roda."""
+    execucao = gerenciador.atual
+    mostrar_execucao(execucao)
+    if not execucao.em_andamento:
+        # Terminou: um rerun completo troca o painel ao vivo pelo resultado
+        st.rerun()
 
 # --- Configuração Inicial ---
 st.set_page_config(page_title="Gestor Fiscal BI", layout="wide")
@@ -36,12 +59,20 @@ else:
         # Reseta a flag para não mostrar a mensagem novamente em futuros recarregamentos
         st.session_state['save_success'] = False
 
-    # Carregamento de Dados (Cacheado na Sessão)
-    if 'df_data' not in st.session_state:
-        st.session_state.df_data = db_manager.load_data()
+    # Carregamento de Dados: uma cópia por sessão de edição, tirada do cache
+    # compartilhado (ver db_manager). Ela serve de entrada do editor e de base
+    # do diff ao salvar, e só é renovada após salvar ou recarregar, para que
+    # outra sessão salvando (ou o TTL vencendo) não reinicie a edição
+    df_data = st.session_state.get('config_snapshot')
+    if df_data is None:
+        df_data = db_manager.load_data()
+        # Uma falha de leitura (DataFrame vazio) não vira snapshot
+        if not df_data.empty:
+            st.session_state['config_snapshot'] = df_data
+            st.session_state['config_versao'] = st.session_state.get('config_versao', 0) + 1
 
     # Trabalha com uma cópia local
-    df = st.session_state.df_data.copy()
+    df = df_data.copy()
 
     # Tratamento visual (Time Object) se houver dados
     if not df.empty and "hora_tolerancia" in df.columns:
@@ -84,29 +115,33 @@ else:
 
         # --- 2. OPERAÇÕES (SCRIPTS) ---
         st.subheader("⚙️ Operações")
-        if st.button("▶️ Rodar Verificação (main.py)", use_container_width=True):
-            with st.status("Processando...", expanded=True):
-                try:
-                    # Aponta para o script main.py na pasta SRC vizinha
-                    script_path = SRC_DIR / 'main.py'
-                    
-                    # Executa o script
-                    res = subprocess.run(
-                        [sys.executable, str(script_path)], 
-                        capture_output=True, 
-                        text=True, 
-                        encoding='utf-8', 
-                        errors='replace'
-                    )
-                    
-                    if res.returncode == 0:
-                        st.success("Sucesso!")
-                        st.code(res.stdout)
-                    else:
-                        st.error("Erro na execução")
-                        st.text(res.stderr)
-                except Exception as e:
-                    st.error(f"Erro crítico ao tentar rodar script: {e}")  
+        gerenciador = obter_gerenciador()
+        verificar_todas = st.checkbox(
+            "Verificar todas as tabelas",
+            help="Inclui as tabelas que continuam no prazo desde a última verificação."
+        )
+        if st.button("▶️ Rodar Verificação (main.py)", use_container_width=True, disabled=gerenciador.em_andamento()):
+            # Roda em segundo plano; só uma execução por vez para todas as sessões
+            if gerenciador.iniciar(['--verificar-todas'] if verificar_todas else []) is None:
+                st.warning("Já existe uma verificação em andamento.")
+
+        if gerenciador.em_andamento():
+            acompanhar_execucao(gerenciador)
+        elif gerenciador.atual is not None:
+            mostrar_execucao(gerenciador.atual)
+
+        historico = gerenciador.historico()
+        if historico:
+            with st.expander("🕑 Execuções Anteriores", expanded=False):
+                st.dataframe(
+                    pd.DataFrame([{
+                        "Início": e.inicio.strftime("%d/%m %H:%M:%S"),
+                        "Status": e.status,
+                        "Duração (s)": e.duracao_s,
+                        "Argumentos": " ".join(e.argumentos),
+                    } for e in historico]),
+                    use_container_width=True, hide_index=True
+                )
 
         st.divider()
         
@@ -122,21 +157,29 @@ else:
             
             if log_file_path.exists():
                 try:
-                    # Lê as últimas 100 linhas para não pesar a interface
-                    with open(log_file_path, "r", encoding="utf-8") as f:
-                        lines = f.readlines()
-                        last_lines = "".join(lines[-100:]) if len(lines) > 100 else "".join(lines)
+                    # Lê só o fim do arquivo (de trás para frente), sem carregar o log inteiro
+                    qtd_linhas = st.number_input("Linhas:", min_value=20, max_value=2000, value=100, step=50)
+                    last_lines = log_reader.ler_ultimas_linhas(log_file_path, int(qtd_linhas))
                     
-                    st.caption(f"Exibindo as últimas {min(len(lines), 100)} linhas:")
+                    st.caption(f"Exibindo as últimas {len(last_lines)} linhas:")
                     # Mostra o log em um bloco de código rolável
-                    st.code(last_lines, language="log", line_numbers=True)
+                    st.code("\n".join(last_lines), language="log", line_numbers=True)
                     
-                    # Botão para baixar o log completo
-                    with open(log_file_path, "rb") as file:
+                    # Execuções anteriores, pelo índice de offsets do arquivo
+                    execucoes = log_reader.indexar_execucoes(log_file_path)
+                    if execucoes:
+                        opcoes = list(range(len(execucoes) - 1, -1, -1))
+                        escolhida = st.selectbox(
+                            "Execução:", opcoes,
+                            format_func=lambda i: f"{execucoes[i][1]}" + (" (última)" if i == len(execucoes) - 1 else "")
+                        )
+                        data_hora, texto_execucao = log_reader.ler_execucao(log_file_path, escolhida)
+                        
+                        # Botão para baixar a execução escolhida
                         st.download_button(
-                            label="📥 Baixar Log Completo",
-                            data=file,
-                            file_name="fiscal_bi.log",
+                            label="📥 Baixar Execução",
+                            data=texto_execucao,
+                            file_name=f"fiscal_bi_{data_hora[:19].replace(' ', '_').replace(':', '')}.log",
                             mime="text/plain",
                             use_container_width=True
                         )
@@ -145,6 +188,30 @@ else:
             else:
                 st.warning("Arquivo de log ainda não criado.")
 
+        with st.expander("🔎 Buscar no Log", expanded=False):
+            with st.form("form_busca_log"):
+                nivel = st.selectbox("Nível:", ["(Todos)", "INFO", "WARNING", "ERROR"])
+                script = st.text_input("Script:", placeholder="check_powerbi")
+                ativo = st.text_input("Ativo:", placeholder="nome da tabela ou BI")
+                incluir_antigos = st.checkbox("Incluir logs rotacionados")
+                buscar = st.form_submit_button("Buscar", use_container_width=True)
+            
+            if buscar:
+                try:
+                    arquivos = log_reader.arquivos_log(log_file_path) if incluir_antigos else [log_file_path]
+                    resultados = list(log_reader.buscar(
+                        [a for a in arquivos if Path(a).exists()],
+                        nivel=None if nivel == "(Todos)" else nivel,
+                        script=script.strip() or None,
+                        ativo=ativo.strip() or None,
+                        limite=500
+                    ))
+                    st.caption(f"{len(resultados)} linhas encontradas (máximo de 500).")
+                    if resultados:
+                        st.dataframe(pd.DataFrame(resultados), use_container_width=True, hide_index=True)
+                except Exception as e:
+                    st.error(f"Erro ao buscar no log: {e}")
+
         st.divider()
         if st.button("Sair", type="secondary"):
             auth.logout()
@@ -168,6 +235,8 @@ else:
         # Tabela Editável
         edited_df = st.data_editor(
             df,
+            # Chave estável por snapshot: as edições pendentes sobrevivem aos reruns
+            key=f"editor_config_{st.session_state.get('config_versao', 0)}",
             num_rows="dynamic",
             use_container_width=True,
             height=700, 
@@ -185,7 +254,13 @@ else:
         )
 
         # Botão Salvar
-        col1, _ = st.columns([1, 5])
+        col1, col2, _ = st.columns([1, 1, 4])
+        with col2:
+            # Descarta o cache compartilhado (ex.: tabela alterada direto no banco)
+            if st.button("🔄 Recarregar do Banco", use_container_width=True):
+                db_manager.invalidar_cache()
+                st.session_state.pop('config_snapshot', None)
+                st.rerun()
         with col1:
             if st.button("💾 Salvar no Banco", type="primary", use_container_width=True):
                 df_save = edited_df.copy()
@@ -199,15 +274,58 @@ else:
                 )
 
                 # --- Lógica de Salvar com Feedback Explícito ---
-                if db_manager.save_data(df_save):
+                if db_manager.save_data(df_save, df_data):
                     # Define uma flag de sucesso na sessão para mostrar a mensagem APÓS o rerun
                     st.session_state['save_success'] = True
                     
-                    # Força recarregamento do cache de dados
-                    if 'df_data' in st.session_state:
-                        del st.session_state.df_data 
-                    
+                    # save_data já invalidou o cache compartilhado; o rerun lê do banco
+                    st.session_state.pop('config_snapshot', None)
                     st.rerun()
                 else:
                     # Se falhar (retornar False), mostramos o erro explicitamente aqui
-                    st.error("❌ Falha ao salvar no banco! Verifique a conexão ou os logs.", icon="⚠️")
\ No newline at end of file
+                    st.error("❌ Falha ao salvar no banco! Verifique a conexão ou os logs.", icon="⚠️")
+
+    # ==========================================
+    # HISTÓRICO DE REFRESH DO POWER BI
+    # ==========================================
+    with st.expander("📈 Histórico de Refresh do Power BI", expanded=False):
+        dias_refresh = st.number_input("Últimos dias:", min_value=1, max_value=365, value=30, step=1)
+        df_refresh = db_manager.load_estatisticas_refresh(int(dias_refresh))
+        if df_refresh.empty:
+            st.info("Nenhum refresh gravado no período (ver `pbi_historico_refresh`).")
+        else:
+            st.caption("Datasets com mais falhas e refreshes mais lentos primeiro. Durações em segundos.")
+            df_refresh["taxa_falha"] = df_refresh["taxa_falha"].astype(float) * 100
+            st.dataframe(
+                df_refresh,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "taxa_falha": st.column_config.NumberColumn("Taxa de Falha", format="%.1f%%"),
+                    "duracao_media_s": st.column_config.NumberColumn("Duração Média", format="%.0f"),
+                    "duracao_p50_s": st.column_config.NumberColumn("p50", format="%.0f"),
+                    "duracao_p95_s": st.column_config.NumberColumn("p95", format="%.0f"),
+                }
+            )
+
+    # ==========================================
+    # CADÊNCIA DE INGESTÃO (WATERMARKS)
+    # ==========================================
+    with st.expander("⏱️ Cadência de Ingestão das Tabelas", expanded=False):
+        dias_cadencia = st.number_input("Últimos dias:", min_value=1, max_value=365, value=30, step=1,
+                                        key="dias_cadencia")
+        df_cadencia = db_manager.load_cadencia_ingestao(int(dias_cadencia))
+        if df_cadencia.empty:
+            st.info("Sem avanços de watermark no período (ver `usar_watermarks`).")
+        else:
+            st.caption("Tabelas mais atrasadas em relação à própria cadência primeiro. Intervalos em horas.")
+            st.dataframe(
+                df_cadencia,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "horas_entre_cargas": st.column_config.NumberColumn("Entre Cargas (média)", format="%.1f"),
+                    "horas_entre_cargas_max": st.column_config.NumberColumn("Entre Cargas (máx.)", format="%.1f"),
+                    "horas_desde_ultima": st.column_config.NumberColumn("Desde a Última", format="%.1f"),
+                }
+            )
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 from datetime import datetime, time
@@ -9,23 +10,31 @@ import warnings
 # Estamos em: Fiscal_BI/interface/modules/db_manager.py
 # Queremos ir para: Fiscal_BI/src
 ROOT_DIR = Path(__file__).resolve().parents[2] # Sobe 2 níveis
-SRC_DIR = ROOT_DIR
+SRC_DIR = ROOT_DIR / 'src'
 
 if str(SRC_DIR) not in sys.path:
     sys.path.append(str(SRC_DIR))
 
-# Agora o import funciona
-from src.database import get_db_connection, insert_dataframe
+# Importa como 'database' (e não 'src.database') para usar o MESMO módulo,
+# e portanto o mesmo pool de conexões, que os checkers
+from database import conexao
+from historico_refresh import estatisticas_refreshes
+from watermarks import cadencia_ingestao
 
 CONN_ID = 'dbDrogamais'
 TABLE_NAME = 'dim_tabelas_fiscal'
 
-def load_data():
-    conn = get_db_connection(CONN_ID)
-    if not conn:
-        st.error("Falha de conexão com o banco.")
-        return pd.DataFrame()
-    
+# Tempo máximo (s) que a configuração fica no cache compartilhado; salvar
+# pela interface invalida na hora, o TTL cobre alterações feitas fora dela
+TTL_CACHE_S = 300
+
+@st.cache_data(ttl=TTL_CACHE_S, show_spinner=False)
+def _consultar_config():
+    """
+    Lê dim_tabelas_fiscal. Cacheado no processo do Streamlit, compartilhado
+    por todas as sessões (cada chamada recebe uma cópia do DataFrame).
+    Falhas levantam exceção, para não ficarem no cache.
+    """
     query = f"""
         SELECT 
             nome_ativo, tipo_ativo, coluna_referencia, 
@@ -35,34 +44,151 @@ def load_data():
         FROM {TABLE_NAME}
         ORDER BY nome_ativo ASC
     """
-    try:
+    with conexao(CONN_ID) as conn:
+        if not conn:
+            raise ConnectionError("Falha de conexão com o banco.")
+
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             df = pd.read_sql(query, conn)
         
-        conn.close()
         df['ativo'] = df['ativo'].astype(bool)
         return df
+
+def load_data():
+    try:
+        return _consultar_config()
+    except ConnectionError as e:
+        st.error(str(e))
     except Exception as e:
         st.error(f"Erro SQL: {e}")
-        if conn: conn.close()
-        return pd.DataFrame()
-
-def save_data(df):
-    conn = get_db_connection(CONN_ID)
-    if not conn: return False
-    
-    cursor = conn.cursor()
+    return pd.DataFrame()
+
+@st.cache_data(ttl=TTL_CACHE_S, show_spinner=False)
+def _consultar_estatisticas_refresh(dias):
+    """Estatísticas de fiscal_pbi_refreshes (ver historico_refresh), no mesmo cache da configuração."""
+    with conexao(CONN_ID) as conn:
+        if not conn:
+            raise ConnectionError("Falha de conexão com o banco.")
+        return estatisticas_refreshes(conn, dias)
+
+def load_estatisticas_refresh(dias=30):
+    try:
+        return _consultar_estatisticas_refresh(dias)
+    except ConnectionError as e:
+        st.error(str(e))
+    except Exception as e:
+        st.error(f"Erro SQL: {e}")
+    return pd.DataFrame()
+
+@st.cache_data(ttl=TTL_CACHE_S, show_spinner=False)
+def _consultar_cadencia(dias):
+    """Cadência de ingestão de fiscal_watermarks_hist (ver watermarks), no mesmo cache da configuração."""
+    with conexao(CONN_ID) as conn:
+        if not conn:
+            raise ConnectionError("Falha de conexão com o banco.")
+        return cadencia_ingestao(conn, dias)
+
+def load_cadencia_ingestao(dias=30):
     try:
-        cursor.execute(f"TRUNCATE TABLE {TABLE_NAME}")
-        conn.commit()
-        sucesso = insert_dataframe(conn, df, TABLE_NAME)
-        return sucesso
+        return _consultar_cadencia(dias)
+    except ConnectionError as e:
+        st.error(str(e))
     except Exception as e:
+        st.error(f"Erro SQL: {e}")
+    return pd.DataFrame()
+
+def invalidar_cache():
+    """Descarta a configuração em cache (todas as sessões leem de novo do banco)."""
+    _consultar_config.clear()
+
+# Colunas gravadas em dim_tabelas_fiscal (a chave é nome_ativo)
+CHAVE = 'nome_ativo'
+COLUNAS = [
+    'nome_ativo', 'tipo_ativo', 'coluna_referencia', 'conn_key',
+    'workspace_log', 'dias_tolerancia', 'hora_tolerancia', 'ativo'
+]
+
+def _normalizar(valor):
+    """Iguala nulos, números e booleanos vindos do banco e do data_editor para comparar."""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if isinstance(valor, time):
+        return valor.strftime("%H:%M")
+    if isinstance(valor, (bool, np.bool_)):
+        return int(valor)
+    if isinstance(valor, (int, float, np.integer, np.floating)) and float(valor).is_integer():
+        return int(valor)
+    if isinstance(valor, str):
+        return valor.strip()
+    return valor
+
+def _linhas_por_chave(df):
+    linhas = {}
+    for registro in df.reindex(columns=COLUNAS).to_dict('records'):
+        registro = {c: _normalizar(v) for c, v in registro.items()}
+        if registro[CHAVE] is None:
+            continue
+        if registro[CHAVE] in linhas:
+            raise ValueError(f"'{registro[CHAVE]}' aparece mais de uma vez.")
+        linhas[registro[CHAVE]] = registro
+    return linhas
+
+def calcular_alteracoes(original, editado):
+    """
+    Compara o estado editado com o carregado, por nome_ativo.
+    Devolve (inserir, atualizar, excluir): listas de dicts para inserir e
+    atualizar (linha completa) e a lista de nomes a excluir. Renomear um
+    ativo vira exclusão do nome antigo + inserção do novo.
+    """
+    antes, depois = _linhas_por_chave(original), _linhas_por_chave(editado)
+    inserir = [linha for chave, linha in depois.items() if chave not in antes]
+    atualizar = [linha for chave, linha in depois.items() if chave in antes and linha != antes[chave]]
+    excluir = [chave for chave in antes if chave not in depois]
+    return inserir, atualizar, excluir
+
+def save_data(df, df_original):
+    """
+    Grava só o que mudou em relação a df_original (o que foi carregado e
+    mostrado no editor): INSERT, UPDATE e DELETE por nome_ativo, numa única
+    transação. A tabela nunca fica vazia para os checkers durante o salvamento.
+    """
+    try:
+        inserir, atualizar, excluir = calcular_alteracoes(df_original, df)
+    except ValueError as e:
         st.error(f"Erro ao salvar: {e}")
         return False
-    finally:
-        conn.close()
+    if not (inserir or atualizar or excluir):
+        return True
+
+    with conexao(CONN_ID) as conn:
+        if not conn: return False
+        
+        cursor = conn.cursor()
+        try:
+            if excluir:
+                cursor.executemany(f"DELETE FROM {TABLE_NAME} WHERE {CHAVE} = ?", [(c,) for c in excluir])
+            if atualizar:
+                colunas = [c for c in COLUNAS if c != CHAVE]
+                cursor.executemany(
+                    f"UPDATE {TABLE_NAME} SET {', '.join(f'{c} = ?' for c in colunas)} WHERE {CHAVE} = ?",
+                    [tuple(linha[c] for c in colunas) + (linha[CHAVE],) for linha in atualizar]
+                )
+            if inserir:
+                # Tudo ou nada: uma linha inválida desfaz o salvamento inteiro
+                cursor.executemany(
+                    f"INSERT INTO {TABLE_NAME} ({', '.join(COLUNAS)}) VALUES ({', '.join(['?'] * len(COLUNAS))})",
+                    [tuple(linha[c] for c in COLUNAS) for linha in inserir]
+                )
+            conn.commit()
+            invalidar_cache()
+            return True
+        except Exception as e:
+            conn.rollback()
+            st.error(f"Erro ao salvar: {e}")
+            return False
+        finally:
+            cursor.close()
 
 # Helpers de Tempo
 def parse_time_safe(val):
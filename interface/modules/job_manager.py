@@ -0,0 +1,117 @@
+# job_manager.py (Execução do main.py em segundo plano, uma por vez, com saída ao vivo e histórico)
+
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+SRC_DIR = ROOT_DIR / 'src'
+SCRIPT_MAIN = SRC_DIR / 'main.py'
+
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+from trava_arquivo import TRAVA_EXECUCAO, execucao_em_andamento  # noqa: E402
+
+# Linhas de saída guardadas por execução (as mais recentes)
+MAX_LINHAS = 500
+# Execuções mantidas no histórico
+MAX_HISTORICO = 20
+
+
+@dataclass
+class Execucao:
+    """Uma execução do main.py disparada pela interface."""
+    id: str
+    argumentos: list
+    inicio: datetime = field(default_factory=datetime.now)
+    fim: datetime = None
+    status: str = 'Executando'
+    codigo_saida: int = None
+    total_linhas: int = 0
+    linhas: deque = field(default_factory=lambda: deque(maxlen=MAX_LINHAS))
+
+    @property
+    def em_andamento(self):
+        return self.fim is None
+
+    @property
+    def duracao_s(self):
+        return round(((self.fim or datetime.now()) - self.inicio).total_seconds(), 1)
+
+
+class GerenciadorExecucoes:
+    """
+    Roda o main.py como subprocesso em uma thread, sem bloquear a sessão do
+    Streamlit. Só uma execução por vez (single-flight): um segundo pedido
+    enquanto outra roda é recusado, e ninguém apaga as linhas da hora atual
+    de uma execução em andamento. A saída é lida linha a linha e a interface
+    acompanha consultando a execução (polling).
+    Uma instância por processo do Streamlit (ver app.py, st.cache_resource).
+    Entre processos (outra instância do Streamlit, exec_main.bat, agendador)
+    quem garante uma execução por vez é a trava de arquivo que o próprio
+    main.py toma (trava_arquivo.TRAVA_EXECUCAO); o pedido também é recusado
+    se ela já estiver tomada.
+    """
+
+    def __init__(self, script=SCRIPT_MAIN, trava=TRAVA_EXECUCAO):
+        self._script = script
+        self._trava = trava
+        self._lock = threading.Lock()
+        self._atual = None
+        self._historico = deque(maxlen=MAX_HISTORICO)
+
+    def iniciar(self, argumentos=()):
+        """Dispara uma execução. Devolve a Execucao, ou None se já houver uma em andamento."""
+        with self._lock:
+            if self._atual is not None and self._atual.em_andamento:
+                return None
+            if execucao_em_andamento(self._trava):
+                return None
+            execucao = Execucao(id=uuid.uuid4().hex[:8], argumentos=list(argumentos))
+            self._atual = execucao
+            self._historico.appendleft(execucao)
+
+        threading.Thread(target=self._rodar, args=(execucao,), name=f"main-{execucao.id}", daemon=True).start()
+        return execucao
+
+    def _rodar(self, execucao):
+        # Sem buffer no filho, para as linhas chegarem enquanto ele roda
+        env = {**os.environ, 'PYTHONUNBUFFERED': '1', 'PYTHONIOENCODING': 'utf-8'}
+        try:
+            processo = subprocess.Popen(
+                [sys.executable, str(self._script), *execucao.argumentos],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                text=True, encoding='utf-8', errors='replace', bufsize=1,
+                cwd=str(ROOT_DIR), env=env
+            )
+            for linha in processo.stdout:
+                execucao.linhas.append(linha.rstrip('\n'))
+                execucao.total_linhas += 1
+            execucao.codigo_saida = processo.wait()
+            execucao.status = 'Sucesso' if execucao.codigo_saida == 0 else 'Erro'
+        except Exception as e:
+            execucao.linhas.append(f"Erro crítico ao tentar rodar script: {e}")
+            execucao.status = 'Erro'
+        finally:
+            execucao.fim = datetime.now()
+
+    @property
+    def atual(self):
+        """A execução mais recente (em andamento ou não), ou None."""
+        return self._atual
+
+    def em_andamento(self):
+        atual = self._atual
+        return atual is not None and atual.em_andamento
+
+    def historico(self):
+        """Execuções da mais recente para a mais antiga."""
+        with self._lock:
+            return list(self._historico)
@@ -0,0 +1,172 @@
+# log_reader.py (Leitura do fiscal_bi.log sem carregar o arquivo inteiro: tail, índice de execuções e busca)
+
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+# Linha que abre cada execução do orquestrador no log
+MARCA_EXECUCAO = b'### INICIANDO ORQUESTRADOR'
+
+# Formato do main.py: '%(asctime)s - %(levelname)s - %(message)s'
+PADRAO_LINHA = re.compile(r'^(?P<data_hora>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (?P<nivel>[A-Z]+) - (?P<mensagem>.*)$')
+# Linhas impressas pelos checkers chegam como '[nome_do_checker] texto'
+PADRAO_CHECKER = re.compile(r'^\[(?P<checker>[\w.]+)\] ')
+
+TAMANHO_BLOCO = 64 * 1024
+
+# {caminho: (identidade do arquivo, bytes já indexados, [(offset, data_hora)])}
+_indices = {}
+_lock_indices = threading.Lock()
+
+
+def arquivos_log(caminho):
+    """O log atual e os rotacionados (fiscal_bi.log.1, .2, ...), do mais antigo ao mais novo."""
+    caminho = Path(caminho)
+    rotacionados = sorted(
+        caminho.parent.glob(caminho.name + '.*'),
+        key=lambda p: int(p.suffix[1:]) if p.suffix[1:].isdigit() else 0,
+        reverse=True
+    )
+    return [p for p in rotacionados if p.suffix[1:].isdigit()] + ([caminho] if caminho.exists() else [])
+
+
+def ler_ultimas_linhas(caminho, n=100):
+    """
+    Devolve as últimas n linhas do arquivo lendo blocos de trás para frente a
+    partir do fim, então o custo depende de n e não do tamanho do log.
+    """
+    with open(caminho, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        posicao = f.tell()
+        blocos, quebras = [], 0
+        while posicao > 0 and quebras <= n:
+            tamanho = min(TAMANHO_BLOCO, posicao)
+            posicao -= tamanho
+            f.seek(posicao)
+            bloco = f.read(tamanho)
+            blocos.append(bloco)
+            quebras += bloco.count(b'\n')
+
+    linhas = b''.join(reversed(blocos)).decode('utf-8', errors='replace').splitlines()
+    return linhas[-n:] if n else []
+
+
+def _identidade(caminho):
+    """Muda quando o arquivo é rotacionado/recriado (e o índice precisa recomeçar)."""
+    info = os.stat(caminho)
+    return (info.st_ino, info.st_dev) if info.st_ino else (info.st_ctime,)
+
+
+def indexar_execucoes(caminho):
+    """
+    Devolve [(offset, data_hora)] do início de cada execução no arquivo.
+    O índice fica em memória e, nas chamadas seguintes, só os bytes novos
+    são lidos; se o arquivo foi rotacionado (outra identidade ou menor que o
+    trecho já indexado), ele é refeito.
+    """
+    caminho = str(caminho)
+    identidade, tamanho = _identidade(caminho), os.path.getsize(caminho)
+    with _lock_indices:
+        anterior = _indices.get(caminho)
+        if anterior and anterior[0] == identidade and anterior[1] <= tamanho:
+            _, lido, execucoes = anterior
+            execucoes = list(execucoes)
+        else:
+            lido, execucoes = 0, []
+
+        with open(caminho, 'rb') as f:
+            f.seek(lido)
+            offset = lido
+            for linha in f:
+                # Só linhas completas: uma linha sendo escrita é lida na próxima vez
+                if not linha.endswith(b'\n'):
+                    break
+                if MARCA_EXECUCAO in linha:
+                    execucoes.append((offset, linha[:23].decode('utf-8', errors='replace')))
+                offset += len(linha)
+
+        _indices[caminho] = (identidade, offset, execucoes)
+        return execucoes
+
+
+def ler_trecho(caminho, inicio, fim=None):
+    """Texto entre dois offsets (ex.: uma execução do índice); fim=None vai até o fim."""
+    with open(caminho, 'rb') as f:
+        f.seek(inicio)
+        dados = f.read() if fim is None else f.read(max(0, fim - inicio))
+    return dados.decode('utf-8', errors='replace')
+
+
+def ler_execucao(caminho, posicao=-1):
+    """
+    Texto de uma execução pelo índice (posicao=-1 é a última, -2 a anterior...).
+    Devolve (data_hora, texto) ou (None, '') se não houver execuções no arquivo.
+    """
+    execucoes = indexar_execucoes(caminho)
+    if not execucoes:
+        return None, ''
+    inicio, data_hora = execucoes[posicao]
+    seguinte = posicao + 1 if posicao >= 0 else len(execucoes) + posicao + 1
+    fim = execucoes[seguinte][0] if seguinte < len(execucoes) else None
+    return data_hora, ler_trecho(caminho, inicio, fim)
+
+
+def _checker_da_linha(mensagem):
+    prefixo = PADRAO_CHECKER.match(mensagem)
+    if prefixo:
+        return prefixo.group('checker')
+    # Eventos JSON (eventos.py) trazem o checker no próprio registro
+    if mensagem.startswith('{'):
+        try:
+            return json.loads(mensagem).get('checker')
+        except ValueError:
+            return None
+    return None
+
+
+def buscar(caminhos, nivel=None, script=None, ativo=None, limite=None):
+    """
+    Percorre os arquivos linha a linha (sem carregá-los) e gera os dicts
+    {arquivo, data_hora, nivel, checker, mensagem} das linhas que atendem
+    a todos os filtros informados:
+      nivel:  'INFO', 'WARNING', 'ERROR'... (exato, sem diferenciar maiúsculas)
+      script: nome do checker (ex.: 'check_powerbi')
+      ativo:  trecho do nome do ativo (busca simples no texto da mensagem)
+    Linhas de continuação (sem data, como tracebacks) herdam os campos da
+    linha anterior.
+    """
+    if isinstance(caminhos, (str, Path)):
+        caminhos = [caminhos]
+    nivel = nivel.upper() if nivel else None
+    ativo = ativo.lower() if ativo else None
+    encontrados = 0
+
+    for caminho in caminhos:
+        atual = {'data_hora': None, 'nivel': None, 'checker': None}
+        with open(caminho, 'r', encoding='utf-8', errors='replace') as f:
+            for texto in f:
+                texto = texto.rstrip('\n')
+                linha = PADRAO_LINHA.match(texto)
+                if linha:
+                    mensagem = linha.group('mensagem')
+                    atual = {
+                        'data_hora': linha.group('data_hora'),
+                        'nivel': linha.group('nivel'),
+                        'checker': _checker_da_linha(mensagem),
+                    }
+                else:
+                    mensagem = texto
+
+                if nivel and atual['nivel'] != nivel:
+                    continue
+                if script and atual['checker'] != script:
+                    continue
+                if ativo and ativo not in mensagem.lower():
+                    continue
+
+                yield {'arquivo': Path(caminho).name, **atual, 'mensagem': mensagem}
+                encontrados += 1
+                if limite and encontrados >= limite:
+                    return
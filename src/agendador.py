@@ -0,0 +1,153 @@
+# agendador.py (Próxima verificação de cada ativo a partir da tolerância e do último resultado)
+
+import threading
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from motor_checks import TABELA_ATUAL
+
+# Arquivo que pede ao agendador uma rodada completa imediata (main.py --executar-agora)
+ARQUIVO_GATILHO = Path(__file__).resolve().parent.parent / 'cache' / 'executar_agora'
+
+
+def _data_hora_log(data, hora):
+    """Junta data_atualizacao (DATE) e hora_atualizacao (TIME, que o conector devolve como timedelta)."""
+    if data is None:
+        return None
+    if isinstance(hora, timedelta):
+        return datetime.combine(data, time.min) + hora
+    return datetime.combine(data, hora or time.min)
+
+
+def carregar_historico(conn, tipos_ativo=None):
+    """
+    Último resultado de cada ativo em fat_fiscal_atual, no formato da agenda:
+    {(nome_workspace, nome_ativo, tipo_ativo): estado}. 'OK' vira 'Atualizada'
+    (a única situação OK da atualidade); 'Failed' fica como está.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT nome_workspace, nome_ativo, tipo_ativo, status_atualizacao,
+                   data_atualizacao, hora_atualizacao, data_verificacao
+            FROM `{TABELA_ATUAL}`
+            """
+        )
+        estados = {}
+        for ws, nome, tipo, status, data, hora, verificado_em in cursor.fetchall():
+            if tipos_ativo is not None and tipo not in tipos_ativo:
+                continue
+            estados[(ws, nome, tipo)] = {
+                'verificado_em': verificado_em,
+                'status': 'Atualizada' if status == 'OK' else status,
+                'data_atualizacao': _data_hora_log(data, hora),
+            }
+        return estados
+    finally:
+        cursor.close()
+
+
+class AgendaAtivos:
+    """
+    Último resultado de cada ativo (workspace, nome, tipo) e quando ele
+    precisa ser consultado de novo:
+      - 'Atualizada': só quando o ponto de corte puder passar da última
+        atualização vista (virada), limitado a intervalo_max sem consultar;
+      - qualquer outro status: a cada intervalo_falha.
+    O histórico inicial vem de fat_fiscal_atual; no modo agendador os
+    resultados de cada rodada são registrados em memória.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estados = {}
+        self.modo_agendador = False
+        self.historico_carregado = False
+        self.intervalo_falha = timedelta(minutes=15)
+        self.intervalo_max = timedelta(hours=24)
+
+    def configurar(self, reprobe_falha_min, intervalo_max_h):
+        self.intervalo_falha = timedelta(minutes=reprobe_falha_min)
+        self.intervalo_max = timedelta(hours=intervalo_max_h)
+
+    def ativar(self):
+        """Modo agendador: os resultados passam a ser registrados em memória."""
+        self.modo_agendador = True
+
+    def forcar_todos(self):
+        """Faz todos os ativos vencerem na próxima rodada ('executar agora')."""
+        with self._lock:
+            self._estados.clear()
+            self.historico_carregado = True
+
+    def carregar(self, estados):
+        """Acrescenta o histórico lido do banco (o que já está em memória é mais novo)."""
+        with self._lock:
+            for chave, estado in estados.items():
+                self._estados.setdefault(chave, estado)
+            self.historico_carregado = True
+
+    @staticmethod
+    def _chave(tabela):
+        return (tabela.get('workspace_log') or tabela['conn_key'], tabela['nome'], tabela.get('tipo'))
+
+    def estado(self, tabela):
+        """Último resultado conhecido do ativo (None se não houver)."""
+        with self._lock:
+            estado = self._estados.get(self._chave(tabela))
+        return dict(estado) if estado else None
+
+    def proximo_vencimento(self, item, virada):
+        """
+        Quando o ativo deve ser consultado de novo (None: sem histórico, vence já).
+        virada(item, data_atualizacao) devolve o momento em que o corte passa
+        da data informada (ver check_tables_timestamp.proximo_corte_apos).
+        """
+        with self._lock:
+            estado = self._estados.get(self._chave(item[0]))
+        if estado is None or estado['verificado_em'] is None:
+            return None
+        if estado['status'] != 'Atualizada' or estado['data_atualizacao'] is None:
+            return estado['verificado_em'] + self.intervalo_falha
+        return min(estado['verificado_em'] + self.intervalo_max, virada(item, estado['data_atualizacao']))
+
+    def selecionar(self, tabelas, virada, agora=None):
+        """Posições, em [(tabela, dias, hora)], dos ativos vencidos."""
+        agora = agora or datetime.now()
+        vencidas = []
+        for pos, item in enumerate(tabelas):
+            vencimento = self.proximo_vencimento(item, virada)
+            if vencimento is None or vencimento <= agora:
+                vencidas.append(pos)
+        return vencidas
+
+    def registrar(self, tabela, log, agora=None):
+        """Guarda o resultado de uma consulta (só no modo agendador)."""
+        if not self.modo_agendador or log is None:
+            return
+        with self._lock:
+            self._estados[self._chave(tabela)] = {
+                'verificado_em': agora or datetime.now(),
+                'status': log['status_atualizacao'],
+                'data_atualizacao': log.get('data_atualizacao'),
+            }
+
+
+# Agenda única do processo; o orquestrador em modo agendador a ativa
+agenda = AgendaAtivos()
+
+
+def pedir_execucao_agora():
+    """Cria o gatilho lido pelo agendador entre uma rodada e outra."""
+    ARQUIVO_GATILHO.parent.mkdir(exist_ok=True)
+    ARQUIVO_GATILHO.touch()
+
+
+def consumir_gatilho():
+    """True (e remove o arquivo) se uma execução imediata foi pedida."""
+    try:
+        ARQUIVO_GATILHO.unlink()
+        return True
+    except FileNotFoundError:
+        return False
@@ -0,0 +1,16 @@
+# check_linhagem.py (Sincronia de toda a linhagem Bronze → Silver → Gold → Power BI; lógica em check_sincronia.py)
+
+from check_sincronia import tipo_sync
+from motor_checks import executar_check
+
+TIPO = tipo_sync()
+
+def main():
+    """
+    Função principal que verifica a sincronia de Silver e Gold num único passo
+    pela linhagem, apontando a tabela a montante que explica cada atraso.
+    """
+    executar_check(TIPO)
+
+if __name__ == "__main__":
+    main()
@@ -1,141 +1,255 @@
 # check_powerbi.py (com cálculo de dias sem atualizar e Fuso Horário de Brasília)
 
 import json
-import msal
+import os
 import requests
 import pandas as pd
 import sys
-from datetime import datetime, timezone 
+from datetime import datetime, timedelta, timezone 
 import pytz
 from pathlib import Path
 
 # Importa as funções do nosso módulo de banco de dados
-from database import get_db_connection, insert_dataframe
+from database import carregar_config, conexao, get_execution_settings
+from historico_refresh import carregar_ancoras, gravar_refreshes, linhas_refreshes
+from motor_checks import STATUS_OK_PADRAO, TipoCheck, executar_check
+from token_powerbi import obter_provedor
+from powerbi_api import API_BASE_PADRAO, criar_sessao, listar_paginado, listar_datasets_workspaces, coletar_refreshes
 
-# Pega a pasta src, sobe um nivel, entra em config e pega o arquivo
+# Pasta src (onde este script está)
 src_dir = Path(__file__).resolve().parent
-config_path = src_dir.parent / 'config' / 'config.json'
+
+# Inventário workspace→datasets salvo entre execuções (ver obter_datasets)
+CACHE_DESCOBERTA = src_dir.parent / 'cache' / 'powerbi_datasets.json'
 
 # --- 1. CARREGAR CONFIGURAÇÕES ---
-try:
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = json.load(f)
-        pbi_config = config['powerbi_api']
-except FileNotFoundError:
-    print("ERRO CRÍTICO: Arquivo 'config.json' não encontrado.")
-    sys.exit(1)
-except KeyError:
-    print("ERRO CRÍTICO: A chave 'powerbi_api' não foi encontrada no 'config.json'.")
-    sys.exit(1)
+def carregar_config_pbi():
+    """
+    Lê a seção 'powerbi_api' do config.json (cache compartilhado em database.py).
+    Feito sob demanda (e não na importação) para que o orquestrador possa
+    importar este módulo sem derrubar o processo caso o arquivo falte.
+    """
+    try:
+        return carregar_config()['powerbi_api']
+    except FileNotFoundError:
+        print("ERRO CRÍTICO: Arquivo 'config.json' não encontrado.")
+        sys.exit(1)
+    except KeyError:
+        print("ERRO CRÍTICO: A chave 'powerbi_api' não foi encontrada no 'config.json'.")
+        sys.exit(1)
 
 
 # --- 2. FUNÇÕES AUXILIARES ---
 
 def obter_token_acesso():
-    """Obtém um token de acesso para a API do Power BI."""
-    authority = f"https://login.microsoftonline.com/{pbi_config['tenant_id']}"
-    scope = ["https://analysis.windows.net/powerbi/api/.default"]
-    app = msal.ConfidentialClientApplication(
-        pbi_config['client_id'], authority=authority, client_credential=pbi_config['client_secret']
-    )
-    result = app.acquire_token_for_client(scopes=scope)
-    if "access_token" in result:
-        return result['access_token']
-    else:
-        raise Exception(f"Erro de autenticação no Power BI: {result.get('error_description')}")
-
-def descobrir_datasets(headers):
-    """Varre os workspaces e descobre todos os datasets acessíveis."""
-    # (Esta função permanece exatamente a mesma)
+    """
+    Obtém um token de acesso para a API do Power BI.
+    O token é reaproveitado (em memória e no cache MSAL em disco) até
+    pouco antes de expirar; ver token_powerbi.ProvedorToken.
+    """
+    return obter_provedor(carregar_config_pbi()).obter_token()
+
+def ler_cache_descoberta():
+    """Lê o inventário workspace→datasets salvo em disco (None se não existir ou estiver corrompido)."""
+    try:
+        with open(CACHE_DESCOBERTA, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"AVISO: Cache de descoberta ilegível, será refeito. Detalhe: {e}")
+        return None
+
+def gravar_cache_descoberta(inventario):
+    """Grava o inventário em disco de forma atômica (arquivo temporário + rename)."""
+    CACHE_DESCOBERTA.parent.mkdir(exist_ok=True)
+    tmp = CACHE_DESCOBERTA.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(inventario, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, CACHE_DESCOBERTA)
+
+def invalidar_cache_descoberta(motivo):
+    """Marca o cache como vencido: a próxima execução refaz a descoberta."""
+    inventario = ler_cache_descoberta()
+    if inventario is None:
+        return
+    inventario['invalidado'] = motivo
+    gravar_cache_descoberta(inventario)
+    print(f"INFO: Cache de descoberta invalidado ({motivo}).")
+
+def cache_valido(inventario, ttl_horas):
+    """O cache vale enquanto não passou do TTL e não foi invalidado (ex.: por um 404)."""
+    if not inventario or inventario.get('invalidado'):
+        return False
+    try:
+        gerado_em = datetime.fromisoformat(inventario['gerado_em'])
+    except (KeyError, ValueError):
+        return False
+    return datetime.now() - gerado_em < timedelta(hours=ttl_horas)
+
+def datasets_do_inventario(inventario):
+    """Achata o inventário no formato de lista usado pela coleta."""
+    return [
+        {'nome_bi': ds['nome'], 'workspace_name': ws['nome'],
+         'workspace_id': ws_id, 'dataset_id': ds['id']}
+        for ws_id, ws in inventario.get('workspaces', {}).items()
+        for ds in ws.get('datasets', [])
+    ]
+
+def descobrir_datasets(headers, session=None, api_base=API_BASE_PADRAO, inventario_anterior=None,
+                       max_concorrencia=8, **kwargs_http):
+    """
+    Varre os workspaces e descobre todos os datasets acessíveis.
+    As listagens de datasets dos workspaces rodam em paralelo. Com um
+    inventário anterior, cada workspace é pedido com If-None-Match (ETag)
+    e, se não mudou (304), os datasets já conhecidos são reaproveitados.
+    Retorna o novo inventário, ou None em caso de falha.
+    """
     print("INFO: Descobrindo datasets em todos os workspaces...")
-    datasets_encontrados = []
+    session = session or criar_sessao()
+    anteriores = (inventario_anterior or {}).get('workspaces', {})
+    agora = datetime.now().isoformat(timespec='seconds')
     
     try:
-        workspaces_url = "https://api.powerbi.com/v1.0/myorg/groups"
-        all_workspaces = []
-        
-        while workspaces_url:
-            response = requests.get(workspaces_url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            all_workspaces.extend(data.get('value', []))
-            workspaces_url = data.get('@odata.nextLink')
+        all_workspaces = listar_paginado(session, f"{api_base}/groups", headers, **kwargs_http)
 
         print(f"INFO: Encontrados {len(all_workspaces)} workspaces.")
 
+        listagens = listar_datasets_workspaces(
+            session, all_workspaces, headers,
+            etags={ws_id: ws.get('etag') for ws_id, ws in anteriores.items()},
+            max_concorrencia=max_concorrencia, api_base=api_base, **kwargs_http
+        )
+
+        workspaces = {}
         for ws in all_workspaces:
-            workspace_id = ws['id']
-            workspace_name = ws['name']
-            datasets_url = f"https://api.powerbi.com/v1.0/myorg/groups/{workspace_id}/datasets"
-            
-            while datasets_url:
-                response = requests.get(datasets_url, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                datasets_no_workspace = data.get('value', [])
-                
-                for ds in datasets_no_workspace:
-                    datasets_encontrados.append({
-                        'nome_bi': ds['name'], 'workspace_name': workspace_name,
-                        'workspace_id': workspace_id, 'dataset_id': ds['id']
-                    })
-                
-                datasets_url = data.get('@odata.nextLink')
-
-        print(f"INFO: Descoberta finalizada. Total de {len(datasets_encontrados)} datasets encontrados.")
-        return datasets_encontrados
+            datasets, etag = listagens[ws['id']]
+            if datasets is None:
+                # 304: o workspace não mudou desde a última descoberta
+                datasets_ws = [dict(ds, visto_em=agora) for ds in anteriores[ws['id']]['datasets']]
+            else:
+                datasets_ws = [{'id': ds['id'], 'nome': ds['name'], 'visto_em': agora} for ds in datasets]
+            workspaces[ws['id']] = {'nome': ws['name'], 'etag': etag, 'datasets': datasets_ws}
+
+        inventario = {'gerado_em': agora, 'workspaces': workspaces}
+        total = sum(len(ws['datasets']) for ws in workspaces.values())
+        print(f"INFO: Descoberta finalizada. Total de {total} datasets encontrados.")
+        return inventario
 
     except requests.exceptions.RequestException as e:
         if e.response is not None:
              print(f"ERRO: Falha ao descobrir datasets. Detalhe: {e}. Resposta da API: {e.response.text}")
         else:
              print(f"ERRO: Falha ao descobrir datasets. Detalhe: {e}")
+        return None
+
+def obter_datasets(headers, session, api_base, settings, **kwargs_http):
+    """
+    Devolve a lista de datasets a monitorar. Usa o cache em disco enquanto
+    ele for válido (TTL 'pbi_cache_ttl_horas'); caso contrário refaz a
+    descoberta e atualiza o cache. Se a descoberta falhar, usa o cache
+    vencido como último recurso.
+    """
+    cache = ler_cache_descoberta()
+    if cache_valido(cache, settings['pbi_cache_ttl_horas']):
+        datasets = datasets_do_inventario(cache)
+        print(f"INFO: Usando cache de descoberta de {cache['gerado_em']} ({len(datasets)} datasets).")
+        return datasets
+
+    inventario = descobrir_datasets(
+        headers, session, api_base, inventario_anterior=cache,
+        max_concorrencia=settings['pbi_max_concorrencia'], **kwargs_http
+    )
+    if inventario is None:
+        if cache:
+            print("AVISO: Descoberta falhou. Usando o cache vencido.")
+            return datasets_do_inventario(cache)
         return []
 
-def main():
-    """Função principal: descobre, puxa os dados, formata e insere no banco."""
-    # ... (código de autenticação, descoberta e coleta de dados) ...
+    try:
+        gravar_cache_descoberta(inventario)
+    except Exception as e:
+        print(f"AVISO: Não foi possível gravar o cache de descoberta: {e}")
+    return datasets_do_inventario(inventario)
+
+def carregar_ancoras_seguro():
+    """Lê o último refresh gravado de cada dataset (None se o banco falhar: o histórico fica fora desta execução)."""
+    try:
+        with conexao('dbDrogamais') as conn:
+            return carregar_ancoras(conn) if conn else None
+    except Exception as e:
+        print(f"AVISO: Não foi possível ler o histórico de refreshes. Ele não será gravado nesta execução. Detalhe: {e}")
+        return None
+
+def gravar_refreshes_seguro(linhas):
+    try:
+        with conexao('dbDrogamais') as conn:
+            if conn:
+                gravar_refreshes(conn, linhas)
+    except Exception as e:
+        print(f"AVISO: Não foi possível gravar o histórico de refreshes. Detalhe: {e}")
+
+def coletar_logs():
+    """Descobre os datasets, puxa o último refresh de cada um e devolve os logs."""
     try:
         access_token = obter_token_acesso()
         print("INFO: Token de acesso obtido com sucesso.")
     except Exception as e:
         print(e)
-        return
+        return []
 
-    headers = {'Authorization': f'Bearer {access_token}'}
-    datasets_para_monitorar = descobrir_datasets(headers)
-    
-    if not datasets_para_monitorar:
-        print("Nenhum dataset encontrado para monitorar. Encerrando.")
-        return
+    settings = get_execution_settings()
+    api_base = carregar_config_pbi().get('base_url', API_BASE_PADRAO)
+    kwargs_http = {'timeout': settings['pbi_timeout_s'], 'max_tentativas': settings['pbi_max_tentativas']}
 
-    todos_os_dados = []
-    print("-" * 50)
-    # ... (A parte de coleta de dados permanece a mesma) ...
-    for dataset in datasets_para_monitorar:
-        nome_bi = dataset['nome_bi']
-        print(f"INFO: Puxando historico para o BI: '{nome_bi}' no workspace '{dataset['workspace_name']}'...")
-        url = f"https://api.powerbi.com/v1.0/myorg/groups/{dataset['workspace_id']}/datasets/{dataset['dataset_id']}/refreshes?$top=1"
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            historico = response.json().get('value', [])
-            if not historico:
-                dados_bi = {'workspace_name': dataset['workspace_name'], 'nome_bi': nome_bi,'status': 'Sem Histórico', 'endTime': None, 'refreshType': 'N/A'}
-                todos_os_dados.append(dados_bi)
-            else:
-                for registro in historico:
-                    registro['nome_bi'] = nome_bi
-                    registro['workspace_name'] = dataset['workspace_name']
-                todos_os_dados.extend(historico)
-        except requests.exceptions.RequestException as e:
-            dados_erro = {'workspace_name': dataset['workspace_name'], 'nome_bi': nome_bi,'status': f'Erro na API: {e.response.status_code if e.response else "N/A"}','endTime': None, 'refreshType': 'Erro'}
-            todos_os_dados.append(dados_erro)
+    # Uma única sessão (keep-alive) para a descoberta e para todas as consultas,
+    # fechada mesmo se a coleta falhar no meio
+    with criar_sessao(settings['pbi_max_concorrencia']) as session:
+        headers = {'Authorization': f'Bearer {access_token}'}
+        datasets_para_monitorar = obter_datasets(headers, session, api_base, settings, **kwargs_http)
+
+        if not datasets_para_monitorar:
+            print("Nenhum dataset encontrado para monitorar. Encerrando.")
+            return []
+
+        # Histórico incremental: a consulta do último refresh traz uma janela
+        # pequena e só os refreshes acima do último gravado são guardados
+        ancoras = carregar_ancoras_seguro() if settings['pbi_historico_refresh'] else None
+        kwargs_historico = {}
+        if ancoras is not None:
+            kwargs_historico = {'ancoras': ancoras, 'janela': settings['pbi_refresh_janela'],
+                                'janela_lacuna': settings['pbi_refresh_janela_lacuna']}
+
+        todos_os_dados = []
+        linhas_historico = []
+        print("-" * 50)
+        print(f"INFO: Puxando historico de {len(datasets_para_monitorar)} BIs "
+              f"({settings['pbi_max_concorrencia']} consultas simultâneas)...")
+
+        # Os registros chegam conforme cada consulta termina
+        for registro in coletar_refreshes(
+            session, datasets_para_monitorar, headers,
+            max_concorrencia=settings['pbi_max_concorrencia'], api_base=api_base, **kwargs_historico, **kwargs_http
+        ):
+            refreshes = registro.pop('refreshes', None)
+            if refreshes:
+                linhas_historico += linhas_refreshes(registro, refreshes)
+            if registro.get('refreshType') == 'Erro':
+                print(f"ERRO: '{registro['nome_bi']}' ({registro['workspace_name']}): {registro['status']}")
+            todos_os_dados.append(registro)
+
+    if linhas_historico:
+        gravar_refreshes_seguro(linhas_historico)
+
+    # Um dataset do cache que não existe mais força nova descoberta na próxima execução
+    removidos = [r['nome_bi'] for r in todos_os_dados if r.get('http_status') == 404]
+    if removidos:
+        invalidar_cache_descoberta(f"404 em {len(removidos)} dataset(s): {', '.join(removidos[:5])}")
     print("-" * 50)
 
     if not todos_os_dados:
         print("Nenhum dado foi coletado para os BIs descobertos.")
-        return
+        return []
 
     # --- Processamento com Pandas ---
     df = pd.DataFrame(todos_os_dados)
@@ -179,75 +293,21 @@ def main():
         'refreshType': 'tipo_atualizacao'
     }
     
-    # Remove as colunas temporárias e originais que não serão usadas (endTime, endTime_local)
-    df_para_inserir = df.drop(columns=['endTime', 'endTime_local']).rename(columns=mapa_de_colunas_para_sql)
+    # Remove as colunas temporárias e originais que não serão usadas (endTime, endTime_local);
+    # a separação de data/hora e o status OK/Failed ficam com motor_checks
+    return df.drop(columns=['endTime', 'endTime_local']).rename(columns=mapa_de_colunas_para_sql)
 
-    # --- NOVO PROCESSAMENTO: Separação de Data e Hora ---
-    
-    # 1. Cria a coluna de hora (Time)
-    # Aplica uma função para formatar como HH:MM:SS ou retorna None se for nulo/NaT
-    df_para_inserir['hora_atualizacao'] = df_para_inserir['data_atualizacao'].apply(
-        lambda x: x.strftime('%H:%M:%S') if pd.notna(x) else None
-    )
-    
-    # 2. Formata a coluna original (Date)
-    # Aplica uma função para formatar como YYYY-MM-DD ou retorna None se for nulo/NaT
-    df_para_inserir['data_atualizacao'] = df_para_inserir['data_atualizacao'].apply(
-        lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else None
-    )
-    
-    # 3. Trata nulos restantes para garantir que a inserção SQL seja segura
-    for col in ['data_atualizacao', 'hora_atualizacao']:
-        df_para_inserir[col] = df_para_inserir[col].fillna(pd.NA).replace({pd.NaT: None})
-    # --- FIM NOVO PROCESSAMENTO ---
-
-    # --- SIMPLIFICAÇÃO DO STATUS PARA 'OK' ou 'Failed' ---
-    status_map_simplified = {
-        'Completed': 'OK',
-        'Atualizada': 'OK',
-        'Sincronizado': 'OK',
-        'Sincronizada': 'OK',
-        'Sem Histórico': 'OK'
-    }
-    # Aplica o mapeamento e define qualquer outro valor como 'Failed'
-    df_para_inserir['status_atualizacao'] = df_para_inserir['status_atualizacao'].apply(
-        lambda x: status_map_simplified.get(x, 'Failed')
-    )
-    # ---------------------------------------------------
+# 'Sem Histórico' conta como OK para datasets (nunca atualizados não são falha)
+TIPO = TipoCheck(
+    nome='powerbi',
+    titulo='VERIFICACAO DE ATUALIZACAO DOS POWER BIs',
+    coletar=coletar_logs,
+    status_ok=STATUS_OK_PADRAO + ('Sem Histórico',)
+)
 
-    colunas_finais = [
-        'nome_workspace', 'nome_ativo', 'tipo_ativo', 
-        'status_atualizacao', 'data_atualizacao', 'hora_atualizacao', 
-        'tipo_atualizacao', 
-        'dias_sem_atualizar' 
-    ]
-    df_para_inserir = df_para_inserir[colunas_finais]
-
-    print("--- Visualizando as Últimas Atualizações (Todos os BIs Descobertos) ---")
-    print(df_para_inserir.to_string())
-
-    # ///// ----- ETAPA DE INSERÇÃO NO BANCO DE DADOS ----- \\\\\
-    print("\n" + "="*50)
-    print("--- INICIANDO PROCESSO DE GRAVAÇÃO NO BANCO DE DADOS ---")
-    print("="*50)
-    
-    conn = None
-    try:
-        # Usa 'databaseDrogamais' explicitamente para o log
-        conn = get_db_connection(config_key='dbDrogamais')
-        if conn is None:
-            sys.exit(1)
-        
-        tabela_destino = "fat_fiscal"
-        sucesso = insert_dataframe(conn, df_para_inserir, tabela_destino)
-        
-        if not sucesso:
-            print("ERRO: O processo de inserção no banco de dados falhou.")
-    
-    finally:
-        if conn:
-            conn.close()
-            print("\nINFO: Processo finalizado. Conexao com o banco de dados fechada.")
+def main():
+    """Função principal: descobre, puxa os dados, formata e insere no banco."""
+    executar_check(TIPO)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
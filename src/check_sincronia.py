@@ -0,0 +1,240 @@
+# check_sincronia.py (Sincronia ao longo da linhagem Bronze → Silver → Gold: usado por check_tables_silver/gold/linhagem)
+
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from check_tables_timestamp import calcular_data_limite, load_config_from_db, parse_hora_tolerancia
+from database import get_execution_settings
+from eventos import emitir
+from linhagem import montar_grafo
+from motor_checks import TipoCheck, cache_probes
+from probes import consultar_max_lote, dividir_em_lotes, executar_probes
+
+# camada -> (tipo_ativo, rótulo)
+CAMADAS = {
+    'silver': ('TABELA SILVER', 'Silver'),
+    'gold': ('TABELA GOLD', 'Gold'),
+}
+
+def load_table_config():
+    # Sobe da pasta src para a raiz e entra na pasta config
+    config_file = Path(__file__).resolve().parent.parent / 'config' / 'config_tables.json'
+
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Erro ao carregar config: {e}")
+        return None
+
+def carregar_tolerancias():
+    """{(conn_key, nome): (dias_tolerancia, hora_tolerancia)} das tabelas ativas em dim_tabelas_fiscal."""
+    config = load_config_from_db() or {}
+    return {
+        (t['conn_key'], t['nome']): (t.get('dias_tolerancia') or 0, t.get('hora_tolerancia') or '00:00')
+        for t in config.get('freshness_checks', [])
+    }
+
+def consultar_maximos(grafo, settings):
+    """
+    MAX() de cada tabela do grafo, uma única vez: agrupado por conn_key em
+    lotes UNION ALL (probes.consultar_max_lote) e passando pelo cache da
+    execução, compartilhado com a atualidade e com os outros checkers de
+    sincronia. Devolve {chave do nó: valor bruto ou exceção}.
+    """
+    por_conn_key = {}
+    for no in grafo.tabelas():
+        por_conn_key.setdefault(no.conn_key, []).append(no)
+
+    tarefas = []
+    for conn_key, nos in por_conn_key.items():
+        for lote in dividir_em_lotes(nos, settings['tamanho_lote']):
+            def _probe(conn_data, conn_key=conn_key, lote=lote):
+                if conn_data is None:
+                    print(f"ERRO: Não foi possível conectar ao banco '{conn_key}'. Pulando {len(lote)} tabelas.")
+                    erro = ConnectionError(f"Sem conexão com '{conn_key}'")
+                    return [(no.chave, erro) for no in lote]
+                valores = cache_probes.obter_varios(
+                    [(conn_key, no.nome, no.coluna) for no in lote],
+                    lambda chaves: consultar_max_lote(
+                        conn_data, [(nome, coluna) for _, nome, coluna in chaves], settings['timeout_query_s']
+                    )
+                )
+                return [(no.chave, valor) for no, valor in zip(lote, valores)]
+
+            tarefas.append((conn_key, _probe))
+
+    resultados = executar_probes(
+        tarefas,
+        max_workers=settings['max_workers'],
+        conexoes_por_conn_key=settings['conexoes_por_conn_key']
+    )
+    return {chave: valor for lista in resultados if lista for chave, valor in lista}
+
+def _situacao_raiz(no, data, tolerancia, agora):
+    """Atualidade de uma tabela sem origem (Bronze) pela mesma regra de check_tables_timestamp."""
+    if tolerancia is None:
+        return None
+    dias, hora = tolerancia
+    time_part = parse_hora_tolerancia(hora, no.nome)
+    data = data.to_pydatetime()
+    # Colunas só com data valem a partir da hora de tolerância
+    if data.time() == datetime.min.time():
+        data = datetime.combine(data.date(), time_part)
+    return 'Atualizada' if data >= calcular_data_limite(agora, dias, time_part) else 'Desatualizada'
+
+def avaliar_linhagem(grafo, valores, tolerancias=None, agora=None):
+    """
+    Percorre o grafo em ordem topológica, com o MAX() de cada tabela já
+    calculado em valores, e devolve {chave: resultado} com as chaves
+    'status', 'data', 'dias' e 'causa':
+      - tabela sem origem (Bronze): 'Atualizada'/'Desatualizada' pela
+        tolerância (None se ela não estiver em tolerancias);
+      - tabela derivada: 'Sincronizado' se a data >= a mais recente de
+        toda a cadeia acima dela, senão 'Dessincronizado' (dias = diferença
+        em dias);
+      - 'Sem Histórico' (tabela ou origem vazia) e 'Erro na Verificação';
+      - dataset do Power BI: status None, só recebe a causa.
+    causa é a chave do nó mais a montante que explica o problema: o próprio
+    nó, se é ele que está atrasado/vazio/com erro, ou a causa herdada de uma
+    origem (ex.: Gold igual a uma Silver que está atrás da Bronze: as duas
+    ficam 'Dessincronizado' e a causa da Gold é a Silver).
+    None quando toda a cadeia está em dia.
+    """
+    tolerancias = tolerancias or {}
+    agora = agora or datetime.now()
+    resultados = {}
+
+    for chave in grafo.ordem_topologica():
+        no = grafo.nos[chave]
+        origens = [resultados[o] for o in no.origens]
+        herdada = next((r['causa'] for r in origens if r['causa'] is not None), None)
+        resultado = resultados[chave] = {'status': None, 'data': None, 'dias': None, 'causa': herdada}
+        if not no.tabela:
+            continue
+
+        valor = valores.get(chave)
+        if isinstance(valor, Exception):
+            resultado.update(status='Erro na Verificação', erro=str(valor), causa=chave)
+            continue
+
+        data = pd.to_datetime(valor)
+        if pd.isna(data):
+            resultado.update(status='Sem Histórico', causa=chave)
+            continue
+        resultado['data'] = data
+
+        if not origens:
+            resultado['referencia'] = data
+            resultado['status'] = _situacao_raiz(no, data, tolerancias.get(chave), agora)
+            if resultado['status'] == 'Desatualizada':
+                resultado['causa'] = chave
+            continue
+
+        referencias = [r['referencia'] for r in origens if r.get('referencia') is not None]
+        if len(referencias) < len(origens):
+            # Uma origem sem data (vazia ou com erro) já é a causa herdada
+            resultado['status'] = 'Sem Histórico'
+            continue
+
+        # Compara com a data mais recente de toda a cadeia acima (não só das
+        # origens diretas): uma Gold igual a uma Silver atrasada também está atrasada
+        referencia = max(referencias)
+        resultado['referencia'] = max(referencia, data)
+        resultado['dias'] = (data.date() - referencia.date()).days
+        if resultado['dias'] < 0:
+            # A causa é a origem atrasada com que ela está em dia; se ela está
+            # atrás até das próprias origens, a causa é ela mesma
+            atrasadas = [r['causa'] for r in origens
+                         if r['status'] == 'Dessincronizado' and data.date() >= r['data'].date()]
+            resultado.update(status='Dessincronizado', causa=atrasadas[0] if atrasadas else chave)
+        else:
+            resultado['status'] = 'Sincronizado'
+
+    return resultados
+
+def _log(no, resultado):
+    return {
+        'nome_workspace': no.workspace_log,
+        'nome_ativo': no.nome,
+        'tipo_ativo': CAMADAS[no.camada][0],
+        'status_atualizacao': resultado['status'],
+        'data_atualizacao': resultado['data'],
+        'tipo_atualizacao': 'Sync Check',
+        'dias_sem_atualizar': resultado['dias']
+    }
+
+def _explicar(grafo, chave, resultado, resultados):
+    """Imprime (e emite como evento) o nó a montante que explica o problema."""
+    causa = resultado['causa']
+    if causa is None or causa == chave:
+        return
+    no_causa = grafo.nos[causa]
+    status_causa = resultados[causa]['status']
+    print(f"     CAUSA: '{no_causa.nome}' ({no_causa.camada}) está {status_causa}.")
+    emitir('linhagem_causa', ativo=grafo.nos[chave].nome, camada=grafo.nos[chave].camada,
+           causa=no_causa.nome, camada_causa=no_causa.camada, status_causa=status_causa)
+
+def coletar_sync(camadas):
+    """
+    Monta o grafo de linhagem, calcula o MAX() de cada tabela uma vez, avalia
+    a cadeia inteira num único passo e devolve os logs das camadas pedidas.
+    """
+    config = load_table_config()
+    if not config:
+        sys.exit(1)
+
+    try:
+        grafo = montar_grafo(config)
+        ordem = grafo.ordem_topologica()
+    except (KeyError, ValueError) as e:
+        print(f"ERRO: Linhagem inválida no config_tables.json: {e}")
+        sys.exit(1)
+
+    if not any(grafo.nos[chave].camada in camadas for chave in ordem):
+        print(f"AVISO: Nenhum par de sincronia ativo para {', '.join(CAMADAS[c][1] for c in camadas)}. Encerrando.")
+        return []
+
+    settings = get_execution_settings()
+    valores = consultar_maximos(grafo, settings)
+    resultados = avaliar_linhagem(grafo, valores, carregar_tolerancias())
+
+    logs = []
+    for chave in ordem:
+        no = grafo.nos[chave]
+        resultado = resultados[chave]
+        if no.camada in camadas:
+            origens = ', '.join(grafo.nos[o].nome for o in no.origens)
+            print(f"---> Verificando sincronia ({no.workspace_log}): {no.nome} ({CAMADAS[no.camada][1]}) vs {origens}...")
+            if isinstance(valores.get(chave), ConnectionError):
+                # Sem conexão o par fica sem log, como nos demais checkers
+                continue
+            if resultado.get('erro'):
+                print(f"   ERRO INESPERADO ao checar '{no.nome}': {resultado['erro']}")
+            else:
+                data = resultado['data'].date() if resultado['data'] is not None else 'N/A'
+                print(f"   {resultado['status']}: {data} ({resultado['dias']} dias em relação à origem)")
+            _explicar(grafo, chave, resultado, resultados)
+            logs.append(_log(no, resultado))
+        elif no.camada == 'powerbi' and resultado['causa'] is not None and set(camadas) == set(CAMADAS):
+            print(f"---> Dataset '{no.nome}' depende de dados com problema.")
+            _explicar(grafo, chave, resultado, resultados)
+    return logs
+
+def tipo_sync(camada=None):
+    """
+    TipoCheck de sincronia da camada informada ('silver' ou 'gold') ou, com
+    camada=None, de toda a linhagem de uma vez (incluindo o impacto nos
+    datasets do Power BI).
+    """
+    camadas = (camada,) if camada else tuple(CAMADAS)
+    rotulo = CAMADAS[camada][1] if camada else 'Linhagem'
+    return TipoCheck(
+        nome=f"sincronia {rotulo}",
+        titulo=f"VERIFICACAO DE SINCRONIA 'BRONZE/{rotulo.upper()}'" if camada else "VERIFICACAO DE SINCRONIA DA LINHAGEM",
+        coletar=lambda: coletar_sync(camadas)
+    )
@@ -8,7 +8,12 @@ import sys
 from pathlib import Path
 
 # Importa as funções do seu arquivo database.py
-from database import get_db_connection, insert_dataframe
+from agendador import agenda, carregar_historico
+from database import get_db_connection, get_execution_settings, conexao
+from motor_checks import TipoCheck, cache_probes, executar_check
+from plano_probes import obter_planos
+from watermarks import carregar_watermarks, gravar_watermarks, watermark_utilizavel
+from probes import consultar_max, consultar_max_estrategia, consultar_max_lote, dividir_em_lotes, executar_probes
 
 def load_config_from_db():
     try:
@@ -52,24 +57,21 @@ def load_config_from_db():
         print(f"Erro ao carregar configurações do banco: {e}")
         return None
 
-def check_table_status(conn, table_name, asset_type, date_column, workspace_log, update_tolerance_days, time_tolerance):
-    """
-    Verifica a data/hora da última inserção com base na tolerância de DIAS E HORA.
-    Calcula dias_sem_atualizar E horas_sem_atualizar.
-    """
-    
-    # 1. Obter o momento da checagem
-    now = datetime.now() 
-    
-    # 2. Processa a hora de tolerância (HH:MM)
+def parse_hora_tolerancia(time_tolerance, table_name=None):
+    """Converte 'HH:MM' em time. Valores inválidos ou vazios viram 00:00:00."""
     time_part = datetime.min.time() 
     if time_tolerance and isinstance(time_tolerance, str):
         try:
             time_part = datetime.strptime(time_tolerance, '%H:%M').time()
         except ValueError:
             print(f"AVISO: 'hora_tolerancia' inválida ('{time_tolerance}') para '{table_name}'. Usando padrão 00:00:00.")
-            
-    # 3. Determina o PONTO DE CORTE REQUERIDO (data_limite)
+    return time_part
+
+def calcular_data_limite(now, update_tolerance_days, time_part):
+    """
+    Determina o PONTO DE CORTE REQUERIDO: a última atualização da tabela
+    deve ser >= este valor para ela ser considerada 'Atualizada'.
+    """
     expected_cutoff_date = now.date() - timedelta(days=update_tolerance_days)
     
     # PONTO DE CORTE INICIAL
@@ -78,6 +80,52 @@ def check_table_status(conn, table_name, asset_type, date_column, workspace_log,
     # --- LÓGICA DE AJUSTE DE CORTE ---
     if update_tolerance_days == 0 and now.time() < time_part:
         data_limite = data_limite - timedelta(days=1)
+    return data_limite
+
+def proximo_corte_apos(data_ref, update_tolerance_days, time_part):
+    """
+    Primeiro momento em que calcular_data_limite passa de data_ref: até lá,
+    uma tabela cuja última atualização é data_ref continua 'Atualizada'.
+    O corte anda em degraus diários: à meia-noite (D-N) ou na hora de
+    tolerância (D-0).
+    """
+    # Menor valor de corte maior que data_ref
+    corte = datetime.combine(data_ref.date(), time_part)
+    if corte <= data_ref:
+        corte += timedelta(days=1)
+
+    if update_tolerance_days == 0:
+        return corte
+    return datetime.combine(corte.date() + timedelta(days=update_tolerance_days), datetime.min.time())
+
+def check_table_status(conn, table_name, asset_type, date_column, workspace_log, update_tolerance_days, time_tolerance, timeout_query=None):
+    """
+    Verifica a data/hora da última inserção com base na tolerância de DIAS E HORA.
+    Calcula dias_sem_atualizar E horas_sem_atualizar.
+    timeout_query (segundos) aborta a consulta de MAX no próprio banco.
+    """
+    return avaliar_table_status(
+        table_name, asset_type, date_column, workspace_log,
+        update_tolerance_days, time_tolerance,
+        obter_max=lambda: consultar_max(conn, table_name, date_column, timeout_query)
+    )
+
+def avaliar_table_status(table_name, asset_type, date_column, workspace_log, update_tolerance_days, time_tolerance, obter_max):
+    """
+    Aplica a regra de tolerância sobre o MAX() da tabela.
+    obter_max() devolve o valor bruto do banco (ou levanta a exceção da
+    consulta), permitindo que o valor venha de uma consulta individual
+    ou de um lote (ver probes.consultar_max_lote).
+    """
+    
+    # 1. Obter o momento da checagem
+    now = datetime.now() 
+    
+    # 2. Processa a hora de tolerância (HH:MM)
+    time_part = parse_hora_tolerancia(time_tolerance, table_name)
+            
+    # 3. Determina o PONTO DE CORTE REQUERIDO (data_limite)
+    data_limite = calcular_data_limite(now, update_tolerance_days, time_part)
 
     print(f"---> Verificando a tabela ({workspace_log}): '{table_name}' (usando coluna '{date_column}')...")
     print(f"     PONTO DE CORTE REQUERIDO: {data_limite.strftime('%Y-%m-%d %H:%M:%S')} (Ultima atualizacao deve ser >= este valor)")
@@ -88,16 +136,8 @@ def check_table_status(conn, table_name, asset_type, date_column, workspace_log,
     horas_sem_atualizar = None 
 
     try:
-        query = f"SELECT MAX(`{date_column}`) FROM `{table_name}`"
-        
-        # --- CORREÇÃO: Usar cursor para buscar a data máxima (Remove pd.read_sql) ---
-        cursor = conn.cursor()
-        cursor.execute(query)
-        result = cursor.fetchone()
-        cursor.close()
-        
-        # Trata o resultado (pode ser None se a tabela estiver vazia)
-        val_db = result[0] if result else None
+        # Busca a data máxima (None se a tabela estiver vazia)
+        val_db = obter_max()
         
         # Converte para datetime (Pandas lida bem com None/NaT aqui)
         max_dt_from_db = pd.to_datetime(val_db)
@@ -151,15 +191,168 @@ def check_table_status(conn, table_name, asset_type, date_column, workspace_log,
     }
     return log_entry
 
-def main():
+# Estratégias cujo resultado é o MAX() real da coluna ('max' completo ou 'coluna > ?')
+ESTRATEGIAS_WATERMARK = ('max', 'watermark')
+
+def _observar(observados, tabela, estrategia, obter_max):
     """
-    Função principal que orquestra a verificação de todas as tabelas
-    e insere os logs no banco de dados.
+    Envolve obter_max para guardar o valor bruto lido em observados
+    (usado para atualizar os watermarks ao final da execução).
+    Só valores lidos da própria coluna viram watermark: 'pk_desc' olha só
+    as últimas linhas e 'update_time' nem lê a coluna.
+    """
+    def _obter():
+        valor = obter_max()
+        if observados is not None and estrategia in ESTRATEGIAS_WATERMARK:
+            observados[(tabela['conn_key'], tabela['nome'])] = {
+                'conn_key': tabela['conn_key'], 'nome_ativo': tabela['nome'],
+                'coluna': tabela['coluna'], 'valor': valor,
+                'completo': estrategia != 'watermark'
+            }
+        return valor
+    return _obter
+
+def montar_tarefas_individuais(itens, settings, planos=None, observados=None):
+    """
+    Uma tarefa (e uma ida ao banco) por tabela. itens é uma lista de
+    (posição, (tabela, dias, hora)). Se houver plano para a tabela, o MAX()
+    é obtido pela estratégia planejada (ver plano_probes e watermarks).
+    """
+    planos = planos or {}
+    tarefas = []
+    for pos, (tabela, dias, hora) in itens:
+        plano = planos.get((tabela['conn_key'], tabela['nome']))
+
+        def _probe(conn_data, pos=pos, tabela=tabela, dias=dias, hora=hora, plano=plano):
+            if conn_data is None:
+                print(f"ERRO: Não foi possível conectar ao banco '{tabela['conn_key']}'. Pulando '{tabela['nome']}'.")
+                return [(pos, None)]
+            log = avaliar_table_status(
+                tabela['nome'], 
+                tabela['tipo'], 
+                tabela['coluna'],
+                tabela['workspace_log'],
+                dias,
+                hora,
+                obter_max=_observar(
+                    observados, tabela, (plano or {}).get('estrategia', 'max'),
+                    lambda: cache_probes.obter(
+                        (tabela['conn_key'], tabela['nome'], tabela['coluna']),
+                        lambda: consultar_max_estrategia(
+                            conn_data, tabela['nome'], tabela['coluna'], plano,
+                            settings['timeout_query_s'], settings['limite_pk_desc']
+                        )
+                    )
+                )
+            )
+            return [(pos, log)]
+
+        tarefas.append((tabela['conn_key'], _probe))
+    return tarefas
+
+def montar_tarefas_lote(itens, settings, observados=None):
+    """
+    Agrupa as tabelas por conn_key e cria uma tarefa por lote de até
+    'tamanho_lote' tabelas, resolvidas com um único UNION ALL.
+    """
+    por_conn_key = {}
+    for pos, item in itens:
+        por_conn_key.setdefault(item[0]['conn_key'], []).append((pos, item))
+
+    tarefas = []
+    for conn_key, itens in por_conn_key.items():
+        for lote in dividir_em_lotes(itens, settings['tamanho_lote']):
+            def _probe_lote(conn_data, lote=lote, conn_key=conn_key):
+                if conn_data is None:
+                    print(f"ERRO: Não foi possível conectar ao banco '{conn_key}'. Pulando {len(lote)} tabelas.")
+                    return [(pos, None) for pos, _ in lote]
+
+                # Só entram no UNION ALL as tabelas que ainda não estão no
+                # cache da execução (ex.: já lidas pela sincronia Silver/Gold)
+                valores = cache_probes.obter_varios(
+                    [(conn_key, tabela['nome'], tabela['coluna']) for _, (tabela, _, _) in lote],
+                    lambda chaves: consultar_max_lote(
+                        conn_data, [(nome, coluna) for _, nome, coluna in chaves],
+                        settings['timeout_query_s']
+                    )
+                )
+
+                logs = []
+                for (pos, (tabela, dias, hora)), valor in zip(lote, valores):
+                    def _obter_max(valor=valor):
+                        if isinstance(valor, Exception):
+                            raise valor
+                        return valor
+
+                    logs.append((pos, avaliar_table_status(
+                        tabela['nome'], tabela['tipo'], tabela['coluna'], tabela['workspace_log'],
+                        dias, hora, obter_max=_observar(observados, tabela, 'max', _obter_max)
+                    )))
+                return logs
+
+            tarefas.append((conn_key, _probe_lote))
+    return tarefas
+
+def carregar_watermarks_seguro():
+    """Lê os watermarks; qualquer falha apenas desativa o modo incremental nesta execução."""
+    try:
+        with conexao('dbDrogamais') as conn:
+            return carregar_watermarks(conn) if conn else {}
+    except Exception as e:
+        print(f"AVISO: Não foi possível ler os watermarks. Usando MAX() completo. Detalhe: {e}")
+        return {}
+
+def gravar_watermarks_seguro(observacoes, anteriores):
+    try:
+        with conexao('dbDrogamais') as conn:
+            if conn:
+                gravar_watermarks(conn, observacoes, anteriores)
+    except Exception as e:
+        print(f"AVISO: Não foi possível gravar os watermarks. Detalhe: {e}")
+
+def carregar_historico_seguro(tipos_ativo):
+    """Lê o último resultado de cada ativo; sem ele, todas as tabelas são consultadas."""
+    try:
+        with conexao('dbDrogamais') as conn:
+            return carregar_historico(conn, tipos_ativo) if conn else None
+    except Exception as e:
+        print(f"AVISO: Não foi possível ler o último resultado dos ativos. Consultando todas as tabelas. Detalhe: {e}")
+        return None
+
+def log_mantido(tabela, estado, agora=None):
     """
-    print("="*50)
-    print("--- INICIANDO VERIFICACAO DE ATUALIDADE DAS TABELAS (UNIFICADO COM TOLERANCIA) ---")
-    print("="*50)
+    Log de uma tabela que não foi consultada nesta execução, repetindo o
+    último resultado conhecido (status e data de atualização) com os dias e
+    horas sem atualizar recalculados para agora. data_verificacao continua a
+    da última consulta, para a agenda ainda vencer pelo intervalo máximo.
+    """
+    agora = agora or datetime.now()
+    data_ref = estado['data_atualizacao']
+    dias_sem_atualizar = horas_sem_atualizar = None
+    if data_ref is not None:
+        dias_sem_atualizar = (agora.date() - data_ref.date()).days
+        horas_sem_atualizar = round((agora - data_ref).total_seconds() / 3600.0, 2)
+    return {
+        'nome_workspace': tabela['workspace_log'],
+        'nome_ativo': tabela['nome'],
+        'tipo_ativo': tabela['tipo'],
+        'status_atualizacao': estado['status'],
+        'data_atualizacao': data_ref,
+        'tipo_atualizacao': 'Scheduled',
+        'dias_sem_atualizar': dias_sem_atualizar,
+        'horas_sem_atualizar': horas_sem_atualizar,
+        'data_verificacao': estado['verificado_em']
+    }
+
+def _virada(item, data_ref):
+    tabela, dias, hora = item
+    return proximo_corte_apos(pd.Timestamp(data_ref).to_pydatetime(), dias, parse_hora_tolerancia(hora, tabela['nome']))
 
+def coletar_logs():
+    """
+    Verifica a atualidade de todas as tabelas ativas e devolve os logs
+    na mesma ordem da configuração.
+    """
     config = load_config_from_db()
     if not config:
         sys.exit(1)
@@ -170,111 +363,106 @@ def main():
         print("ERRO: Nenhuma lista de tabelas válida foi encontrada para 'freshness_checks'.")
         sys.exit(1)
 
-    all_logs = []
-    conn_data_map = {} 
-    conn_log = None 
-
-    try:
-        for tabela in tabelas_para_checar:
-            if not tabela.get('enabled', True):
-                # print(f"---> Pulando a tabela desativada: '{tabela['nome']}'") # Opcional: reduzir log
-                continue
-            
-            conn_key = tabela['conn_key']
-            
-            if conn_key not in conn_data_map:
-                conn_data_map[conn_key] = get_db_connection(config_key=conn_key)
-            
-            conn_data = conn_data_map[conn_key]
-
-            if conn_data is None:
-                print(f"ERRO: Não foi possível conectar ao banco '{conn_key}'. Pulando esta checagem.")
-                continue
+    settings = get_execution_settings()
 
-            update_tolerance_days = tabela.get('dias_tolerancia', 0) 
-            time_tolerance = tabela.get('hora_tolerancia', '00:00')
-            
-            if not isinstance(update_tolerance_days, int) or update_tolerance_days < 0:
-                print(f"AVISO: 'dias_tolerancia' inválido ou ausente para '{tabela['nome']}'. Usando padrão D-0.")
-                update_tolerance_days = 0
+    tabelas_validas = []
+    for tabela in tabelas_para_checar:
+        if not tabela.get('enabled', True):
+            continue
 
-            log = check_table_status(
-                conn_data, 
-                tabela['nome'], 
-                tabela['tipo'], 
-                tabela['coluna'],
-                tabela['workspace_log'],
-                update_tolerance_days,
-                time_tolerance
-            )
-            all_logs.append(log)
-            print("-" * 20)
+        update_tolerance_days = tabela.get('dias_tolerancia', 0) 
+        time_tolerance = tabela.get('hora_tolerancia', '00:00')
         
-        if not all_logs:
-            print("AVISO: Nenhum log foi gerado.")
-            return
+        if not isinstance(update_tolerance_days, int) or update_tolerance_days < 0:
+            print(f"AVISO: 'dias_tolerancia' inválido ou ausente para '{tabela['nome']}'. Usando padrão D-0.")
+            update_tolerance_days = 0
 
-        df_para_inserir = pd.DataFrame(all_logs)
-        
-        # Converte a coluna para datetime
-        df_para_inserir['data_atualizacao'] = pd.to_datetime(df_para_inserir['data_atualizacao'])
-        
-        # --- PROCESSAMENTO: Separação de Data e Hora ---
-        df_para_inserir['hora_atualizacao'] = df_para_inserir['data_atualizacao'].apply(
-            lambda x: x.strftime('%H:%M:%S') if pd.notna(x) else None
-        )
-        
-        df_para_inserir['data_atualizacao'] = df_para_inserir['data_atualizacao'].apply(
-            lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else None
-        )
-        
-        # Trata nulos
-        for col in ['data_atualizacao', 'hora_atualizacao']:
-            df_para_inserir[col] = df_para_inserir[col].fillna(pd.NA).replace({pd.NaT: None})
-
-        # --- SIMPLIFICAÇÃO DO STATUS ---
-        status_map_simplified = {
-            'Completed': 'OK',
-            'Atualizada': 'OK',
-            'Sincronizado': 'OK',
-            'Sincronizada': 'OK',
-            'Desatualizada': 'Failed'
+        tabelas_validas.append((tabela, update_tolerance_days, time_tolerance))
+
+    # Só consulta as tabelas que podem ter mudado de situação: uma tabela
+    # 'Atualizada' fica de fora até o corte poder passar da última data vista;
+    # as com problema voltam a cada 'reprobe_falha_min'. As que ficam de fora
+    # repetem o último resultado, para continuarem com linha em fat_fiscal
+    mantidos = {}
+    if settings['pular_atualizadas'] or agenda.modo_agendador:
+        agenda.configurar(settings['reprobe_falha_min'], settings['agendador_intervalo_max_h'])
+        if not agenda.historico_carregado:
+            historico = carregar_historico_seguro({t['tipo'] for t, _, _ in tabelas_validas})
+            if historico is not None:
+                agenda.carregar(historico)
+        vencidas = set(agenda.selecionar(tabelas_validas, _virada))
+        agora = datetime.now()
+        mantidos = {
+            pos: log_mantido(tabela, agenda.estado(tabela), agora)
+            for pos, (tabela, _, _) in enumerate(tabelas_validas)
+            if pos not in vencidas
         }
-        df_para_inserir['status_atualizacao'] = df_para_inserir['status_atualizacao'].apply(
-            lambda x: status_map_simplified.get(x, 'Failed')
-        )
-        
-        # Ajusta a ordem das colunas
-        colunas_ordenadas = [
-            'nome_workspace', 'nome_ativo', 'tipo_ativo', 'status_atualizacao', 
-            'data_atualizacao', 'hora_atualizacao', 'tipo_atualizacao', 'dias_sem_atualizar'
-        ]
-        df_para_inserir = df_para_inserir.reindex(columns=colunas_ordenadas)
-
-        print("\n" + "="*50)
-        print("--- DADOS A SEREM INSERIDOS NO LOG ---")
-        print(df_para_inserir.to_string())
-        print("="*50 + "\n")
-        
-        conn_log = get_db_connection(config_key='dbDrogamais')
+        if mantidos:
+            print(f"INFO: {len(vencidas)} de {len(tabelas_validas)} tabelas vencidas; "
+                  f"{len(mantidos)} continuam no prazo e repetem o último resultado sem consulta.")
 
-        if conn_log is None:
-             print("ERRO CRÍTICO: Não foi possível conectar ao banco de LOGS (dbDrogamais). Logs não inseridos.")
-             return
+    itens = [(pos, item) for pos, item in enumerate(tabelas_validas) if pos not in mantidos]
+    if not itens:
+        return [log for _, log in sorted(mantidos.items())]
 
-        insert_dataframe(conn_log, df_para_inserir, "fat_fiscal")
+    # Tabelas cujo MAX() seria um scan caro usam a estratégia do plano
+    # e ficam fora do lote; as demais seguem o modo configurado
+    planos = {}
+    if settings['planejar_probes']:
+        planos = obter_planos([t for _, (t, _, _) in itens], settings)
 
-    except Exception as e:
-        print(f"ERRO CRÍTICO: Falha no processo principal de Verificação de Atualidade: {e}")
-        
-    finally:
-        for conn in conn_data_map.values():
-            if conn: conn.close()
-        if conn_log:
-            conn_log.close()
-            print("\n" + "="*50)
-            print("INFO: Processo finalizado. Conexoes fechadas.")
-            print("="*50)
+    # Com watermark recente, basta perguntar se há algo mais novo que ele
+    watermarks = carregar_watermarks_seguro() if settings['usar_watermarks'] else {}
+    for _, (tabela, _, _) in itens:
+        chave = (tabela['conn_key'], tabela['nome'])
+        registro = watermarks.get(chave)
+        if watermark_utilizavel(registro, tabela['coluna'], settings['watermark_revalidar_horas']):
+            planos[chave] = {'estrategia': 'watermark', 'watermark': registro['ultimo_max']}
+
+    def _estrategia(item):
+        plano = planos.get((item[0]['conn_key'], item[0]['nome']))
+        return plano['estrategia'] if plano else 'max'
+
+    itens_planejados = [(pos, item) for pos, item in itens if _estrategia(item) != 'max']
+    itens_max = [(pos, item) for pos, item in itens if _estrategia(item) == 'max']
+
+    observados = {} if settings['usar_watermarks'] else None
+    tarefas = montar_tarefas_individuais(itens_planejados, settings, planos, observados)
+    if settings['modo_probe'] == 'lote':
+        tarefas += montar_tarefas_lote(itens_max, settings, observados)
+    else:
+        tarefas += montar_tarefas_individuais(itens_max, settings, observados=observados)
+
+    # As consultas de MAX rodam em paralelo, com conexões limitadas por conn_key
+    resultados = executar_probes(
+        tarefas,
+        max_workers=settings['max_workers'],
+        conexoes_por_conn_key=settings['conexoes_por_conn_key']
+    )
+
+    if observados:
+        gravar_watermarks_seguro(list(observados.values()), watermarks)
+
+    # Cada tarefa devolve [(posição original, log)]; reordena para manter
+    # a mesma sequência de linhas da configuração
+    pares = [par for lista in resultados if lista for par in lista]
+    for pos, log in pares:
+        agenda.registrar(tabelas_validas[pos][0], log)
+    pares += list(mantidos.items())
+    return [log for _, log in sorted(pares, key=lambda par: par[0]) if log is not None]
+
+TIPO = TipoCheck(
+    nome='atualidade',
+    titulo='VERIFICACAO DE ATUALIDADE DAS TABELAS (UNIFICADO COM TOLERANCIA)',
+    coletar=coletar_logs
+)
+
+def main():
+    """
+    Função principal que orquestra a verificação de todas as tabelas
+    e insere os logs no banco de dados.
+    """
+    executar_check(TIPO)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,50 +1,180 @@
 import json
 import mariadb
+import os
 import sys
+import tempfile
+import threading
+import time
 import pandas as pd
 import logging
+from contextlib import contextmanager
 from pathlib import Path
 
-def get_db_connection(config_key='dbDrogamais'):
+from metricas import metricas
+
+# Valores usados quando o config.json não tem a seção "execucao"
+EXECUCAO_PADRAO = {
+    'max_workers': 8,
+    'conexoes_por_conn_key': 2,
+    'timeout_query_s': 120,
+    'modo_probe': 'lote',
+    'tamanho_lote': 25,
+    'planejar_probes': True,
+    'validade_plano_horas': 24,
+    'custo_max_linhas': 1000000,
+    'estrategia_scan': 'pk_desc',
+    'limite_pk_desc': 50000,
+    'usar_watermarks': True,
+    'watermark_revalidar_horas': 24,
+    'tamanho_pool': 8,
+    'validacao_pool_ms': 500,
+    'espera_pool_s': 30,
+    'pbi_max_concorrencia': 8,
+    'pbi_timeout_s': 30,
+    'pbi_max_tentativas': 4,
+    'pbi_cache_ttl_horas': 24,
+    'pbi_historico_refresh': True,
+    'pbi_refresh_janela': 5,
+    'pbi_refresh_janela_lacuna': 100,
+    'modo_escrita': 'multi_insert',
+    'tamanho_bloco_insert': 500,
+    'retencao_dias': 0,
+    'arquivar_retencao': True,
+    'particoes_futuras_meses': 2,
+    'resumo_dias_recalculo': 1,
+    'hora_manutencao': 3,
+    'gravar_metricas': True,
+    'log_max_mb': 10,
+    'log_backups': 5,
+    'agendador_tick_s': 300,
+    'agendador_intervalo_min': 60,
+    'agendador_intervalo_max_h': 24,
+    'pular_atualizadas': True,
+    'reprobe_falha_min': 15,
+}
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / 'config' / 'config.json'
+
+_config_cache = None
+_pools = {}
+_lock = threading.Lock()
+
+def carregar_config():
     """
-    Lê o config.json, processa a herança ($extends) e conecta ao MariaDB.
+    Lê e guarda em memória o config.json. Todas as funções deste módulo
+    (e os checkers) usam esta cópia, evitando reler o arquivo a cada conexão.
+    Levanta FileNotFoundError se o arquivo não existir.
     """
-    # Define o caminho do arquivo config.json
-    src_dir = Path(__file__).resolve().parent
-    config_path = src_dir.parent / 'config' / 'config.json'
+    global _config_cache
+    with _lock:
+        if _config_cache is None:
+            with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
+                _config_cache = json.load(f)
+        return _config_cache
 
+def get_execution_settings():
+    """
+    Lê a seção opcional "execucao" do config.json (paralelismo e timeouts
+    dos checkers), completando com os valores padrão.
+    """
+    settings = dict(EXECUCAO_PADRAO)
     try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            full_config = json.load(f)
-        
-        # Verifica se a chave existe
-        if config_key not in full_config:
-            logging.error(f"ERRO CRÍTICO: A chave '{config_key}' não foi encontrada no 'config.json'.")
-            return None
+        settings.update(carregar_config().get('execucao', {}))
+    except Exception as e:
+        logging.warning(f"AVISO: Não foi possível ler 'execucao' do config.json. Usando padrões. Detalhe: {e}")
+    return settings
 
-        db_config = full_config[config_key]
+def resolver_config_conexao(config_key):
+    """
+    Monta os parâmetros de conexão de um conn_key, processando a herança
+    ($extends). Retorna None se a chave não existir.
+    """
+    full_config = carregar_config()
 
-        # --- CORREÇÃO: Processar Herança ($extends) ---
-        if "$extends" in db_config:
-            parent_key = db_config.pop("$extends") # Remove a chave $extends e pega o nome do pai
-            parent_config = full_config.get(parent_key, {})
-            
-            # Faz o merge: Configurações do pai + Configurações específicas (sobrescrevem o pai)
-            final_config = parent_config.copy()
-            final_config.update(db_config)
-            db_config = final_config
-        # ----------------------------------------------
-
-        # Define timeouts com valores padrão se não existirem
-        db_config.setdefault('read_timeout', 300)
-        db_config.setdefault('write_timeout', 300)
-
-        # Remove chaves que não são aceitas pelo mariadb.connect (caso existam extras)
-        # O connect aceita: user, password, host, port, database, etc.
-        # chaves como 'read_timeout' funcionam em alguns drivers, mas garantimos limpeza se necessário.
+    # Verifica se a chave existe
+    if config_key not in full_config:
+        logging.error(f"ERRO CRÍTICO: A chave '{config_key}' não foi encontrada no 'config.json'.")
+        return None
+
+    db_config = dict(full_config[config_key])
+
+    # --- Processar Herança ($extends) ---
+    if "$extends" in db_config:
+        parent_key = db_config.pop("$extends") # Remove a chave $extends e pega o nome do pai
+        parent_config = full_config.get(parent_key, {})
         
-        logging.info(f"INFO: Conectando ao banco de dados MariaDB (Chave: '{config_key}')...")
-        conn = mariadb.connect(**db_config)
+        # Faz o merge: Configurações do pai + Configurações específicas (sobrescrevem o pai)
+        final_config = dict(parent_config)
+        final_config.update(db_config)
+        db_config = final_config
+    # ----------------------------------------------
+
+    # Define timeouts com valores padrão se não existirem
+    db_config.setdefault('read_timeout', 300)
+    db_config.setdefault('write_timeout', 300)
+    return db_config
+
+def _obter_pool(config_key):
+    """Cria (uma única vez por processo) o pool de conexões do conn_key."""
+    with _lock:
+        pool = _pools.get(config_key)
+    if pool is not None:
+        return pool
+
+    db_config = resolver_config_conexao(config_key)
+    if db_config is None:
+        return None
+
+    settings = get_execution_settings()
+    # O conector limita o pool a 64 conexões
+    tamanho = min(64, max(int(settings['tamanho_pool']), int(settings['conexoes_por_conn_key'])))
+
+    with _lock:
+        if config_key not in _pools:
+            logging.info(f"INFO: Criando pool de conexões MariaDB (Chave: '{config_key}', tamanho: {tamanho})...")
+            # O pool abre as conexões na criação: é a única conexão real ao banco
+            with metricas.medir('conexao', conn_key=config_key, detalhe=f"pool de {tamanho}"):
+                _pools[config_key] = mariadb.ConnectionPool(
+                    pool_name=f"fiscal_{config_key}",
+                    pool_size=tamanho,
+                    pool_reset_connection=True,
+                    # Valida (ping) a conexão ao emprestá-la se ficou ociosa por mais que isso (ms)
+                    pool_validation_interval=int(settings['validacao_pool_ms']),
+                    **db_config
+                )
+        return _pools[config_key]
+
+def get_db_connection(config_key='dbDrogamais'):
+    """
+    Empresta uma conexão do pool do conn_key (config.json, com herança $extends).
+    conn.close() devolve a conexão ao pool em vez de fechá-la.
+    Se todas as conexões estiverem em uso, espera até 'espera_pool_s' segundos.
+    O tempo do empréstimo entra nas métricas da execução como 'espera_pool'
+    (a abertura das conexões, na criação do pool, é medida como 'conexao').
+    """
+    with metricas.medir('espera_pool', conn_key=config_key) as medicao:
+        conn = _emprestar_conexao(config_key)
+        medicao['sucesso'] = conn is not None
+    return conn
+
+def _emprestar_conexao(config_key):
+    try:
+        pool = _obter_pool(config_key)
+        if pool is None:
+            return None
+
+        prazo = time.monotonic() + get_execution_settings()['espera_pool_s']
+        while True:
+            try:
+                conn = pool.get_connection()
+            except mariadb.PoolError:
+                conn = None
+            if conn is not None:
+                break
+            if time.monotonic() >= prazo:
+                logging.error(f"ERRO CRÍTICO: Pool '{config_key}' sem conexões livres.")
+                return None
+            time.sleep(0.1)
         return conn
 
     except FileNotFoundError:
@@ -57,54 +187,205 @@ def get_db_connection(config_key='dbDrogamais'):
         logging.error(f"ERRO CRÍTICO: Ocorreu um erro inesperado ao conectar. Detalhe: {e}")
         return None
 
-def insert_dataframe(conn, df, table_name):
+@contextmanager
+def conexao(config_key='dbDrogamais'):
+    """
+    Context manager sobre get_db_connection: entrega a conexão do pool
+    (ou None, se não foi possível conectar), desfaz a transação pendente
+    em caso de erro e devolve a conexão ao pool na saída.
+    """
+    conn = get_db_connection(config_key)
+    try:
+        yield conn
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+def fechar_pools():
+    """Fecha todos os pools do processo (usado ao encerrar o orquestrador)."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        try:
+            pool.close()
+        except Exception:
+            pass
+
+def parametros_db(df):
+    """
+    Converte o DataFrame direto em parâmetros DB-API (lista de tuplas),
+    coluna a coluna, com None no lugar de NaN/NaT/pd.NA.
+    """
+    colunas = []
+    for col in df.columns:
+        valores = df[col].to_numpy(dtype=object)
+        nulos = df[col].isna().to_numpy()
+        if nulos.any():
+            valores[nulos] = None
+        colunas.append(valores)
+    return list(zip(*colunas))
+
+def _clausula_duplicada(ao_duplicar):
+    """ON DUPLICATE KEY UPDATE para as colunas informadas (vazio se não houver)."""
+    if not ao_duplicar:
+        return ""
+    return " ON DUPLICATE KEY UPDATE " + ", ".join(f"`{c}` = VALUES(`{c}`)" for c in ao_duplicar)
+
+def _inserir_multi(cursor, table_name, cols, linhas, ao_duplicar=None):
+    """Um único INSERT ... VALUES (...),(...) com todas as linhas recebidas."""
+    grupo = "(" + ", ".join(["?"] * len(cols)) + ")"
+    query = f"INSERT INTO `{table_name}` ({', '.join(cols)}) VALUES " + ", ".join([grupo] * len(linhas))
+    cursor.execute(query + _clausula_duplicada(ao_duplicar), [valor for linha in linhas for valor in linha])
+
+def _inserir_bisseccao(cursor, table_name, cols, linhas, ruins, ao_duplicar=None):
+    """
+    Insere o bloco; se falhar, divide ao meio e tenta cada metade, até
+    isolar as linhas inválidas (guardadas em ruins com o erro).
+    Com k linhas ruins o custo é O(k log n) idas ao banco, e não O(n).
+    Cada INSERT é atômico no InnoDB: um bloco que falha não grava nada.
+    Retorna quantas linhas foram inseridas.
+    """
+    try:
+        _inserir_multi(cursor, table_name, cols, linhas, ao_duplicar)
+        return len(linhas)
+    except (mariadb.DataError, mariadb.IntegrityError) as e:
+        # Só erros de dado (valor inválido, chave duplicada) dependem da linha;
+        # os demais (coluna inexistente, conexão) sobem direto
+        if len(linhas) == 1:
+            ruins.append((linhas[0], e))
+            return 0
+    meio = len(linhas) // 2
+    return (_inserir_bisseccao(cursor, table_name, cols, linhas[:meio], ruins, ao_duplicar)
+            + _inserir_bisseccao(cursor, table_name, cols, linhas[meio:], ruins, ao_duplicar))
+
+def _valor_tsv(valor):
+    """Formata um valor para o arquivo do LOAD DATA (\\N = NULL)."""
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        valor = int(valor)
+    return (str(valor).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def _inserir_load_data(cursor, table_name, cols, linhas):
+    """
+    Grava as linhas num arquivo temporário e carrega com LOAD DATA LOCAL
+    INFILE (uma ida ao banco, sem montar o SQL de cada linha).
+    Exige 'local_infile': true na conexão do config.json e no servidor.
+    """
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.tsv', delete=False) as f:
+        for linha in linhas:
+            f.write('\t'.join(_valor_tsv(v) for v in linha) + '\n')
+        caminho = f.name
+    try:
+        arquivo = caminho.replace('\\', '/').replace("'", "\\'")
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE '{arquivo}' INTO TABLE `{table_name}` "
+            f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' "
+            f"LINES TERMINATED BY '\\n' ({', '.join(cols)})"
+        )
+        return cursor.rowcount
+    finally:
+        os.unlink(caminho)
+
+def insert_dataframe(conn, df, table_name, modo=None, ao_duplicar=None, commit=True):
+    """
+    Mede a gravação (métricas da execução) e delega a _insert_dataframe.
+    """
+    with metricas.medir('gravacao', ativo=table_name) as medicao:
+        sucesso = _insert_dataframe(conn, df, table_name, modo, ao_duplicar, commit, medicao)
+        medicao['sucesso'] = sucesso
+    return sucesso
+
+def _insert_dataframe(conn, df, table_name, modo=None, ao_duplicar=None, commit=True, medicao=None):
     """
     Insere um DataFrame do Pandas em uma tabela do MariaDB.
-    Tenta inserir em lote. Se falhar, tenta linha a linha.
+    modo (padrão: 'modo_escrita' da seção "execucao"):
+    - 'multi_insert': INSERT de várias linhas por comando, em blocos de
+      'tamanho_bloco_insert' linhas.
+    - 'load_data': LOAD DATA LOCAL INFILE (cargas grandes/backfills); se o
+      servidor recusar, cai para 'multi_insert'.
+    - 'executemany': executemany do conector.
+    Blocos que falham são divididos ao meio até isolar as linhas inválidas
+    (ver _inserir_bisseccao); o restante é gravado normalmente.
+    Com ao_duplicar (lista de colunas), a gravação vira um upsert
+    (ON DUPLICATE KEY UPDATE dessas colunas); nesse caso 'load_data' usa
+    'multi_insert', já que o LOAD DATA só sabe substituir a linha inteira.
+    Com commit=False a transação fica aberta para o chamador gravar outras
+    tabelas junto; o modo vira 'multi_insert', o único que não precisa de
+    rollback para se recuperar de uma falha parcial.
+    Em medicao (dict de metricas.medir), 'linhas' recebe as linhas gravadas.
     """
+    medicao = {} if medicao is None else medicao
+    medicao['linhas'] = 0
     if df.empty:
         logging.warning(f"AVISO: DataFrame vazio. Nenhuma inserção em '{table_name}'.")
         return True
 
+    settings = get_execution_settings()
+    modo = modo or settings['modo_escrita']
+    if (ao_duplicar and modo == 'load_data') or not commit:
+        modo = 'multi_insert'
+    cols = [f"`{c}`" for c in df.columns]
+    # O protocolo limita um comando a 65535 parâmetros
+    tamanho_bloco = max(1, min(int(settings['tamanho_bloco_insert']), 65535 // len(cols)))
+
     cursor = None
     try:
         cursor = conn.cursor()
-        
-        # Prepara a query
-        cols = ", ".join([f"`{c}`" for c in df.columns])
-        placeholders = ", ".join(["?"] * len(df.columns))
-        query = f"INSERT INTO `{table_name}` ({cols}) VALUES ({placeholders})"
 
-        # Converte para tuplas (necessário para o conector)
-        # replace({pd.NaT: None}) já deve ter sido feito antes, mas o conector lida bem com None
-        data_tuples = list(df.itertuples(index=False, name=None))
+        # Converte para tuplas (necessário para o conector), já com None nos nulos
+        data_tuples = parametros_db(df)
 
-        logging.info(f"INFO: Inserindo {len(df)} linhas em '{table_name}'...")
+        logging.info(f"INFO: Inserindo {len(df)} linhas em '{table_name}' (modo: {modo})...")
 
-        # Tenta inserção em lote
-        try:
-            cursor.executemany(query, data_tuples)
-            conn.commit()
-            logging.info(f"SUCESSO: {cursor.rowcount} linhas inseridas em '{table_name}'.")
-            return True
-        except mariadb.Error as e:
-            logging.warning(f"AVISO: Falha no lote. Tentando linha a linha. Erro: {e}")
-            conn.rollback()
+        if modo == 'load_data':
+            try:
+                inseridas = _inserir_load_data(cursor, table_name, cols, data_tuples)
+                conn.commit()
+                medicao['linhas'] = inseridas
+                logging.info(f"SUCESSO: {inseridas} linhas carregadas em '{table_name}' (LOAD DATA).")
+                return True
+            except mariadb.Error as e:
+                logging.warning(f"AVISO: LOAD DATA LOCAL INFILE falhou ({e}). Usando INSERT em blocos.")
+                conn.rollback()
 
-            # Inserção linha a linha (para salvar o que der)
-            sucessos = 0
-            erros = 0
-            for row in data_tuples:
-                try:
-                    cursor.execute(query, row)
-                    sucessos += 1
-                except Exception as row_err:
-                    erros += 1
-                    logging.error(f"Erro na linha: {row}. Detalhe: {row_err}")
-            
+        if modo == 'executemany':
+            try:
+                placeholders = ", ".join(["?"] * len(cols))
+                cursor.executemany(
+                    f"INSERT INTO `{table_name}` ({', '.join(cols)}) VALUES ({placeholders})"
+                    + _clausula_duplicada(ao_duplicar),
+                    data_tuples
+                )
+                conn.commit()
+                medicao['linhas'] = len(data_tuples)
+                logging.info(f"SUCESSO: {cursor.rowcount} linhas inseridas em '{table_name}'.")
+                return True
+            except mariadb.Error as e:
+                logging.warning(f"AVISO: Falha no lote. Isolando as linhas inválidas. Erro: {e}")
+                conn.rollback()
+
+        inseridas, ruins = 0, []
+        for inicio in range(0, len(data_tuples), tamanho_bloco):
+            bloco = data_tuples[inicio:inicio + tamanho_bloco]
+            inseridas += _inserir_bisseccao(cursor, table_name, cols, bloco, ruins, ao_duplicar)
+        if commit:
             conn.commit()
-            logging.info(f"FIM: {sucessos} inseridos, {erros} falhas.")
-            return True # Retorna True pois o processo terminou (mesmo com erros parciais)
+        medicao['linhas'] = inseridas
+
+        for row, row_err in ruins:
+            logging.error(f"Erro na linha: {row}. Detalhe: {row_err}")
+        if ruins:
+            logging.info(f"FIM: {inseridas} inseridos, {len(ruins)} falhas.")
+        else:
+            logging.info(f"SUCESSO: {inseridas} linhas inseridas em '{table_name}'.")
+        return True # Retorna True pois o processo terminou (mesmo com erros parciais)
 
     except Exception as e:
         logging.error(f"ERRO CRÍTICO na inserção: {e}")
@@ -113,10 +394,72 @@ def insert_dataframe(conn, df, table_name):
     finally:
         if cursor: cursor.close()
 
+# Chave única de fat_fiscal que torna a gravação idempotente por execução:
+# cada ativo tem no máximo uma linha por hora (data_insercao + hora_insercao_hh)
+CHAVE_EXECUCAO = 'uk_fat_fiscal_execucao'
+COLUNAS_CHAVE_EXECUCAO = ['nome_workspace', 'nome_ativo', 'tipo_ativo', 'data_insercao', 'hora_insercao_hh']
+
+# Colunas atualizadas quando o ativo já tem linha na hora (reexecução)
+COLUNAS_UPSERT = ['status_atualizacao', 'data_atualizacao', 'hora_atualizacao',
+                  'tipo_atualizacao', 'dias_sem_atualizar']
+
+_chave_execucao = None
+
+def chave_execucao_disponivel():
+    """
+    True se fat_fiscal já tem a chave CHAVE_EXECUCAO (ver criar_chave_execucao).
+    Consulta o information_schema uma vez por processo.
+    """
+    global _chave_execucao
+    if _chave_execucao is None:
+        try:
+            with conexao('dbDrogamais') as conn:
+                if conn is None:
+                    return False
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT 1 FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'fat_fiscal' AND INDEX_NAME = ?
+                    LIMIT 1
+                    """,
+                    (CHAVE_EXECUCAO,)
+                )
+                _chave_execucao = cursor.fetchone() is not None
+                cursor.close()
+        except Exception as e:
+            logging.warning(f"AVISO: Não foi possível verificar a chave de '{CHAVE_EXECUCAO}': {e}")
+            return False
+    return _chave_execucao
+
+def criar_chave_execucao():
+    """
+    Migração única (main.py --preparar-fat-fiscal): cria a chave única por
+    (ativo, hora de execução). ALTER IGNORE descarta duplicatas antigas da
+    mesma hora, mantendo a primeira linha de cada uma.
+    """
+    global _chave_execucao
+    with conexao('dbDrogamais') as conn:
+        if conn is None:
+            logging.error("Não foi possível conectar para preparar fat_fiscal.")
+            return False
+        cursor = conn.cursor()
+        try:
+            cols = ", ".join(f"`{c}`" for c in COLUNAS_CHAVE_EXECUCAO)
+            cursor.execute(f"ALTER IGNORE TABLE fat_fiscal ADD UNIQUE KEY IF NOT EXISTS `{CHAVE_EXECUCAO}` ({cols})")
+            _chave_execucao = True
+            logging.info(f"--- fat_fiscal preparada: chave '{CHAVE_EXECUCAO}' disponível. ---")
+            return True
+        finally:
+            cursor.close()
+
 def limpar_historico_hora_atual():
     """
-    Remove registros da hora atual e RESETA o Auto Increment
-    para reutilizar os IDs deletados.
+    Remove os registros da hora atual, para uma reexecução na mesma hora
+    não duplicar linhas. Só é necessária enquanto fat_fiscal não tem a
+    chave de execução: com ela, a gravação é um upsert e nada é apagado.
+    Não reseta mais o AUTO_INCREMENT (o ALTER TABLE travava a tabela
+    lida pelo dashboard em DirectQuery).
     """
     conn = get_db_connection('dbDrogamais')
     if not conn:
@@ -126,7 +469,7 @@ def limpar_historico_hora_atual():
     try:
         cursor = conn.cursor()
         
-        # 1. Deleta os dados da hora atual
+        # Deleta os dados da hora atual
         query_delete = """
             DELETE FROM fat_fiscal 
             WHERE data_insercao = CURDATE() 
@@ -135,12 +478,8 @@ def limpar_historico_hora_atual():
         cursor.execute(query_delete)
         linhas_removidas = cursor.rowcount
         
-        # 2. Reseta o AUTO_INCREMENT se algo foi deletado
         if linhas_removidas > 0:
-            # Esse comando reinicia o contador para o (Máximo ID existente + 1)
-            cursor.execute("ALTER TABLE fat_fiscal AUTO_INCREMENT = 1")
-            
-            logging.info(f"--- LIMPEZA: {linhas_removidas} registros removidos e AUTO_INCREMENT resetado. ---")
+            logging.info(f"--- LIMPEZA: {linhas_removidas} registros removidos. ---")
         else:
             logging.info("--- LIMPEZA: Nenhum registro anterior encontrado para esta hora. ---")
             
@@ -150,4 +489,4 @@ def limpar_historico_hora_atual():
         logging.error(f"Erro ao tentar limpar logs da hora atual: {e}")
         conn.rollback()
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
@@ -0,0 +1,65 @@
+# eventos.py (Eventos estruturados em JSON, enviados ao logging durante cada check)
+
+import json
+import logging
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from metricas import checker_atual
+
+ARQUIVO_EVENTOS = Path(__file__).resolve().parent.parent / 'logs' / 'eventos.jsonl'
+
+# Quantos ativos com falha entram, pelo nome, no resumo de um check
+LIMITE_FALHAS_RESUMO = 20
+
+# Propaga para os handlers da raiz (fiscal_bi.log e console) e, se
+# configurar_arquivo_eventos foi chamado, também para eventos.jsonl
+logger = logging.getLogger('fiscal_bi.eventos')
+
+
+def emitir(evento, nivel=logging.INFO, **campos):
+    """
+    Registra um evento como uma linha JSON, na hora (sem esperar o checker
+    terminar). O checker em execução é incluído automaticamente.
+    """
+    registro = {
+        'ts': datetime.now().isoformat(timespec='milliseconds'),
+        'evento': evento,
+        'checker': checker_atual.get(),
+        **campos,
+    }
+    logger.log(nivel, json.dumps(registro, ensure_ascii=False, default=str))
+
+
+def configurar_arquivo_eventos(max_bytes, backups, caminho=ARQUIVO_EVENTOS):
+    """Grava os eventos, só o JSON de cada um, em um arquivo JSON-lines rotativo."""
+    caminho.parent.mkdir(exist_ok=True)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(caminho, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+
+def resumir_df_log(df):
+    """
+    Resumo das linhas de log de um check (no lugar do DataFrame inteiro):
+    totais por status e por tipo de ativo e os primeiros ativos com falha.
+    """
+    falhas = df[df['status_atualizacao'] != 'OK']
+    por_tipo = df.groupby(['tipo_ativo', 'status_atualizacao']).size().unstack(fill_value=0)
+    return {
+        'linhas': len(df),
+        'ok': int(len(df) - len(falhas)),
+        'falhas': int(len(falhas)),
+        'por_tipo_ativo': {
+            tipo: {status: int(qtd) for status, qtd in contagens.items()}
+            for tipo, contagens in por_tipo.to_dict('index').items()
+        },
+        'ativos_com_falha': [
+            f"{ws}/{ativo}"
+            for ws, ativo in falhas[['nome_workspace', 'nome_ativo']].head(LIMITE_FALHAS_RESUMO).itertuples(index=False)
+        ],
+    }
@@ -0,0 +1,146 @@
+# historico_refresh.py (Histórico completo dos refreshes do Power BI, gravado de forma incremental)
+
+import logging
+from datetime import datetime
+
+import pandas as pd
+
+TABELA_REFRESHES = 'fiscal_pbi_refreshes'
+
+# Status de um refresh ainda em andamento (sem endTime); é relido até terminar
+STATUS_EM_ANDAMENTO = 'Unknown'
+
+DDL_REFRESHES = f"""
+    CREATE TABLE IF NOT EXISTS `{TABELA_REFRESHES}` (
+        dataset_id VARCHAR(64) NOT NULL,
+        request_id VARCHAR(64) NOT NULL,
+        workspace_id VARCHAR(64) NOT NULL,
+        nome_workspace VARCHAR(255) NOT NULL,
+        nome_ativo VARCHAR(255) NOT NULL,
+        tipo_atualizacao VARCHAR(64) NULL,
+        status VARCHAR(32) NOT NULL,
+        inicio DATETIME NULL,
+        fim DATETIME NULL,
+        duracao_s INT NULL,
+        erro TEXT NULL,
+        data_coleta DATETIME NOT NULL,
+        PRIMARY KEY (dataset_id, request_id),
+        KEY ix_dataset_inicio (dataset_id, inicio)
+    )
+"""
+
+# requestId do refresh terminado mais recente de cada dataset (a âncora da
+# próxima coleta); refreshes em andamento ficam acima dela e são relidos
+QUERY_ANCORAS = f"""
+    SELECT dataset_id, request_id
+    FROM (
+        SELECT dataset_id, request_id,
+               ROW_NUMBER() OVER (PARTITION BY dataset_id ORDER BY inicio DESC) AS ordem
+        FROM `{TABELA_REFRESHES}`
+        WHERE status <> '{STATUS_EM_ANDAMENTO}'
+    ) r
+    WHERE ordem = 1
+"""
+
+# Duração, taxa de falha e percentis de duração por dataset
+QUERY_ESTATISTICAS = f"""
+    SELECT DISTINCT nome_workspace, nome_ativo,
+           COUNT(*) OVER (PARTITION BY dataset_id) AS qtd_refreshes,
+           AVG(status = 'Failed') OVER (PARTITION BY dataset_id) AS taxa_falha,
+           AVG(duracao_s) OVER (PARTITION BY dataset_id) AS duracao_media_s,
+           PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY duracao_s) OVER (PARTITION BY dataset_id) AS duracao_p50_s,
+           PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY duracao_s) OVER (PARTITION BY dataset_id) AS duracao_p95_s
+    FROM `{TABELA_REFRESHES}`
+    WHERE inicio >= NOW() - INTERVAL ? DAY AND status <> '{STATUS_EM_ANDAMENTO}'
+    ORDER BY taxa_falha DESC, duracao_p95_s DESC
+"""
+
+
+def _para_local(valor, fuso):
+    """Converte um horário ISO em UTC da API para o fuso local, sem tz (None se vazio)."""
+    dt = pd.to_datetime(valor, errors='coerce', utc=True)
+    if pd.isna(dt):
+        return None
+    return dt.tz_convert(fuso).tz_localize(None).to_pydatetime().replace(microsecond=0)
+
+
+def carregar_ancoras(conn_log):
+    """Devolve {dataset_id: requestId do último refresh terminado já gravado}."""
+    cursor = conn_log.cursor()
+    try:
+        cursor.execute(DDL_REFRESHES)
+        cursor.execute(QUERY_ANCORAS)
+        return dict(cursor.fetchall())
+    finally:
+        cursor.close()
+
+
+def estatisticas_refreshes(conn_log, dias=30):
+    """
+    DataFrame com a quantidade de refreshes, a taxa de falha e a duração
+    média, p50 e p95 (em segundos) de cada dataset nos últimos dias.
+    """
+    cursor = conn_log.cursor()
+    try:
+        cursor.execute(DDL_REFRESHES)
+        cursor.execute(QUERY_ESTATISTICAS, (dias,))
+        colunas = [c[0] for c in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=colunas)
+    finally:
+        cursor.close()
+
+
+def linhas_refreshes(dataset, refreshes, fuso='America/Sao_Paulo', agora=None):
+    """Converte os refreshes da API de um dataset nas linhas de fiscal_pbi_refreshes."""
+    agora = agora or datetime.now()
+    linhas = []
+    for refresh in refreshes:
+        if not refresh.get('requestId'):
+            continue
+        inicio = _para_local(refresh.get('startTime'), fuso)
+        fim = _para_local(refresh.get('endTime'), fuso)
+        duracao = int((fim - inicio).total_seconds()) if inicio and fim else None
+        erro = refresh.get('serviceExceptionJson')
+        linhas.append((
+            dataset['dataset_id'], refresh['requestId'], dataset['workspace_id'],
+            dataset['workspace_name'], dataset['nome_bi'], refresh.get('refreshType'),
+            refresh.get('status') or STATUS_EM_ANDAMENTO, inicio, fim, duracao,
+            erro[:2000] if erro else None, agora
+        ))
+    return linhas
+
+
+def gravar_refreshes(conn_log, linhas):
+    """
+    Grava os refreshes novos. Um refresh que já estava gravado em andamento
+    é atualizado com o status e o fim definitivos.
+    """
+    if not linhas:
+        return
+
+    cursor = conn_log.cursor()
+    try:
+        cursor.executemany(
+            f"""
+            INSERT INTO `{TABELA_REFRESHES}`
+                (dataset_id, request_id, workspace_id, nome_workspace, nome_ativo,
+                 tipo_atualizacao, status, inicio, fim, duracao_s, erro, data_coleta)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON DUPLICATE KEY UPDATE
+                nome_workspace = VALUES(nome_workspace),
+                nome_ativo = VALUES(nome_ativo),
+                status = VALUES(status),
+                fim = VALUES(fim),
+                duracao_s = VALUES(duracao_s),
+                erro = VALUES(erro),
+                data_coleta = VALUES(data_coleta)
+            """,
+            linhas
+        )
+        conn_log.commit()
+        logging.info(f"INFO: {len(linhas)} refreshes gravados em {TABELA_REFRESHES}.")
+    except Exception:
+        conn_log.rollback()
+        raise
+    finally:
+        cursor.close()
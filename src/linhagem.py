@@ -0,0 +1,115 @@
+# linhagem.py (Grafo de linhagem Bronze → Silver → Gold → Power BI montado a partir do config_tables.json)
+
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+
+CAMADAS = ('bronze', 'silver', 'gold', 'powerbi')
+
+
+@dataclass
+class No:
+    """
+    Um ativo da linhagem. Tabelas têm chave (conn_key, nome); datasets do
+    Power BI, ('powerbi', 'workspace/dataset'). coluna é a coluna de data
+    usada no MAX() (None para datasets).
+    """
+    chave: tuple
+    camada: str
+    nome: str
+    conn_key: str = None
+    coluna: str = None
+    workspace_log: str = None
+    origens: list = field(default_factory=list)
+    destinos: list = field(default_factory=list)
+
+    @property
+    def tabela(self):
+        return self.camada != 'powerbi'
+
+
+class GrafoLinhagem:
+    """DAG de dependências entre os ativos (arestas de origem para destino)."""
+
+    def __init__(self):
+        self.nos = {}
+
+    def adicionar(self, camada, nome, conn_key=None, coluna=None, workspace_log=None):
+        chave = ('powerbi', nome) if camada == 'powerbi' else (conn_key, nome)
+        no = self.nos.get(chave)
+        if no is None:
+            no = self.nos[chave] = No(chave, camada, nome, conn_key, coluna, workspace_log)
+        elif no.coluna != coluna:
+            # Um nó tem um único MAX(): pares que discordam da coluna seriam
+            # consultados na coluna errada
+            raise ValueError(f"Tabela '{nome}' ({conn_key}) declarada com colunas diferentes: "
+                             f"'{no.coluna}' e '{coluna}'")
+        return no
+
+    def ligar(self, origem, destino):
+        if destino.chave not in origem.destinos:
+            origem.destinos.append(destino.chave)
+            destino.origens.append(origem.chave)
+
+    def ordem_topologica(self):
+        """
+        Chaves em ordem topológica (toda origem antes dos seus destinos),
+        pelo algoritmo de Kahn. Um ciclo na configuração gera ValueError.
+        """
+        pendentes = {chave: len(no.origens) for chave, no in self.nos.items()}
+        fila = deque(chave for chave, qtd in pendentes.items() if qtd == 0)
+        ordem = []
+        while fila:
+            chave = fila.popleft()
+            ordem.append(chave)
+            for destino in self.nos[chave].destinos:
+                pendentes[destino] -= 1
+                if pendentes[destino] == 0:
+                    fila.append(destino)
+        if len(ordem) < len(self.nos):
+            ciclo = sorted(no.nome for chave, no in self.nos.items() if pendentes[chave] > 0)
+            raise ValueError(f"Ciclo na linhagem envolvendo: {', '.join(ciclo)}")
+        return ordem
+
+    def tabelas(self):
+        return [no for no in self.nos.values() if no.tabela]
+
+
+def montar_grafo(config):
+    """
+    Monta o grafo a partir das listas do config_tables.json:
+      - silver_sync_checks: nome_bronze → nome_silver
+      - gold_sync_checks:   nome_bronze → nome_gold, ou nome_silver → nome_gold
+        se o par informar 'nome_silver' (linhagem completa Bronze → Silver → Gold)
+      - powerbi_lineage (opcional): [{"workspace", "dataset", "origens": [nomes]}],
+        ligando tabelas já declaradas aos datasets que dependem delas
+    Pares com "enabled": false ficam de fora.
+    """
+    grafo = GrafoLinhagem()
+
+    def _tabela(par, camada, campo):
+        return grafo.adicionar(camada, par[campo], par['conn_key'], par['coluna'], par.get('workspace_log'))
+
+    for par in config.get('silver_sync_checks', []):
+        if par.get('enabled', True):
+            grafo.ligar(_tabela(par, 'bronze', 'nome_bronze'), _tabela(par, 'silver', 'nome_silver'))
+
+    for par in config.get('gold_sync_checks', []):
+        if par.get('enabled', True):
+            origem = _tabela(par, 'silver', 'nome_silver') if par.get('nome_silver') else _tabela(par, 'bronze', 'nome_bronze')
+            grafo.ligar(origem, _tabela(par, 'gold', 'nome_gold'))
+
+    por_nome = {}
+    for no in grafo.tabelas():
+        por_nome.setdefault(no.nome, no)
+    for item in config.get('powerbi_lineage', []):
+        if not item.get('enabled', True):
+            continue
+        dataset = grafo.adicionar('powerbi', f"{item['workspace']}/{item['dataset']}", workspace_log=item['workspace'])
+        for nome in item.get('origens', []):
+            if nome in por_nome:
+                grafo.ligar(por_nome[nome], dataset)
+            else:
+                logging.warning(f"AVISO: Origem '{nome}' do dataset '{item['dataset']}' não está nos pares de sincronia.")
+
+    return grafo
@@ -1,109 +1,439 @@
-import subprocess
+import argparse
+import importlib
+import io
+import os
 import sys
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from database import limpar_historico_hora_atual
+from agendador import agenda, consumir_gatilho, pedir_execucao_agora
+from database import (
+    chave_execucao_disponivel, conexao, criar_chave_execucao, fechar_pools, get_execution_settings,
+    limpar_historico_hora_atual,
+)
+from eventos import configurar_arquivo_eventos, emitir
+from manutencao_fat_fiscal import executar_manutencao
+from metricas import checker_atual, metricas
+from motor_checks import cache_probes
+from trava_arquivo import TRAVA_EXECUCAO, trava_arquivo
 # --- Configuração Simplificada de Caminhos e Logs ---
 # 1. Define a pasta src (onde este script está) e a raiz
 src_dir = Path(__file__).resolve().parent
-raiz = src_dir.parent 
+raiz = src_dir.parent
 log_dir = raiz / 'logs'
 log_dir.mkdir(exist_ok=True)
 
+
+def configurar_logging(settings):
+    """
+    fiscal_bi.log rotaciona por tamanho (log_max_mb, log_backups) em vez de
+    ser sobrescrito a cada execução; os eventos JSON dos checkers vão também
+    para eventos.jsonl. O console é line-buffered para a saída aparecer na hora
+    quando o orquestrador roda como subprocesso.
+    """
+    max_bytes = int(settings['log_max_mb'] * 1024 * 1024)
+    if hasattr(sys.stdout, 'reconfigure'):
+        sys.stdout.reconfigure(line_buffering=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        force=True,
+        handlers=[
+            RotatingFileHandler(log_dir / 'fiscal_bi.log', maxBytes=max_bytes,
+                                backupCount=settings['log_backups'], encoding='utf-8'),
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+    configurar_arquivo_eventos(max_bytes, settings['log_backups'])
+
+
 # 3. Configura o Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    force=True,
-    handlers=[
-        logging.FileHandler(log_dir / 'fiscal_bi.log', mode='w', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+configurar_logging(get_execution_settings())
 # ----------------------------------------------------
 
-def run_script(script_name):
+# Checkers executados pelo orquestrador: (módulo em src, timeout em segundos).
+# Cada módulo precisa expor uma função main() sem argumentos.
+CHECKERS = [
+    ('check_powerbi', 900),
+    ('check_tables_timestamp', 600),
+]
+
+# Checker que seleciona os próprios ativos vencidos e roda em toda rodada do agendador
+CHECKER_AGENDADO = 'check_tables_timestamp'
+
+
+@dataclass
+class ResultadoCheck:
+    """Resultado da execução de um checker dentro do orquestrador."""
+    nome: str
+    sucesso: bool = False
+    status: str = 'Não Executado'
+    duracao_s: float = 0.0
+    erro: str = None
+
+
+class _StdoutPorThread(io.TextIOBase):
     """
-    Executa um script Python localizado na MESMA pasta (src) que este orquestrador.
+    Substitui o sys.stdout enquanto os checkers rodam em threads.
+    Cada linha impressa por um checker vira um logging.info prefixado com
+    o nome do checker, em vez de se misturar com a saída dos demais.
     """
-    logging.info("="*60)
-    logging.info(f"--- EXECUTANDO SCRIPT: {script_name} ---")
-    logging.info("="*60)
 
-    python_executable = sys.executable
-    
-    # Monta o caminho completo: Pasta src + nome do script
-    script_path = src_dir / script_name
-    # -------------------------------
+    def __init__(self, original):
+        self._original = original
+        self._local = threading.local()
+
+    def write(self, texto):
+        nome = checker_atual.get()
+        if nome is None:
+            return self._original.write(texto)
+
+        buffer = getattr(self._local, 'buffer', '') + texto
+        *linhas, self._local.buffer = buffer.split('\n')
+        for linha in linhas:
+            if linha.strip():
+                logging.info(f"[{nome}] {linha}")
+        return len(texto)
+
+    def descarregar(self):
+        nome = checker_atual.get()
+        buffer = getattr(self._local, 'buffer', '')
+        if nome and buffer.strip():
+            logging.info(f"[{nome}] {buffer}")
+        self._local.buffer = ''
+
+    def flush(self):
+        self._original.flush()
+
+
+def executar_checker(nome_modulo, stdout_proxy=None):
+    """
+    Importa um checker da pasta src e chama o seu main() no processo atual.
+    sys.exit() dentro do checker é tratado como falha, não encerra o orquestrador.
+    """
+    resultado = ResultadoCheck(nome=nome_modulo)
+    inicio = time.perf_counter()
+
+    checker_atual.set(nome_modulo)
 
     try:
-        # Converte Path para string para o subprocess
-        result = subprocess.run(
-            [python_executable, str(script_path)], 
-            check=True,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace'
-        )
-        if result.stdout:
-            logging.info(f"--- SAÍDA {script_name} ---:\n{result.stdout}")
-        if result.stderr:
-             logging.warning(f"--- SAÍDA DE ERRO (stderr) {script_name} ---:\n{result.stderr}")
-        logging.info(f"--- SUCESSO: {script_name} finalizado sem erros. ---")
-        return True
-    
-    except subprocess.CalledProcessError as e:
-        logging.error(f"!!! ERRO AO EXECUTAR {script_name} !!!")
-        if e.stdout:
-             logging.error(f"\n--- SAÍDA PADRÃO (stdout) {script_name} ---:\n{e.stdout}")
-        if e.stderr:
-             logging.error(f"\n--- SAÍDA DE ERRO (stderr) {script_name} ---:\n{e.stderr}")
-        return False
-        
-    except FileNotFoundError:
-        # Este erro indicará se o Python não achou o arquivo no caminho montado
-        logging.error(f"!!! ERRO CRÍTICO: O arquivo '{script_path}' não foi encontrado. Verifique se ele está na pasta src. !!!")
-        return False
-        
+        modulo = importlib.import_module(nome_modulo)
+        modulo.main()
+        resultado.sucesso = True
+        resultado.status = 'Sucesso'
+
+    except SystemExit as e:
+        # sys.exit(0)/sys.exit() contam como término normal
+        if e.code in (None, 0):
+            resultado.sucesso = True
+            resultado.status = 'Sucesso'
+        else:
+            resultado.status = 'Erro'
+            resultado.erro = f"sys.exit({e.code})"
+
+    except ModuleNotFoundError as e:
+        resultado.status = 'Erro'
+        resultado.erro = f"Módulo não encontrado: {e}"
+
     except Exception as e:
-        logging.error(f"!!! ERRO INESPERADO ao executar {script_name}: {e} !!!")
-        return False
+        resultado.status = 'Erro'
+        resultado.erro = str(e)
 
-def main():
+    finally:
+        if stdout_proxy:
+            stdout_proxy.descarregar()
+        resultado.duracao_s = round(time.perf_counter() - inicio, 2)
+        metricas.registrar('checker', resultado.duracao_s, sucesso=resultado.sucesso,
+                           detalhe=resultado.erro)
+
+    return resultado
+
+
+def executar_checkers(checkers, timeout_padrao=None):
     """
-    Função principal que define a sequência de scripts a serem executados.
+    Executa os checkers ao mesmo tempo em um pool de threads.
+    Retorna um ResultadoCheck por checker, na mesma ordem da lista recebida.
+    Um checker que estoura o timeout é marcado como 'Timeout' (a thread não
+    pode ser interrompida, mas o orquestrador não espera por ela).
     """
-    scripts_para_executar = [
-        'check_powerbi.py',
-        'check_tables_timestamp.py'
-    ]
+    stdout_original = sys.stdout
+    stdout_proxy = _StdoutPorThread(stdout_original)
+    sys.stdout = stdout_proxy
+
+    executor = ThreadPoolExecutor(max_workers=len(checkers), thread_name_prefix='checker')
+    try:
+        futures = {
+            nome: executor.submit(executar_checker, nome, stdout_proxy)
+            for nome, _ in checkers
+        }
+        inicio = time.perf_counter()
+        resultados = []
+
+        for nome, timeout in checkers:
+            timeout = timeout_padrao or timeout
+            restante = max(0.0, timeout - (time.perf_counter() - inicio))
+            concluidos, _ = wait([futures[nome]], timeout=restante)
+
+            if concluidos:
+                resultados.append(futures[nome].result())
+            else:
+                logging.error(f"!!! TIMEOUT: {nome} excedeu {timeout}s !!!")
+                metricas.registrar('checker', float(timeout), sucesso=False, checker=nome,
+                                   detalhe='Timeout')
+                emitir('checker_timeout', nivel=logging.ERROR, checker=nome, timeout_s=timeout)
+                resultados.append(ResultadoCheck(
+                    nome=nome, status='Timeout', duracao_s=float(timeout),
+                    erro=f"Excedeu o timeout de {timeout}s"
+                ))
+        return resultados
+
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        sys.stdout = stdout_original
 
-    # --- LIMPEZA PRÉVIA ---
-    logging.info(">>> Executando limpeza preventiva de dados da hora atual...")
-    limpar_historico_hora_atual()
-    logging.info(">>> Limpeza concluída. Iniciando scripts de coleta...\n")
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Orquestrador de verificação do Fiscal BI.")
+    parser.add_argument(
+        '--only', metavar='CHECKER', action='append',
+        help="Executa apenas o checker informado (ex.: check_powerbi). Pode ser repetido."
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=None,
+        help="Sobrescreve o timeout (segundos) de todos os checkers."
+    )
+    parser.add_argument(
+        '--sem-limpeza', action='store_true',
+        help="Não remove os registros da hora atual antes de rodar."
+    )
+    parser.add_argument(
+        '--sem-manutencao', action='store_true',
+        help="Não atualiza o resumo diário nem aplica a retenção de fat_fiscal."
+    )
+    parser.add_argument(
+        '--preparar-fat-fiscal', action='store_true',
+        help="Cria a chave única por ativo/hora em fat_fiscal (uma vez) e encerra."
+    )
+    parser.add_argument(
+        '--agendador', action='store_true',
+        help="Roda continuamente, verificando cada ativo só quando ele vence (ver 'agendador_*' no config.json)."
+    )
+    parser.add_argument(
+        '--executar-agora', action='store_true',
+        help="Pede ao agendador em execução uma rodada completa imediata e encerra."
+    )
+    parser.add_argument(
+        '--verificar-todas', action='store_true',
+        help="Consulta todas as tabelas, inclusive as que continuam no prazo desde a última verificação."
+    )
+    return parser.parse_args(argv)
+
+
+def gravar_metricas():
+    """
+    Acrescenta as métricas da execução em logs/metricas.jsonl e em
+    fat_fiscal_metricas. Falhas só geram aviso: a execução já terminou.
+    """
+    try:
+        metricas.gravar_jsonl()
+    except OSError as e:
+        logging.warning(f"AVISO: Não foi possível gravar o arquivo de métricas: {e}")
+    try:
+        with conexao('dbDrogamais') as conn:
+            if conn is not None:
+                metricas.gravar_banco(conn)
+    except Exception as e:
+        logging.warning(f"AVISO: Não foi possível gravar as métricas no banco: {e}")
+
+
+def executar_rodada(checkers, args, settings, manutencao=True):
+    """
+    Uma rodada do orquestrador: roda os checkers, a manutenção de fat_fiscal
+    (se manutencao) e grava as métricas. Não fecha os pools, para o modo
+    agendador reaproveitar as conexões entre rodadas.
+    Retorna a lista de ResultadoCheck.
+    """
     logging.info("############################################################")
     logging.info("### INICIANDO ORQUESTRADOR DE VERIFICAÇÃO DE DADOS ###")
+    logging.info(f"### Checkers: {', '.join(n for n, _ in checkers)}")
     logging.info("############################################################\n")
 
-    all_success = True 
-    for script in scripts_para_executar:
-        # Verifica se o arquivo existe antes de tentar rodar
-        if (src_dir / script).exists():
-            if not run_script(script):
-                logging.error(f"\nA orquestração foi interrompida devido a um erro no script: {script}")
-                all_success = False
-                break 
+    # Cada execução começa com o cache de MAX() e as métricas vazios
+    cache_probes.limpar()
+    metricas.iniciar_execucao()
+    inicio = time.perf_counter()
+
+    resultados = executar_checkers(checkers, timeout_padrao=args.timeout)
+
+    # Resumo diário a cada execução; partições e retenção uma vez por dia
+    if manutencao and not args.sem_manutencao:
+        completa = datetime.now().hour == settings['hora_manutencao']
+        executar_manutencao(completa=completa)
+
+    metricas.registrar('execucao', time.perf_counter() - inicio,
+                       sucesso=all(r.sucesso for r in resultados))
+    emitir('execucao_fim', id_execucao=metricas.id_execucao,
+           duracao_s=round(time.perf_counter() - inicio, 2),
+           checkers={r.nome: r.status for r in resultados})
+    if settings['gravar_metricas']:
+        gravar_metricas()
+
+    if cache_probes.consultas:
+        logging.info(f"INFO: Cache de probes: {cache_probes.acertos} de {cache_probes.consultas} MAX() reaproveitados.")
+    for tipo, (qtd, total_ms) in sorted(metricas.resumo().items()):
+        logging.info(f"INFO: Métricas [{tipo}]: {qtd} medições, {total_ms / 1000:.2f}s no total.")
+
+    for r in resultados:
+        if r.sucesso:
+            logging.info(f"--- SUCESSO: {r.nome} finalizado em {r.duracao_s}s. ---")
+        else:
+            logging.error(f"!!! {r.status.upper()} em {r.nome} ({r.duracao_s}s): {r.erro} !!!")
 
     logging.info("############################################################")
-    if all_success:
+    if all(r.sucesso for r in resultados):
         logging.info("### ORQUESTRAÇÃO FINALIZADA COM SUCESSO ###")
     else:
         logging.info("### ORQUESTRAÇÃO FINALIZADA COM ERROS ###")
     logging.info("############################################################")
+    return resultados
+
+
+def _aguardar_proxima_rodada(segundos):
+    """Dorme até a próxima rodada; retorna True antes disso se 'executar agora' for pedido."""
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        if consumir_gatilho():
+            return True
+        time.sleep(min(1.0, max(0.0, limite - time.monotonic())))
+    return consumir_gatilho()
+
+
+def executar_agendador(checkers, args, settings):
+    """
+    Modo contínuo: a cada 'agendador_tick_s' roda uma rodada só com o que
+    venceu. A atualidade consulta só as tabelas vencidas pela agenda (ver
+    agendador.AgendaAtivos), que passa a guardar o resultado de cada rodada
+    em memória; os demais checkers rodam a cada
+    'agendador_intervalo_min'. Pools de conexão e token do Power BI ficam
+    abertos entre as rodadas. 'executar agora' força uma rodada completa.
+    Cada rodada toma a trava de execução (TRAVA_EXECUCAO); se outra execução
+    está com ela, a rodada é pulada.
+    Termina com Ctrl+C.
+    """
+    agenda.ativar()
+    intervalo_checker = settings['agendador_intervalo_min'] * 60
+    ultima_execucao = {}
+    ultima_manutencao = None
+    forcar = False
+
+    logging.info(f">>> Modo agendador: rodadas a cada {settings['agendador_tick_s']}s. "
+                 f"Para uma rodada completa agora: python src/main.py --executar-agora")
+    while True:
+        agora = time.monotonic()
+        if forcar:
+            agenda.forcar_todos()
+        devidos = [
+            (nome, timeout) for nome, timeout in checkers
+            if forcar or nome == CHECKER_AGENDADO
+            or agora - ultima_execucao.get(nome, float('-inf')) >= intervalo_checker
+        ]
+
+        # Manutenção no máximo uma vez por hora
+        hora = datetime.now().replace(minute=0, second=0, microsecond=0)
+        with trava_arquivo(TRAVA_EXECUCAO, esperar=False) as obtida:
+            if obtida:
+                try:
+                    executar_rodada(devidos, args, settings, manutencao=hora != ultima_manutencao)
+                except Exception as e:
+                    logging.error(f"!!! ERRO na rodada do agendador: {e} !!!")
+                ultima_manutencao = hora
+                for nome, _ in devidos:
+                    ultima_execucao[nome] = agora
+            else:
+                # O que venceu (e um 'executar agora') continua devido para a próxima rodada
+                logging.warning("AVISO: Outra execução do orquestrador em andamento. Rodada pulada.")
+
+        forcar = _aguardar_proxima_rodada(settings['agendador_tick_s']) or (forcar and not obtida)
+
+
+def executar_verificacao(checkers, args):
+    """Limpeza prévia e execução (única ou no modo agendador) dos checkers."""
+    settings = get_execution_settings()
+    if args.verificar_todas:
+        agenda.forcar_todos()
+
+    # --- LIMPEZA PRÉVIA ---
+    # Com a chave de execução em fat_fiscal, a gravação é um upsert por
+    # ativo/hora e uma reexecução não precisa apagar nada. No agendador a
+    # limpeza apagaria ativos de rodadas anteriores da mesma hora: não roda.
+    if args.agendador:
+        if not chave_execucao_disponivel():
+            logging.warning("AVISO: fat_fiscal sem chave por execução (--preparar-fat-fiscal): "
+                            "um ativo verificado duas vezes na mesma hora terá duas linhas.")
+    elif not args.sem_limpeza:
+        if chave_execucao_disponivel():
+            logging.info(">>> fat_fiscal com chave por execução: reexecuções nesta hora atualizam as linhas existentes.")
+        else:
+            logging.info(">>> Executando limpeza preventiva de dados da hora atual...")
+            limpar_historico_hora_atual()
+            logging.info(">>> Limpeza concluída. Iniciando scripts de coleta...\n")
+
+    try:
+        if args.agendador:
+            try:
+                executar_agendador(checkers, args, settings)
+            except KeyboardInterrupt:
+                logging.info(">>> Agendador encerrado.")
+            return True, False
+        resultados = executar_rodada(checkers, args, settings)
+    finally:
+        fechar_pools()
+
+    return all(r.sucesso for r in resultados), any(r.status == 'Timeout' for r in resultados)
+
+
+def main(argv=None):
+    """
+    Função principal que define os checkers a serem executados.
+    """
+    args = parse_args(argv)
+
+    if args.executar_agora:
+        pedir_execucao_agora()
+        logging.info(">>> Rodada completa pedida ao agendador.")
+        return True, False
+
+    checkers = CHECKERS
+    if args.only:
+        nomes = [n.removesuffix('.py') for n in args.only]
+        conhecidos = dict(CHECKERS)
+        checkers = [(n, conhecidos.get(n, 600)) for n in nomes]
+
+    if args.preparar_fat_fiscal:
+        sucesso = criar_chave_execucao()
+        fechar_pools()
+        return sucesso, False
+
+    if args.agendador:
+        return executar_verificacao(checkers, args)
+    # Uma execução por vez na máquina (exec_main.bat, interface, agendador)
+    with trava_arquivo(TRAVA_EXECUCAO, esperar=False) as obtida:
+        if not obtida:
+            logging.error("!!! Outra execução do orquestrador já está em andamento. Encerrando. !!!")
+            return False, False
+        return executar_verificacao(checkers, args)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sucesso, houve_timeout = main()
+    if houve_timeout:
+        # Threads presas em um checker não podem ser interrompidas; encerra
+        # o processo sem esperar por elas para não travar a próxima execução.
+        logging.shutdown()
+        os._exit(1)
+    sys.exit(0 if sucesso else 1)
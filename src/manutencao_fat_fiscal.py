@@ -0,0 +1,293 @@
+# manutencao_fat_fiscal.py (Partições mensais, retenção/arquivo e resumo diário de fat_fiscal)
+
+import argparse
+import logging
+from datetime import date, timedelta
+
+from database import conexao, get_execution_settings
+
+TABELA_LOG = 'fat_fiscal'
+TABELA_ARQUIVO = 'fat_fiscal_arquivo'
+TABELA_DIARIO = 'fat_fiscal_diario'
+
+# Resumo por ativo e dia, para o dashboard não varrer o histórico bruto
+DDL_DIARIO = f"""
+    CREATE TABLE IF NOT EXISTS `{TABELA_DIARIO}` (
+        data DATE NOT NULL,
+        nome_workspace VARCHAR(255) NOT NULL,
+        nome_ativo VARCHAR(255) NOT NULL,
+        tipo_ativo VARCHAR(100) NOT NULL,
+        pior_status VARCHAR(20) NOT NULL,
+        max_dias_sem_atualizar INT NULL,
+        qtd_execucoes INT NOT NULL,
+        qtd_falhas INT NOT NULL,
+        ultima_data_atualizacao DATE NULL,
+        PRIMARY KEY (data, nome_workspace, nome_ativo, tipo_ativo)
+    )
+"""
+
+# Recalcula o resumo dos dias >= ? a partir das linhas brutas (idempotente)
+QUERY_ROLLUP = f"""
+    INSERT INTO `{TABELA_DIARIO}`
+        (data, nome_workspace, nome_ativo, tipo_ativo, pior_status,
+         max_dias_sem_atualizar, qtd_execucoes, qtd_falhas, ultima_data_atualizacao)
+    SELECT data_insercao, nome_workspace, nome_ativo, tipo_ativo,
+           IF(SUM(status_atualizacao <> 'OK') > 0, 'Failed', 'OK'),
+           MAX(dias_sem_atualizar),
+           COUNT(*),
+           SUM(status_atualizacao <> 'OK'),
+           MAX(data_atualizacao)
+    FROM `{TABELA_LOG}`
+    WHERE data_insercao >= ?
+    GROUP BY data_insercao, nome_workspace, nome_ativo, tipo_ativo
+    ON DUPLICATE KEY UPDATE
+        pior_status = VALUES(pior_status),
+        max_dias_sem_atualizar = VALUES(max_dias_sem_atualizar),
+        qtd_execucoes = VALUES(qtd_execucoes),
+        qtd_falhas = VALUES(qtd_falhas),
+        ultima_data_atualizacao = VALUES(ultima_data_atualizacao)
+"""
+
+# Linhas apagadas por comando quando a tabela não é particionada
+TAMANHO_LOTE_DELETE = 10000
+
+
+def _inicio_mes(dia):
+    return dia.replace(day=1)
+
+def _proximo_mes(dia):
+    return (dia.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def _nome_particao(mes):
+    return f"p{mes:%Y%m}"
+
+def _definicao_particao(mes):
+    """Partição com as linhas do mês (data_insercao < 1º dia do mês seguinte)."""
+    return f"PARTITION {_nome_particao(mes)} VALUES LESS THAN (TO_DAYS('{_proximo_mes(mes):%Y-%m-%d}'))"
+
+
+def listar_particoes(conn, tabela=TABELA_LOG):
+    """
+    Devolve [(nome, limite)] das partições da tabela, em ordem. limite é a
+    data (exclusiva) da partição, ou None para MAXVALUE. Lista vazia se a
+    tabela não for particionada.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = ? AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            (tabela,)
+        )
+        particoes = []
+        for nome, descricao in cursor.fetchall():
+            if descricao is None or str(descricao).upper() == 'MAXVALUE':
+                particoes.append((nome, None))
+            else:
+                # PARTITION_DESCRIPTION guarda o TO_DAYS() do limite
+                particoes.append((nome, date.fromordinal(int(descricao) - 365)))
+        return particoes
+    finally:
+        cursor.close()
+
+
+def particionar(conn, meses_futuros):
+    """
+    Migração única: particiona fat_fiscal por mês de data_insercao.
+    O MariaDB exige que toda chave única contenha a coluna de partição, por
+    isso a PK passa a ser (id_log, data_insercao). Reescreve a tabela inteira:
+    rodar fora do horário de uso do dashboard.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT MIN(data_insercao) FROM `{TABELA_LOG}`")
+        primeiro = cursor.fetchone()[0] or date.today()
+
+        meses, mes = [], _inicio_mes(primeiro)
+        fim = _inicio_mes(date.today())
+        for _ in range(meses_futuros):
+            fim = _proximo_mes(fim)
+        while mes <= fim:
+            meses.append(mes)
+            mes = _proximo_mes(mes)
+
+        definicoes = ",\n            ".join(_definicao_particao(m) for m in meses)
+        logging.info(f"INFO: Particionando '{TABELA_LOG}' em {len(meses)} partições mensais...")
+        cursor.execute(
+            f"""
+            ALTER TABLE `{TABELA_LOG}`
+            DROP PRIMARY KEY, ADD PRIMARY KEY (id_log, data_insercao)
+            PARTITION BY RANGE (TO_DAYS(data_insercao)) (
+            {definicoes},
+            PARTITION pmax VALUES LESS THAN MAXVALUE
+            )
+            """
+        )
+    finally:
+        cursor.close()
+
+
+def garantir_particoes_futuras(conn, particoes, meses_futuros):
+    """
+    Cria as partições dos próximos meses dividindo pmax (que fica vazia,
+    então o REORGANIZE não move linhas).
+    """
+    limites = [limite for _, limite in particoes if limite is not None]
+    if not limites:
+        return
+    alvo = _inicio_mes(date.today())
+    for _ in range(meses_futuros + 1):
+        alvo = _proximo_mes(alvo)
+
+    novos, mes = [], max(limites)
+    while mes < alvo:
+        novos.append(mes)
+        mes = _proximo_mes(mes)
+    if not novos:
+        return
+
+    definicoes = ", ".join(_definicao_particao(m) for m in novos)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"ALTER TABLE `{TABELA_LOG}` REORGANIZE PARTITION pmax INTO "
+            f"({definicoes}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        )
+        logging.info(f"INFO: Partições criadas: {', '.join(_nome_particao(m) for m in novos)}.")
+    finally:
+        cursor.close()
+
+
+def _garantir_arquivo(cursor):
+    """Tabela de arquivo com a mesma estrutura de fat_fiscal, sem partições."""
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS `{TABELA_ARQUIVO}` LIKE `{TABELA_LOG}`")
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = ? AND PARTITION_NAME IS NOT NULL
+        """,
+        (TABELA_ARQUIVO,)
+    )
+    if cursor.fetchone()[0]:
+        cursor.execute(f"ALTER TABLE `{TABELA_ARQUIVO}` REMOVE PARTITIONING")
+
+
+def aplicar_retencao(conn, particoes, retencao_dias, arquivar):
+    """
+    Remove (e, com arquivar, copia antes para fat_fiscal_arquivo) as linhas
+    com data_insercao anterior à janela de retenção. A cópia usa INSERT
+    IGNORE, então repetir após uma falha no meio não duplica o arquivo.
+    Particionada: só partições inteiras saem, com DROP PARTITION (instantâneo).
+    Sem partições: DELETE em lotes de TAMANHO_LOTE_DELETE linhas.
+    Retorna quantas partições/linhas foram removidas.
+    """
+    corte = date.today() - timedelta(days=retencao_dias)
+    cursor = conn.cursor()
+    try:
+        if arquivar:
+            _garantir_arquivo(cursor)
+
+        if particoes:
+            vencidas = [nome for nome, limite in particoes if limite is not None and limite <= corte]
+            for nome in vencidas:
+                if arquivar:
+                    cursor.execute(f"INSERT IGNORE INTO `{TABELA_ARQUIVO}` SELECT * FROM `{TABELA_LOG}` PARTITION ({nome})")
+                    conn.commit()
+                cursor.execute(f"ALTER TABLE `{TABELA_LOG}` DROP PARTITION {nome}")
+                logging.info(f"INFO: Partição '{nome}' removida de '{TABELA_LOG}' (retenção de {retencao_dias} dias).")
+            return len(vencidas)
+
+        if arquivar:
+            cursor.execute(f"INSERT IGNORE INTO `{TABELA_ARQUIVO}` SELECT * FROM `{TABELA_LOG}` WHERE data_insercao < ?", (corte,))
+        removidas = 0
+        while True:
+            cursor.execute(f"DELETE FROM `{TABELA_LOG}` WHERE data_insercao < ? LIMIT {TAMANHO_LOTE_DELETE}", (corte,))
+            conn.commit()
+            removidas += cursor.rowcount
+            if cursor.rowcount < TAMANHO_LOTE_DELETE:
+                break
+        if removidas:
+            logging.info(f"INFO: {removidas} linhas anteriores a {corte} removidas de '{TABELA_LOG}'.")
+        return removidas
+    finally:
+        cursor.close()
+
+
+def atualizar_resumo_diario(conn, desde):
+    """Recalcula fat_fiscal_diario a partir de 'desde' (date). Idempotente."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(DDL_DIARIO)
+        cursor.execute(QUERY_ROLLUP, (desde,))
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def executar_manutencao(particionar_tabela=False, completa=True):
+    """
+    Na ordem segura: resumo diário primeiro (para as linhas que vão expirar
+    já estarem resumidas), depois, se completa, partições futuras e retenção.
+    Falhas são registradas e não interrompem o orquestrador.
+    """
+    settings = get_execution_settings()
+    try:
+        with conexao('dbDrogamais') as conn:
+            if conn is None:
+                logging.error("Não foi possível conectar para a manutenção de fat_fiscal.")
+                return False
+
+            particoes = listar_particoes(conn)
+            if particionar_tabela and not particoes:
+                particionar(conn, settings['particoes_futuras_meses'])
+                particoes = listar_particoes(conn)
+
+            desde = date.today() - timedelta(days=settings['resumo_dias_recalculo'])
+            atualizar_resumo_diario(conn, desde)
+
+            if not completa:
+                return True
+
+            if particoes:
+                garantir_particoes_futuras(conn, particoes, settings['particoes_futuras_meses'])
+                particoes = listar_particoes(conn)
+
+            # retencao_dias = 0 desativa a retenção
+            if settings['retencao_dias']:
+                aplicar_retencao(conn, particoes, settings['retencao_dias'], settings['arquivar_retencao'])
+            return True
+
+    except Exception as e:
+        logging.error(f"ERRO: Falha na manutenção de '{TABELA_LOG}': {e}")
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção de fat_fiscal (partições, retenção e resumo diário).")
+    parser.add_argument(
+        '--particionar', action='store_true',
+        help="Converte fat_fiscal para partições mensais (migração única, reescreve a tabela)."
+    )
+    parser.add_argument(
+        '--resumo-desde', metavar='AAAA-MM-DD', type=date.fromisoformat,
+        help="Recalcula o resumo diário a partir desta data (ex.: carga inicial) e encerra."
+    )
+    args = parser.parse_args(argv)
+
+    if args.resumo_desde:
+        with conexao('dbDrogamais') as conn:
+            if conn is None:
+                logging.error("Não foi possível conectar para recalcular o resumo diário.")
+                return False
+            atualizar_resumo_diario(conn, args.resumo_desde)
+        return True
+    return executar_manutencao(particionar_tabela=args.particionar)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    raise SystemExit(0 if main() else 1)
@@ -0,0 +1,142 @@
+# metricas.py (Tempos de conexão, consulta, API e gravação de cada execução)
+
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+TABELA_METRICAS = 'fat_fiscal_metricas'
+ARQUIVO_METRICAS = Path(__file__).resolve().parent.parent / 'logs' / 'metricas.jsonl'
+
+DDL_METRICAS = f"""
+    CREATE TABLE IF NOT EXISTS `{TABELA_METRICAS}` (
+        id BIGINT NOT NULL AUTO_INCREMENT,
+        id_execucao VARCHAR(40) NOT NULL,
+        data_hora DATETIME(3) NOT NULL,
+        checker VARCHAR(100) NULL,
+        tipo VARCHAR(20) NOT NULL,
+        conn_key VARCHAR(64) NULL,
+        ativo VARCHAR(255) NULL,
+        duracao_ms DOUBLE NOT NULL,
+        linhas INT NULL,
+        tentativas INT NULL,
+        sucesso TINYINT NOT NULL,
+        detalhe VARCHAR(255) NULL,
+        PRIMARY KEY (id),
+        KEY ix_execucao (id_execucao),
+        KEY ix_tipo_data (tipo, data_hora)
+    )
+"""
+
+CAMPOS = ['id_execucao', 'data_hora', 'checker', 'tipo', 'conn_key', 'ativo',
+          'duracao_ms', 'linhas', 'tentativas', 'sucesso', 'detalhe']
+
+# Nome do checker em execução no contexto atual (herdado pelas threads que
+# copiam o contexto, como os workers de probes.executar_probes)
+checker_atual = contextvars.ContextVar('checker_atual', default=None)
+
+
+class ColetorMetricas:
+    """
+    Acumula as medições de uma execução (seguro para várias threads).
+    Tipos usados: 'conexao' (abertura das conexões de um pool), 'espera_pool'
+    (empréstimo de uma conexão do pool), 'consulta', 'api', 'gravacao',
+    'checker', 'execucao'. 'linhas' é a quantidade de linhas lidas/gravadas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registros = []
+        self.id_execucao = None
+
+    def iniciar_execucao(self):
+        """Descarta as medições anteriores e gera um novo id de execução."""
+        with self._lock:
+            self._registros = []
+            self.id_execucao = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        return self.id_execucao
+
+    def registrar(self, tipo, duracao_s, sucesso=True, conn_key=None, ativo=None,
+                  linhas=None, tentativas=None, detalhe=None, checker=None):
+        registro = {
+            'id_execucao': self.id_execucao,
+            'data_hora': datetime.now(),
+            'checker': checker or checker_atual.get(),
+            'tipo': tipo,
+            'conn_key': conn_key,
+            'ativo': ativo,
+            'duracao_ms': round(duracao_s * 1000, 2),
+            'linhas': linhas,
+            'tentativas': tentativas,
+            'sucesso': bool(sucesso),
+            'detalhe': str(detalhe)[:255] if detalhe is not None else None,
+        }
+        with self._lock:
+            self._registros.append(registro)
+
+    @contextmanager
+    def medir(self, tipo, **campos):
+        """
+        Mede o bloco e registra ao sair. O dict entregue pode ser preenchido
+        dentro do bloco (ex.: m['linhas'] = len(resultado), m['sucesso'] = False).
+        Exceções marcam a medição como falha e seguem adiante.
+        """
+        inicio = time.perf_counter()
+        sucesso = True
+        try:
+            yield campos
+        except BaseException as e:
+            sucesso = False
+            campos.setdefault('detalhe', f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            sucesso = campos.pop('sucesso', True) and sucesso
+            self.registrar(tipo, time.perf_counter() - inicio, sucesso=sucesso, **campos)
+
+    def registros(self):
+        with self._lock:
+            return list(self._registros)
+
+    def resumo(self):
+        """{tipo: (quantidade, tempo total em ms)} da execução atual."""
+        resumo = {}
+        for r in self.registros():
+            qtd, total = resumo.get(r['tipo'], (0, 0.0))
+            resumo[r['tipo']] = (qtd + 1, round(total + r['duracao_ms'], 2))
+        return resumo
+
+    def gravar_jsonl(self, caminho=ARQUIVO_METRICAS):
+        """Acrescenta as medições ao arquivo JSON-lines (uma por linha)."""
+        registros = self.registros()
+        if not registros:
+            return 0
+        caminho.parent.mkdir(exist_ok=True)
+        with open(caminho, 'a', encoding='utf-8') as f:
+            for r in registros:
+                f.write(json.dumps({**r, 'data_hora': r['data_hora'].isoformat()}, ensure_ascii=False) + '\n')
+        return len(registros)
+
+    def gravar_banco(self, conn):
+        """Grava as medições em fat_fiscal_metricas (cria a tabela se preciso)."""
+        registros = self.registros()
+        if not registros:
+            return 0
+        cursor = conn.cursor()
+        try:
+            cursor.execute(DDL_METRICAS)
+            cursor.executemany(
+                f"INSERT INTO `{TABELA_METRICAS}` ({', '.join(CAMPOS)}) VALUES ({', '.join(['?'] * len(CAMPOS))})",
+                [tuple(r[c] for c in CAMPOS) for r in registros]
+            )
+            conn.commit()
+            return len(registros)
+        finally:
+            cursor.close()
+
+
+# Coletor único do processo; o orquestrador inicia e grava cada execução
+metricas = ColetorMetricas()
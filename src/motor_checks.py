@@ -0,0 +1,289 @@
+# motor_checks.py (Motor comum dos checkers: tipos de check, cache de probes e gravação em fat_fiscal)
+
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from database import COLUNAS_UPSERT, chave_execucao_disponivel, get_db_connection, insert_dataframe
+from eventos import emitir, resumir_df_log
+from metricas import metricas
+
+# Colunas de fat_fiscal preenchidas pelos checkers, na ordem de gravação
+COLUNAS_LOG = [
+    'nome_workspace', 'nome_ativo', 'tipo_ativo', 'status_atualizacao',
+    'data_atualizacao', 'hora_atualizacao', 'tipo_atualizacao', 'dias_sem_atualizar'
+]
+
+# Status de origem que viram 'OK'; qualquer outro vira 'Failed'
+STATUS_OK_PADRAO = ('Completed', 'Atualizada', 'Sincronizado', 'Sincronizada')
+
+# Último resultado de cada ativo (uma linha por workspace/ativo), mantido junto
+# com fat_fiscal para os visuais que só olham o status atual
+TABELA_ATUAL = 'fat_fiscal_atual'
+
+DDL_ATUAL = f"""
+    CREATE TABLE IF NOT EXISTS `{TABELA_ATUAL}` (
+        nome_workspace VARCHAR(255) NOT NULL,
+        nome_ativo VARCHAR(255) NOT NULL,
+        tipo_ativo VARCHAR(100) NULL,
+        status_atualizacao VARCHAR(20) NULL,
+        data_atualizacao DATE NULL,
+        hora_atualizacao TIME NULL,
+        tipo_atualizacao VARCHAR(50) NULL,
+        dias_sem_atualizar INT NULL,
+        data_verificacao DATETIME NOT NULL,
+        PRIMARY KEY (nome_workspace, nome_ativo)
+    )
+"""
+
+COLUNAS_ATUAL_UPSERT = [c for c in COLUNAS_LOG if c not in ('nome_workspace', 'nome_ativo')] + ['data_verificacao']
+
+_tabela_atual_ok = False
+
+
+class CacheProbes:
+    """
+    Guarda o MAX() de cada chave (conn_key, tabela, coluna) durante uma execução,
+    compartilhado entre os checkers que rodam no mesmo processo.
+    Uma tabela Bronze referenciada pela lista de atualidade e pelos pares
+    Silver/Gold é consultada uma única vez: quem chega primeiro calcula, os
+    demais esperam pelo mesmo resultado (inclusive se for uma exceção).
+    """
+
+    def __init__(self):
+        self._futuros = {}
+        self._lock = threading.Lock()
+        self.consultas = 0
+        self.acertos = 0
+
+    def limpar(self):
+        """Descarta os valores guardados (início de uma nova execução)."""
+        with self._lock:
+            self._futuros.clear()
+            self.consultas = 0
+            self.acertos = 0
+
+    def obter_varios(self, chaves, calcular):
+        """
+        Devolve, alinhado com chaves, o valor bruto ou a exceção de cada uma.
+        calcular(chaves_faltantes) é chamado só com as chaves que ninguém
+        calculou ainda e deve devolver uma lista alinhada de valores ou
+        exceções (como probes.consultar_max_lote). O tempo de cada cálculo
+        entra nas métricas da execução como 'consulta'.
+        """
+        proprias, futuros = [], []
+        with self._lock:
+            for chave in chaves:
+                futuro = self._futuros.get(chave)
+                if futuro is None:
+                    futuro = self._futuros[chave] = Future()
+                    proprias.append((chave, futuro))
+                else:
+                    self.acertos += 1
+                futuros.append(futuro)
+            self.consultas += len(chaves)
+
+        if proprias:
+            chaves_proprias = [chave for chave, _ in proprias]
+            ativo = chaves_proprias[0][1] if len(chaves_proprias) == 1 else f"lote de {len(chaves_proprias)}"
+            with metricas.medir('consulta', conn_key=chaves_proprias[0][0], ativo=ativo) as medicao:
+                try:
+                    valores = calcular(chaves_proprias)
+                except Exception as e:
+                    valores = [e] * len(proprias)
+                erros = [v for v in valores if isinstance(v, Exception)]
+                # Cada MAX() que respondeu devolve uma linha
+                medicao['linhas'] = len(valores) - len(erros)
+                if erros:
+                    medicao['sucesso'] = len(erros) < len(valores)
+                    medicao['detalhe'] = f"{len(erros)} erro(s): {erros[0]}"
+            for (_, futuro), valor in zip(proprias, valores):
+                futuro.set_result(valor)
+
+        return [futuro.result() for futuro in futuros]
+
+    def obter(self, chave, calcular):
+        """Como obter_varios para uma única chave; levanta a exceção guardada."""
+        def _calcular(_):
+            try:
+                return [calcular()]
+            except Exception as e:
+                return [e]
+
+        valor = self.obter_varios([chave], _calcular)[0]
+        if isinstance(valor, Exception):
+            raise valor
+        return valor
+
+
+# Cache único do processo; o orquestrador limpa no início de cada execução
+cache_probes = CacheProbes()
+
+
+@dataclass
+class TipoCheck:
+    """
+    Um tipo de check plugável no motor.
+    coletar() devolve os registros de log (lista de dicts ou DataFrame) com
+    as colunas de COLUNAS_LOG, exceto hora_atualizacao, e data_atualizacao
+    como datetime; o motor cuida da formatação e da gravação.
+    """
+    nome: str
+    titulo: str
+    coletar: Callable
+    status_ok: tuple = STATUS_OK_PADRAO
+
+
+def _separar_data_hora(datas):
+    """
+    Devolve (datas 'YYYY-MM-DD', horas 'HH:MM:SS') da coluna inteira, com
+    None nos nulos. np.datetime_as_string formata tudo em C como
+    'YYYY-MM-DDTHH:MM:SS'; data e hora são fatias de largura fixa desse texto
+    (bem mais rápido que dt.strftime, que formata elemento a elemento).
+    """
+    texto = np.datetime_as_string(datas.to_numpy(dtype='datetime64[s]'), unit='s').astype('U19')
+    data = texto.astype('U10').astype(object)
+    hora = texto.view('U1').reshape(-1, 19)[:, 11:].copy().view('U8').ravel().astype(object)
+
+    vazias = datas.isna().to_numpy()
+    data[vazias] = None
+    hora[vazias] = None
+    return data, hora
+
+
+def montar_df_log(registros, status_ok=STATUS_OK_PADRAO):
+    """
+    Converte os registros de um check nas linhas de fat_fiscal:
+    data_atualizacao vira data (YYYY-MM-DD) + hora (HH:MM:SS) e o status é
+    simplificado para 'OK' ou 'Failed'.
+    Tudo é feito sobre a coluna inteira (sem .apply linha a linha), então o
+    custo não cresce com laços Python quando há milhares de registros.
+    """
+    df = pd.DataFrame(registros)
+    datas = pd.to_datetime(df['data_atualizacao'], errors='coerce')
+    if datas.dt.tz is not None:
+        datas = datas.dt.tz_localize(None)
+
+    df['data_atualizacao'], df['hora_atualizacao'] = _separar_data_hora(datas)
+
+    df['status_atualizacao'] = np.where(df['status_atualizacao'].isin(status_ok), 'OK', 'Failed')
+
+    # Inteiro anulável: evita que um único None transforme a coluna em float
+    df['dias_sem_atualizar'] = pd.to_numeric(df['dias_sem_atualizar'], errors='coerce').astype('Int64')
+
+    # data_verificacao só vem nas linhas repetidas sem consulta (ver montar_df_atual)
+    colunas = COLUNAS_LOG + ['data_verificacao'] if 'data_verificacao' in df else COLUNAS_LOG
+    return df.reindex(columns=colunas)
+
+
+def montar_df_atual(df, agora=None):
+    """
+    Linhas de fat_fiscal_atual: as de fat_fiscal com data_verificacao. Uma
+    linha repetida sem consultar o ativo (check_tables_timestamp.log_mantido)
+    mantém a data_verificacao da última consulta; as demais recebem agora.
+    """
+    agora = agora or datetime.now()
+    if 'data_verificacao' not in df:
+        return df.assign(data_verificacao=agora)
+    return df.assign(data_verificacao=pd.to_datetime(df['data_verificacao']).fillna(agora))
+
+
+def _garantir_tabela_atual(conn):
+    """Cria fat_fiscal_atual na primeira gravação do processo."""
+    global _tabela_atual_ok
+    if _tabela_atual_ok:
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute(DDL_ATUAL)
+        _tabela_atual_ok = True
+    finally:
+        cursor.close()
+
+
+def gravar_logs(df):
+    """
+    Insere as linhas em fat_fiscal (upsert por ativo e hora de execução,
+    se a tabela já tiver a chave; ver database.criar_chave_execucao) e
+    atualiza fat_fiscal_atual na mesma transação. Sem conexão com o banco de
+    logs o checker termina com sys.exit(1), para o orquestrador registrar a falha.
+    """
+    conn_log = get_db_connection(config_key='dbDrogamais')
+    if conn_log is None:
+        print("ERRO CRÍTICO: Não foi possível conectar ao banco de LOGS (dbDrogamais). Logs não inseridos.")
+        sys.exit(1)
+    try:
+        # Com a chave de execução, reexecutar na mesma hora atualiza as linhas
+        ao_duplicar = COLUNAS_UPSERT if chave_execucao_disponivel() else None
+
+        atual = montar_df_atual(df)
+        df = df.reindex(columns=COLUNAS_LOG)
+        try:
+            # Antes da transação: o CREATE TABLE faz commit implícito
+            _garantir_tabela_atual(conn_log)
+        except Exception as e:
+            print(f"AVISO: Falha ao criar '{TABELA_ATUAL}': {e}. Gravando apenas fat_fiscal.")
+            return insert_dataframe(conn_log, df, "fat_fiscal", ao_duplicar=ao_duplicar)
+
+        # Se o próprio histórico falhar não há o que repetir (insert_dataframe já desfez)
+        if not insert_dataframe(conn_log, df, "fat_fiscal", ao_duplicar=ao_duplicar, commit=False):
+            print("ERRO: Falha ao gravar os logs em fat_fiscal.")
+            return False
+        if insert_dataframe(conn_log, atual, TABELA_ATUAL, ao_duplicar=COLUNAS_ATUAL_UPSERT, commit=False):
+            conn_log.commit()
+            return True
+        conn_log.rollback()
+
+        # O histórico não pode se perder por causa do snapshot: grava só fat_fiscal
+        print(f"AVISO: Falha ao atualizar '{TABELA_ATUAL}'. Gravando apenas fat_fiscal.")
+        return insert_dataframe(conn_log, df, "fat_fiscal", ao_duplicar=ao_duplicar)
+    finally:
+        conn_log.close()
+
+
+def executar_check(tipo):
+    """
+    Roda um tipo de check do início ao fim: coleta, monta as linhas de log
+    e grava em fat_fiscal. Retorna True se houve gravação.
+    Em vez de imprimir as linhas, emite eventos: início, resumo por status e
+    tipo de ativo (com os primeiros ativos em falha) e fim.
+    """
+    print("="*50)
+    print(f"--- INICIANDO {tipo.titulo} ---")
+    print("="*50)
+
+    inicio = time.perf_counter()
+    gravado = False
+    emitir('check_inicio', tipo=tipo.nome)
+    try:
+        registros = tipo.coletar()
+        if registros is None or len(registros) == 0:
+            print("AVISO: Nenhum log foi gerado.")
+            return False
+
+        df_para_inserir = montar_df_log(registros, tipo.status_ok)
+
+        resumo = resumir_df_log(df_para_inserir)
+        emitir('check_resumo', tipo=tipo.nome, coleta_s=round(time.perf_counter() - inicio, 2), **resumo)
+        print(f"INFO: {resumo['linhas']} linhas a gravar: {resumo['ok']} OK, {resumo['falhas']} Failed.")
+
+        gravado = gravar_logs(df_para_inserir)
+        return gravado
+
+    except Exception as e:
+        print(f"ERRO CRÍTICO: Falha no processo principal de {tipo.nome}: {e}")
+        emitir('check_erro', nivel=logging.ERROR, tipo=tipo.nome, erro=str(e))
+        return False
+
+    finally:
+        emitir('check_fim', tipo=tipo.nome, gravado=bool(gravado),
+               duracao_s=round(time.perf_counter() - inicio, 2))
+        print(f"\n--- PROCESSO {tipo.nome.upper()} FINALIZADO. ---\n")
@@ -0,0 +1,244 @@
+# plano_probes.py (Escolha da estratégia de MAX() com base em índices e EXPLAIN)
+
+import logging
+from datetime import datetime, timedelta
+
+from database import EXECUCAO_PADRAO, get_db_connection
+
+TABELA_PLANO = 'fiscal_plano_probe'
+
+DDL_PLANO = f"""
+    CREATE TABLE IF NOT EXISTS `{TABELA_PLANO}` (
+        conn_key VARCHAR(64) NOT NULL,
+        nome_ativo VARCHAR(255) NOT NULL,
+        coluna_referencia VARCHAR(255) NOT NULL,
+        classificacao VARCHAR(20) NOT NULL,
+        estrategia VARCHAR(20) NOT NULL,
+        indice VARCHAR(255) NULL,
+        coluna_pk VARCHAR(255) NULL,
+        linhas_estimadas BIGINT NULL,
+        data_plano DATETIME NOT NULL,
+        PRIMARY KEY (conn_key, nome_ativo)
+    )
+"""
+
+# Estratégias possíveis para obter a data mais recente de uma tabela
+ESTRATEGIA_MAX = 'max'                  # SELECT MAX(col): instantâneo com índice
+ESTRATEGIA_PK_DESC = 'pk_desc'          # MAX(col) só nas últimas N linhas pela PK
+ESTRATEGIA_UPDATE_TIME = 'update_time'  # information_schema.TABLES.UPDATE_TIME
+
+ESTRATEGIAS_SCAN = (ESTRATEGIA_MAX, ESTRATEGIA_PK_DESC, ESTRATEGIA_UPDATE_TIME)
+
+
+def validar_estrategia_scan(estrategia):
+    """
+    Devolve a 'estrategia_scan' configurada se ela for uma de ESTRATEGIAS_SCAN;
+    senão avisa e usa o padrão, em vez de deixar o valor chegar ao probe.
+    """
+    if estrategia in ESTRATEGIAS_SCAN:
+        return estrategia
+    padrao = EXECUCAO_PADRAO['estrategia_scan']
+    logging.warning(
+        f"AVISO: 'estrategia_scan' inválida ({estrategia!r}). Opções: {', '.join(ESTRATEGIAS_SCAN)}. Usando '{padrao}'."
+    )
+    return padrao
+
+
+def inspecionar_indices(conn, table_name):
+    """
+    Retorna {nome_indice: [colunas na ordem do índice]} da tabela no banco
+    atual, a partir de information_schema.STATISTICS.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT INDEX_NAME, COLUMN_NAME
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = ?
+            ORDER BY INDEX_NAME, SEQ_IN_INDEX
+            """,
+            (table_name,)
+        )
+        indices = {}
+        for index_name, column_name in cursor.fetchall():
+            indices.setdefault(index_name, []).append(column_name)
+        return indices
+    finally:
+        cursor.close()
+
+
+def explicar_max(conn, table_name, date_column):
+    """
+    Roda EXPLAIN do SELECT MAX(col) e devolve (resolvido_por_indice, linhas_estimadas).
+    'Select tables optimized away' indica que o MAX é lido direto do índice.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"EXPLAIN SELECT MAX(`{date_column}`) FROM `{table_name}`")
+        colunas = [c[0].lower() for c in cursor.description]
+        linha = dict(zip(colunas, cursor.fetchone() or []))
+    finally:
+        cursor.close()
+
+    extra = (linha.get('extra') or '').lower()
+    otimizado = 'optimized away' in extra
+    linhas = linha.get('rows')
+    return otimizado, int(linhas) if linhas is not None else None
+
+
+def planejar_tabela(conn, table_name, date_column, settings):
+    """
+    Classifica o probe da tabela como 'indice' ou 'scan' e escolhe a estratégia.
+    Scans pequenos (abaixo de 'custo_max_linhas') continuam usando MAX();
+    os grandes usam a estratégia configurada em 'estrategia_scan'.
+    """
+    indices = inspecionar_indices(conn, table_name)
+    otimizado, linhas_estimadas = explicar_max(conn, table_name, date_column)
+
+    indice_lider = next(
+        (nome for nome, cols in indices.items() if cols and cols[0].lower() == date_column.lower()),
+        None
+    )
+    pk = indices.get('PRIMARY', [])
+    coluna_pk = pk[0] if len(pk) == 1 else None
+
+    plano = {
+        'nome_ativo': table_name,
+        'coluna_referencia': date_column,
+        'classificacao': 'indice' if (otimizado or indice_lider) else 'scan',
+        'estrategia': ESTRATEGIA_MAX,
+        'indice': indice_lider,
+        'coluna_pk': coluna_pk,
+        'linhas_estimadas': linhas_estimadas,
+    }
+
+    if plano['classificacao'] == 'scan' and (linhas_estimadas or 0) >= settings['custo_max_linhas']:
+        estrategia = settings['estrategia_scan']
+        if estrategia == ESTRATEGIA_PK_DESC and coluna_pk is None:
+            # Sem PK simples não há como limitar pelas últimas linhas
+            estrategia = ESTRATEGIA_UPDATE_TIME
+        plano['estrategia'] = estrategia
+
+    return plano
+
+
+def carregar_planos(conn_log, validade_horas):
+    """Lê os planos gravados que ainda estão dentro da validade."""
+    limite = datetime.now() - timedelta(hours=validade_horas)
+    cursor = conn_log.cursor()
+    try:
+        cursor.execute(DDL_PLANO)
+        cursor.execute(
+            f"""
+            SELECT conn_key, nome_ativo, coluna_referencia, classificacao, estrategia,
+                   indice, coluna_pk, linhas_estimadas
+            FROM `{TABELA_PLANO}`
+            WHERE data_plano >= ?
+            """,
+            (limite,)
+        )
+        colunas = [c[0] for c in cursor.description]
+        return {
+            (row['conn_key'], row['nome_ativo']): row
+            for row in (dict(zip(colunas, r)) for r in cursor.fetchall())
+        }
+    finally:
+        cursor.close()
+
+
+def gravar_planos(conn_log, planos):
+    """Grava (ou substitui) o plano de cada ativo na tabela de planos."""
+    if not planos:
+        return
+    agora = datetime.now()
+    cursor = conn_log.cursor()
+    try:
+        cursor.executemany(
+            f"""
+            INSERT INTO `{TABELA_PLANO}`
+                (conn_key, nome_ativo, coluna_referencia, classificacao, estrategia,
+                 indice, coluna_pk, linhas_estimadas, data_plano)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON DUPLICATE KEY UPDATE
+                coluna_referencia = VALUES(coluna_referencia),
+                classificacao = VALUES(classificacao),
+                estrategia = VALUES(estrategia),
+                indice = VALUES(indice),
+                coluna_pk = VALUES(coluna_pk),
+                linhas_estimadas = VALUES(linhas_estimadas),
+                data_plano = VALUES(data_plano)
+            """,
+            [
+                (p['conn_key'], p['nome_ativo'], p['coluna_referencia'], p['classificacao'],
+                 p['estrategia'], p['indice'], p['coluna_pk'], p['linhas_estimadas'], agora)
+                for p in planos
+            ]
+        )
+        conn_log.commit()
+    finally:
+        cursor.close()
+
+
+def obter_planos(tabelas, settings):
+    """
+    Devolve {(conn_key, nome_ativo): plano} para as tabelas informadas.
+    Planos ainda válidos são reaproveitados; os demais são recalculados
+    (STATISTICS + EXPLAIN) e gravados. Em caso de falha, a tabela fica sem
+    plano e o checker usa o MAX() simples.
+    """
+    conn_log = get_db_connection('dbDrogamais')
+    if conn_log is None:
+        logging.warning("AVISO: Sem conexão para ler os planos de probe. Usando MAX() simples.")
+        return {}
+
+    settings = {**settings, 'estrategia_scan': validar_estrategia_scan(settings['estrategia_scan'])}
+    conns = {}
+    try:
+        try:
+            planos = carregar_planos(conn_log, settings['validade_plano_horas'])
+        except Exception as e:
+            logging.warning(f"AVISO: Não foi possível ler '{TABELA_PLANO}': {e}")
+            planos = {}
+
+        novos = []
+        for tabela in tabelas:
+            chave = (tabela['conn_key'], tabela['nome'])
+            plano = planos.get(chave)
+            # Planos gravados com uma estratégia desconhecida são refeitos
+            if plano and plano['coluna_referencia'] == tabela['coluna'] and plano['estrategia'] in ESTRATEGIAS_SCAN:
+                continue
+
+            if tabela['conn_key'] not in conns:
+                conns[tabela['conn_key']] = get_db_connection(tabela['conn_key'])
+            conn = conns[tabela['conn_key']]
+            if conn is None:
+                continue
+
+            try:
+                plano = planejar_tabela(conn, tabela['nome'], tabela['coluna'], settings)
+            except Exception as e:
+                logging.warning(f"AVISO: Falha ao planejar o probe de '{tabela['nome']}': {e}")
+                continue
+
+            plano['conn_key'] = tabela['conn_key']
+            planos[chave] = plano
+            novos.append(plano)
+
+        try:
+            gravar_planos(conn_log, novos)
+        except Exception as e:
+            logging.warning(f"AVISO: Não foi possível gravar '{TABELA_PLANO}': {e}")
+
+        for plano in novos:
+            logging.info(
+                f"PLANO: '{plano['nome_ativo']}' -> {plano['classificacao']} / {plano['estrategia']} "
+                f"(~{plano['linhas_estimadas']} linhas, índice: {plano['indice'] or '-'})"
+            )
+        return planos
+
+    finally:
+        for conn in conns.values():
+            if conn:
+                conn.close()
+        conn_log.close()
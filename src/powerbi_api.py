@@ -0,0 +1,218 @@
+# powerbi_api.py (Cliente HTTP da API do Power BI: sessão keep-alive, retry e coleta concorrente)
+
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metricas import metricas
+
+API_BASE_PADRAO = "https://api.powerbi.com/v1.0/myorg"
+
+
+def criar_sessao(max_conexoes=8):
+    """
+    Cria uma requests.Session que reaproveita as conexões TCP/TLS (keep-alive)
+    com até max_conexoes conexões simultâneas por host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_conexoes, pool_maxsize=max_conexoes)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _espera_retry_after(response, padrao):
+    """Lê o cabeçalho Retry-After (em segundos) de uma resposta 429/503."""
+    valor = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(valor))
+    except (TypeError, ValueError):
+        return padrao
+
+
+def requisitar_json(session, url, headers, timeout=30, max_tentativas=4, etag=None):
+    """
+    GET com timeout e novas tentativas.
+    - 429/503: espera o tempo pedido em Retry-After antes de tentar de novo.
+    - 5xx e falhas de rede: backoff exponencial (1s, 2s, 4s...).
+    Erros HTTP definitivos (ex.: 401, 404) levantam requests.HTTPError na hora.
+    Com etag, envia If-None-Match e devolve None quando o servidor
+    responde 304 (conteúdo não mudou).
+    """
+    data, _ = requisitar_json_etag(session, url, headers, timeout, max_tentativas, etag)
+    return data
+
+
+def requisitar_json_etag(session, url, headers, timeout=30, max_tentativas=4, etag=None):
+    """
+    Igual a requisitar_json, mas devolve (json ou None se 304, ETag da resposta).
+    Latência total, número de tentativas e status final entram nas métricas.
+    """
+    if etag:
+        headers = {**headers, 'If-None-Match': etag}
+    # Pelo menos uma tentativa, mesmo com 'pbi_max_tentativas' zerado no config
+    max_tentativas = max(1, int(max_tentativas))
+
+    inicio = time.perf_counter()
+    tentativa, status = 0, None
+    try:
+        for tentativa in range(1, max_tentativas + 1):
+            ultima = tentativa == max_tentativas
+            try:
+                response = session.get(url, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if ultima:
+                    raise
+                espera = 2 ** (tentativa - 1)
+                logging.warning(f"AVISO: Falha de rede em {url} ({e}). Nova tentativa em {espera}s.")
+                time.sleep(espera)
+                continue
+
+            status = response.status_code
+            if status in (429, 503) and not ultima:
+                espera = _espera_retry_after(response, 2 ** (tentativa - 1))
+                logging.warning(f"AVISO: HTTP {status} em {url}. Aguardando {espera}s (Retry-After).")
+                time.sleep(espera)
+                continue
+
+            if status >= 500 and not ultima:
+                time.sleep(2 ** (tentativa - 1))
+                continue
+
+            if status == 304:
+                return None, etag
+
+            response.raise_for_status()
+            return response.json(), response.headers.get('ETag')
+    finally:
+        metricas.registrar(
+            'api', time.perf_counter() - inicio, sucesso=status is not None and status < 400,
+            ativo=urlsplit(url).path[-255:], tentativas=tentativa, detalhe=f"HTTP {status}"
+        )
+
+
+def listar_paginado(session, url, headers, **kwargs):
+    """Percorre uma listagem OData seguindo @odata.nextLink e devolve todos os itens."""
+    itens = []
+    while url:
+        data = requisitar_json(session, url, headers, **kwargs)
+        itens.extend(data.get('value', []))
+        url = data.get('@odata.nextLink')
+    return itens
+
+
+def listar_datasets_workspaces(session, workspaces, headers, etags=None, max_concorrencia=8,
+                               api_base=API_BASE_PADRAO, **kwargs):
+    """
+    Lista os datasets de vários workspaces em paralelo.
+    etags é {workspace_id: etag} da descoberta anterior; se o servidor
+    responder 304 para um workspace, seus datasets vêm como None
+    (o chamador reaproveita o que já tinha).
+    Devolve {workspace_id: (datasets ou None, etag)}.
+    """
+    etags = etags or {}
+
+    def _listar(ws):
+        url = f"{api_base}/groups/{ws['id']}/datasets"
+        data, etag = requisitar_json_etag(session, url, headers, etag=etags.get(ws['id']), **kwargs)
+        if data is None:
+            return ws['id'], (None, etag)
+        itens = data.get('value', [])
+        proximo = data.get('@odata.nextLink')
+        if proximo:
+            itens += listar_paginado(session, proximo, headers, **kwargs)
+        return ws['id'], (itens, etag)
+
+    with ThreadPoolExecutor(max_workers=max_concorrencia, thread_name_prefix='pbi') as executor:
+        # Cópia do contexto: as métricas ficam atribuídas ao checker que chamou
+        futures = [executor.submit(contextvars.copy_context().run, _listar, ws) for ws in workspaces]
+        return dict(f.result() for f in futures)
+
+
+def refreshes_novos(historico, ancora):
+    """
+    Refreshes de historico (do mais novo para o mais antigo, como a API
+    devolve) acima de ancora, o requestId do último já gravado.
+    Devolve (novos, achou_ancora).
+    """
+    novos = []
+    for refresh in historico:
+        if ancora is not None and refresh.get('requestId') == ancora:
+            return novos, True
+        novos.append(refresh)
+    return novos, False
+
+
+def buscar_ultimo_refresh(session, dataset, headers, api_base=API_BASE_PADRAO, janela=1, janela_lacuna=None,
+                          ancora=None, **kwargs):
+    """
+    Busca o refresh mais recente de um dataset e devolve o registro no
+    formato usado por check_powerbi (com nome_bi e workspace_name).
+    Falhas viram um registro de erro em vez de exceção.
+
+    Com janela_lacuna, a mesma requisição ($top=janela) também traz o
+    histórico incremental em registro['refreshes']: os refreshes mais novos
+    que ancora. Só quando a âncora não aparece numa página cheia (lacuna:
+    mais de janela refreshes desde a última execução, ou primeira carga) é
+    feita uma segunda requisição com $top=janela_lacuna. Se ela falhar,
+    'refreshes' vem None e a lacuna é tentada de novo na próxima execução.
+    """
+    nome_bi = dataset['nome_bi']
+    url = f"{api_base}/groups/{dataset['workspace_id']}/datasets/{dataset['dataset_id']}/refreshes"
+    try:
+        historico = requisitar_json(session, f"{url}?$top={janela}", headers, **kwargs).get('value', [])
+    except requests.exceptions.RequestException as e:
+        resposta = getattr(e, 'response', None)
+        codigo = resposta.status_code if resposta is not None else 'N/A'
+        return {'workspace_name': dataset['workspace_name'], 'nome_bi': nome_bi,
+                'status': f'Erro na API: {codigo}', 'endTime': None, 'refreshType': 'Erro',
+                'http_status': codigo}
+
+    if not historico:
+        return {'workspace_name': dataset['workspace_name'], 'nome_bi': nome_bi,
+                'status': 'Sem Histórico', 'endTime': None, 'refreshType': 'N/A'}
+
+    registro = dict(historico[0])
+    registro['nome_bi'] = nome_bi
+    registro['workspace_name'] = dataset['workspace_name']
+
+    if janela_lacuna:
+        registro['workspace_id'] = dataset['workspace_id']
+        registro['dataset_id'] = dataset['dataset_id']
+        novos, achou = refreshes_novos(historico, ancora)
+        if not achou and len(historico) >= janela and janela_lacuna > janela:
+            try:
+                historico = requisitar_json(session, f"{url}?$top={janela_lacuna}", headers, **kwargs).get('value', [])
+                novos, _ = refreshes_novos(historico, ancora)
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"AVISO: Histórico de refresh de '{nome_bi}' não pôde ser completado: {e}")
+                novos = None
+        registro['refreshes'] = novos
+    return registro
+
+
+def coletar_refreshes(session, datasets, headers, max_concorrencia=8, api_base=API_BASE_PADRAO,
+                      ancoras=None, **kwargs):
+    """
+    Dispara as consultas de refresh de todos os datasets em paralelo (no
+    máximo max_concorrencia ao mesmo tempo) sobre a mesma sessão e devolve
+    os registros à medida que ficam prontos (gerador).
+    ancoras é {dataset_id: requestId do último refresh gravado}, usado com
+    janela/janela_lacuna (ver buscar_ultimo_refresh).
+    """
+    ancoras = ancoras or {}
+    with ThreadPoolExecutor(max_workers=max_concorrencia, thread_name_prefix='pbi') as executor:
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run, buscar_ultimo_refresh, session, ds, headers, api_base,
+                ancora=ancoras.get(ds['dataset_id']), **kwargs
+            )
+            for ds in datasets
+        ]
+        for future in as_completed(futures):
+            yield future.result()
@@ -0,0 +1,231 @@
+# probes.py (Consultas de MAX() em paralelo sobre as tabelas monitoradas)
+
+import contextvars
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_db_connection, get_execution_settings
+from watermarks import consultar_max_incremental
+
+
+def consultar_max(conn, table_name, date_column, timeout_s=None):
+    """
+    Executa SELECT MAX(coluna) na tabela e retorna o valor bruto do banco
+    (None se a tabela estiver vazia).
+    Com timeout_s, a consulta é abortada pelo próprio MariaDB
+    (max_statement_time) ao estourar o prazo.
+    """
+    query = f"SELECT MAX(`{date_column}`) FROM `{table_name}`"
+    if timeout_s:
+        query = f"SET STATEMENT max_statement_time={float(timeout_s)} FOR {query}"
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query)
+        result = cursor.fetchone()
+    finally:
+        cursor.close()
+    return result[0] if result else None
+
+
+def consultar_max_estrategia(conn, table_name, date_column, plano, timeout_s=None, limite_pk_desc=50000):
+    """
+    Obtém a data mais recente da tabela usando a estratégia do plano
+    (ver plano_probes): 'max', 'pk_desc', 'update_time' ou 'watermark'
+    (ver watermarks.consultar_max_incremental).
+    """
+    estrategia = (plano or {}).get('estrategia', 'max')
+    params = ()
+
+    if estrategia == 'watermark':
+        return consultar_max_incremental(conn, table_name, date_column, plano['watermark'], timeout_s)
+
+    if estrategia == 'pk_desc' and plano.get('coluna_pk'):
+        # Assume que as linhas mais novas têm as maiores PKs: lê só as últimas N
+        query = (
+            f"SELECT MAX(`{date_column}`) FROM ("
+            f"SELECT `{date_column}` FROM `{table_name}` "
+            f"ORDER BY `{plano['coluna_pk']}` DESC LIMIT {int(limite_pk_desc)}"
+            f") AS ultimas_linhas"
+        )
+    elif estrategia == 'update_time':
+        query = (
+            "SELECT UPDATE_TIME FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = ?"
+        )
+        params = (table_name,)
+    else:
+        return consultar_max(conn, table_name, date_column, timeout_s)
+
+    if timeout_s:
+        query = f"SET STATEMENT max_statement_time={float(timeout_s)} FOR {query}"
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        result = cursor.fetchone()
+    finally:
+        cursor.close()
+    valor = result[0] if result else None
+
+    if valor is None and estrategia == 'update_time':
+        # O InnoDB não guarda UPDATE_TIME após reinício do servidor
+        logging.warning(f"AVISO: UPDATE_TIME indisponível para '{table_name}'. Usando MAX().")
+        return consultar_max(conn, table_name, date_column, timeout_s)
+    return valor
+
+
+def consultar_max_lote(conn, itens, timeout_s=None):
+    """
+    Busca o MAX() de várias tabelas do mesmo banco em UMA ida ao servidor:
+        SELECT 0, MAX(col) FROM t0 UNION ALL SELECT 1, MAX(col) FROM t1 ...
+    itens é uma lista de (table_name, date_column).
+    Retorna uma lista alinhada com itens contendo o valor bruto ou a
+    exceção da consulta. Se o lote falhar (ex.: coluna inexistente em uma
+    das tabelas), cada tabela é consultada individualmente, de modo que o
+    erro fica restrito à tabela problemática.
+    """
+    if not itens:
+        return []
+
+    ramos = [
+        f"SELECT {i} AS idx, MAX(`{col}`) AS max_valor FROM `{tabela}`"
+        for i, (tabela, col) in enumerate(itens)
+    ]
+    query = "\nUNION ALL\n".join(ramos)
+    if timeout_s:
+        query = f"SET STATEMENT max_statement_time={float(timeout_s)} FOR {query}"
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query)
+        linhas = cursor.fetchall()
+        valores = [None] * len(itens)
+        for idx, valor in linhas:
+            valores[int(idx)] = valor
+        return valores
+
+    except Exception as e:
+        logging.warning(f"AVISO: Lote de {len(itens)} tabelas falhou ({e}). Consultando tabela a tabela.")
+        # Descarta o estado da consulta que falhou antes de reutilizar a conexão
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+
+    finally:
+        cursor.close()
+
+    resultados = []
+    for tabela, col in itens:
+        try:
+            resultados.append(consultar_max(conn, tabela, col, timeout_s))
+        except Exception as e:
+            resultados.append(e)
+    return resultados
+
+
+def dividir_em_lotes(itens, tamanho_lote):
+    """Divide uma lista em pedaços de no máximo tamanho_lote elementos."""
+    tamanho_lote = max(1, int(tamanho_lote))
+    return [itens[i:i + tamanho_lote] for i in range(0, len(itens), tamanho_lote)]
+
+
+class _SlotsConexao:
+    """
+    Mantém até N conexões abertas por conn_key. Uma conexão do MariaDB não
+    pode ser usada por duas threads ao mesmo tempo, então cada worker pega
+    uma conexão emprestada da fila do seu conn_key e devolve ao terminar.
+    """
+
+    def __init__(self, conexoes_por_conn_key):
+        self._limite = max(1, int(conexoes_por_conn_key))
+        self._filas = {}
+        self._abertas = {}
+        self._todas = []
+        self._falhas = set()
+        self._lock = threading.Lock()
+
+    def pegar(self, conn_key):
+        while True:
+            with self._lock:
+                if conn_key in self._falhas:
+                    return None
+                fila = self._filas.setdefault(conn_key, queue.Queue())
+                abrir_nova = fila.empty() and self._abertas.get(conn_key, 0) < self._limite
+                if abrir_nova:
+                    self._abertas[conn_key] = self._abertas.get(conn_key, 0) + 1
+
+            if abrir_nova:
+                conn = get_db_connection(config_key=conn_key)
+                with self._lock:
+                    if conn is None:
+                        self._abertas[conn_key] -= 1
+                        # Sem nenhuma conexão viva, não tenta reconectar a cada tabela
+                        if self._abertas[conn_key] == 0:
+                            self._falhas.add(conn_key)
+                        return None
+                    self._todas.append(conn)
+                return conn
+
+            try:
+                return fila.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def devolver(self, conn_key, conn):
+        if conn is not None:
+            self._filas[conn_key].put(conn)
+
+    def fechar(self):
+        for conn in self._todas:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def executar_probes(tarefas, max_workers=None, conexoes_por_conn_key=None):
+    """
+    Executa as tarefas em um pool limitado de threads.
+    Cada tarefa é um par (conn_key, funcao), onde funcao(conn) recebe uma
+    conexão exclusiva do conn_key (ou None, se a conexão falhou).
+    Retorna os resultados na mesma ordem das tarefas, de modo que o tempo
+    total acompanha a tabela mais lenta e não a soma de todas.
+    """
+    settings = get_execution_settings()
+    max_workers = max_workers or settings['max_workers']
+    conexoes_por_conn_key = conexoes_por_conn_key or settings['conexoes_por_conn_key']
+
+    if not tarefas:
+        return []
+
+    slots = _SlotsConexao(conexoes_por_conn_key)
+
+    def _rodar(conn_key, funcao):
+        conn = slots.pegar(conn_key)
+        try:
+            return funcao(conn)
+        finally:
+            slots.devolver(conn_key, conn)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='probe') as executor:
+            # Cada tarefa roda numa cópia do contexto de quem chamou, para
+            # preservar o prefixo de log do checker (ver main._StdoutPorThread)
+            futures = [
+                executor.submit(contextvars.copy_context().run, _rodar, conn_key, funcao)
+                for conn_key, funcao in tarefas
+            ]
+            resultados = []
+            for future in futures:
+                try:
+                    resultados.append(future.result())
+                except Exception as e:
+                    logging.error(f"ERRO: Falha inesperada em uma tarefa de probe: {e}")
+                    resultados.append(None)
+            return resultados
+    finally:
+        slots.fechar()
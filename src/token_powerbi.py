@@ -0,0 +1,115 @@
+# token_powerbi.py (Token da API do Power BI com cache MSAL persistido entre execuções)
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import msal
+
+from trava_arquivo import trava_arquivo
+
+SCOPE = ["https://analysis.windows.net/powerbi/api/.default"]
+
+CACHE_DIR = Path(__file__).resolve().parent.parent / 'cache'
+ARQUIVO_CACHE = CACHE_DIR / 'msal_token_cache.bin'
+
+# Renova o token quando faltar menos que isso para expirar (segundos)
+MARGEM_EXPIRACAO_S = 300
+
+# Variável de ambiente alternativa à chave 'token_cache_key' do config.json
+ENV_CHAVE_CACHE = 'FISCAL_TOKEN_CACHE_KEY'
+
+
+def _criar_cifra(chave):
+    """Fernet (cryptography) para criptografar o cache em disco, se houver chave."""
+    if not chave:
+        return None
+    from cryptography.fernet import Fernet
+    return Fernet(chave.encode() if isinstance(chave, str) else chave)
+
+
+class ProvedorToken:
+    """
+    Fornece o token de acesso da API do Power BI.
+    - Em memória: devolve o mesmo token até MARGEM_EXPIRACAO_S antes de expirar.
+    - Em disco: o SerializableTokenCache do MSAL é salvo em ARQUIVO_CACHE,
+      então uma nova execução reaproveita o token ainda válido sem ir ao AAD.
+    - Com chave configurada, o arquivo é criptografado (Fernet).
+    Seguro para uso por várias threads.
+    """
+
+    def __init__(self, pbi_config, arquivo_cache=ARQUIVO_CACHE):
+        self._config = pbi_config
+        self._arquivo = Path(arquivo_cache)
+        self._cifra = _criar_cifra(pbi_config.get('token_cache_key') or os.environ.get(ENV_CHAVE_CACHE))
+        self._lock = threading.Lock()
+        self._token = None
+        self._expira_em = 0.0
+        self._cache = msal.SerializableTokenCache()
+        self._app = msal.ConfidentialClientApplication(
+            pbi_config['client_id'],
+            authority=f"https://login.microsoftonline.com/{pbi_config['tenant_id']}",
+            client_credential=pbi_config['client_secret'],
+            token_cache=self._cache,
+        )
+
+    def _carregar_cache(self):
+        if not self._arquivo.exists():
+            return
+        dados = self._arquivo.read_bytes()
+        try:
+            if self._cifra:
+                dados = self._cifra.decrypt(dados)
+            self._cache.deserialize(dados.decode('utf-8'))
+        except Exception:
+            # Cache corrompido ou chave trocada: ignora e pede um token novo
+            pass
+
+    def _salvar_cache(self):
+        if not self._cache.has_state_changed:
+            return
+        dados = self._cache.serialize().encode('utf-8')
+        if self._cifra:
+            dados = self._cifra.encrypt(dados)
+        tmp = self._arquivo.with_suffix('.tmp')
+        tmp.write_bytes(dados)
+        os.replace(tmp, self._arquivo)
+        self._cache.has_state_changed = False
+
+    def obter_token(self):
+        """Devolve um access_token válido, indo ao AAD apenas quando necessário."""
+        with self._lock:
+            if self._token and time.time() < self._expira_em - MARGEM_EXPIRACAO_S:
+                return self._token
+
+            # Trava entre processos: o orquestrador e o Streamlit não gravam o cache ao mesmo tempo
+            with trava_arquivo(self._arquivo.with_suffix('.lock')):
+                self._carregar_cache()
+                # O MSAL procura primeiro no cache e só chama o AAD se o token
+                # estiver ausente ou perto de expirar
+                result = self._app.acquire_token_for_client(scopes=SCOPE)
+                self._salvar_cache()
+
+            if "access_token" not in result:
+                raise Exception(f"Erro de autenticação no Power BI: {result.get('error_description')}")
+
+            self._token = result['access_token']
+            self._expira_em = time.time() + int(result.get('expires_in', 0))
+            return self._token
+
+
+_provedor = None
+_provedor_lock = threading.Lock()
+
+def obter_provedor(pbi_config):
+    """
+    Provedor único por processo (orquestrador e checkers). A interface não
+    chama a API do Power BI: ela roda o main.py como subprocesso, então o
+    que os processos compartilham é o cache MSAL em disco, não o provedor.
+    """
+    global _provedor
+    with _provedor_lock:
+        if _provedor is None:
+            _provedor = ProvedorToken(pbi_config)
+        return _provedor
@@ -0,0 +1,57 @@
+# trava_arquivo.py (Trava exclusiva entre processos sobre um arquivo .lock)
+
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Uma execução do orquestrador por vez na máquina: main.py (exec_main.bat,
+# agendador a cada rodada) e o botão da interface disputam esta trava
+TRAVA_EXECUCAO = Path(__file__).resolve().parent.parent / 'cache' / 'execucao.lock'
+
+
+@contextmanager
+def trava_arquivo(caminho, esperar=True):
+    """
+    Trava exclusiva (entre processos) sobre o arquivo caminho, criado se
+    preciso. Com esperar=False não bloqueia: entrega False se outro processo
+    já tem a trava, senão True. O sistema operacional libera a trava se o
+    processo morrer, então um arquivo que sobrou não trava nada.
+    """
+    caminho = Path(caminho)
+    caminho.parent.mkdir(exist_ok=True)
+    with open(caminho, 'a+b') as f:
+        if sys.platform == 'win32':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not esperar:
+                        yield False
+                        return
+                    time.sleep(0.1)
+            try:
+                yield True
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if esperar else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def execucao_em_andamento(caminho=TRAVA_EXECUCAO):
+    """True se outro processo está com a trava de execução do orquestrador."""
+    with trava_arquivo(caminho, esperar=False) as obtida:
+        return not obtida
@@ -0,0 +1,202 @@
+# watermarks.py (Último MAX() observado por ativo, para probes incrementais)
+
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+TABELA_WATERMARKS = 'fiscal_watermarks'
+TABELA_HISTORICO = 'fiscal_watermarks_hist'
+
+DDL_WATERMARKS = f"""
+    CREATE TABLE IF NOT EXISTS `{TABELA_WATERMARKS}` (
+        conn_key VARCHAR(64) NOT NULL,
+        nome_ativo VARCHAR(255) NOT NULL,
+        coluna_referencia VARCHAR(255) NOT NULL,
+        ultimo_max DATETIME NULL,
+        data_observacao DATETIME NOT NULL,
+        data_validacao DATETIME NOT NULL,
+        data_mudanca DATETIME NULL,
+        PRIMARY KEY (conn_key, nome_ativo)
+    )
+"""
+
+DDL_HISTORICO = f"""
+    CREATE TABLE IF NOT EXISTS `{TABELA_HISTORICO}` (
+        id BIGINT NOT NULL AUTO_INCREMENT,
+        conn_key VARCHAR(64) NOT NULL,
+        nome_ativo VARCHAR(255) NOT NULL,
+        valor_max DATETIME NOT NULL,
+        data_observacao DATETIME NOT NULL,
+        PRIMARY KEY (id),
+        KEY ix_ativo_data (conn_key, nome_ativo, data_observacao)
+    )
+"""
+
+# Cadência de ingestão por ativo, a partir dos avanços do watermark: intervalo
+# médio e máximo entre cargas e há quanto tempo veio a última. Os ativos mais
+# atrasados em relação à própria cadência vêm primeiro
+QUERY_CADENCIA = f"""
+    SELECT conn_key, nome_ativo,
+           COUNT(*) AS qtd_avancos,
+           AVG(TIMESTAMPDIFF(MINUTE, anterior, valor_max)) / 60 AS horas_entre_cargas,
+           MAX(TIMESTAMPDIFF(MINUTE, anterior, valor_max)) / 60 AS horas_entre_cargas_max,
+           MAX(valor_max) AS ultimo_max,
+           TIMESTAMPDIFF(MINUTE, MAX(valor_max), NOW()) / 60 AS horas_desde_ultima
+    FROM (
+        SELECT conn_key, nome_ativo, valor_max,
+               LAG(valor_max) OVER (PARTITION BY conn_key, nome_ativo ORDER BY valor_max) AS anterior
+        FROM `{TABELA_HISTORICO}`
+        WHERE data_observacao >= NOW() - INTERVAL ? DAY
+    ) h
+    WHERE anterior IS NOT NULL
+    GROUP BY conn_key, nome_ativo
+    ORDER BY horas_desde_ultima / NULLIF(horas_entre_cargas, 0) DESC
+"""
+
+
+def _para_datetime(valor):
+    """Converte o valor bruto do MAX() em datetime (None se vazio/inválido)."""
+    dt = pd.to_datetime(valor, errors='coerce')
+    if pd.isna(dt):
+        return None
+    return dt.tz_localize(None).to_pydatetime() if dt.tzinfo else dt.to_pydatetime()
+
+
+def carregar_watermarks(conn_log):
+    """Devolve {(conn_key, nome_ativo): registro} da tabela de watermarks."""
+    cursor = conn_log.cursor()
+    try:
+        cursor.execute(DDL_WATERMARKS)
+        cursor.execute(DDL_HISTORICO)
+        cursor.execute(
+            f"""
+            SELECT conn_key, nome_ativo, coluna_referencia, ultimo_max, data_validacao
+            FROM `{TABELA_WATERMARKS}`
+            """
+        )
+        colunas = [c[0] for c in cursor.description]
+        return {
+            (row['conn_key'], row['nome_ativo']): row
+            for row in (dict(zip(colunas, r)) for r in cursor.fetchall())
+        }
+    finally:
+        cursor.close()
+
+
+def cadencia_ingestao(conn_log, dias=30):
+    """
+    DataFrame com a cadência de ingestão de cada ativo nos últimos dias,
+    lida só de fiscal_watermarks_hist (sem consultar as tabelas de origem).
+    Um ativo precisa de ao menos dois avanços no período para aparecer.
+    """
+    cursor = conn_log.cursor()
+    try:
+        cursor.execute(DDL_HISTORICO)
+        cursor.execute(QUERY_CADENCIA, (dias,))
+        colunas = [c[0] for c in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=colunas)
+    finally:
+        cursor.close()
+
+
+def watermark_utilizavel(registro, coluna, revalidar_horas, agora=None):
+    """
+    O watermark só é usado se for da mesma coluna, não estiver vazio e a
+    última leitura completa (MAX sem filtro) tiver menos de revalidar_horas.
+    A revalidação periódica corrige o watermark se linhas forem apagadas.
+    """
+    if not registro or registro['ultimo_max'] is None:
+        return False
+    if registro['coluna_referencia'] != coluna:
+        return False
+    agora = agora or datetime.now()
+    return agora - registro['data_validacao'] < timedelta(hours=revalidar_horas)
+
+
+def consultar_max_incremental(conn, table_name, date_column, watermark, timeout_s=None):
+    """
+    Pergunta apenas "existe algo mais novo que o watermark?" com
+    WHERE col > ? LIMIT 1, que para na primeira linha encontrada.
+    Só se existir, calcula o MAX() restrito a essa faixa (pequena).
+    Sem novidades, o próprio watermark é o MAX atual.
+    """
+    prefixo = f"SET STATEMENT max_statement_time={float(timeout_s)} FOR " if timeout_s else ""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"{prefixo}SELECT 1 FROM `{table_name}` WHERE `{date_column}` > ? LIMIT 1",
+            (watermark,)
+        )
+        if cursor.fetchone() is None:
+            return watermark
+
+        cursor.execute(
+            f"{prefixo}SELECT MAX(`{date_column}`) FROM `{table_name}` WHERE `{date_column}` > ?",
+            (watermark,)
+        )
+        result = cursor.fetchone()
+        return result[0] if result and result[0] is not None else watermark
+    finally:
+        cursor.close()
+
+
+def gravar_watermarks(conn_log, observacoes, anteriores):
+    """
+    Atualiza os watermarks com os MAX() observados nesta execução.
+    observacoes: lista de dicts com conn_key, nome_ativo, coluna, valor e
+    completo (True se veio de um MAX sem filtro, que conta como revalidação).
+    Cada avanço do valor também é registrado no histórico.
+    """
+    agora = datetime.now()
+    linhas, historico = [], []
+
+    for obs in observacoes:
+        valor = _para_datetime(obs['valor'])
+        anterior = anteriores.get((obs['conn_key'], obs['nome_ativo']))
+        valor_anterior = anterior['ultimo_max'] if anterior else None
+        mudou = valor is not None and valor != valor_anterior
+
+        validacao = agora if obs['completo'] or not anterior else anterior['data_validacao']
+        linhas.append((
+            obs['conn_key'], obs['nome_ativo'], obs['coluna'], valor,
+            agora, validacao, agora if mudou else None
+        ))
+        if mudou:
+            historico.append((obs['conn_key'], obs['nome_ativo'], valor, agora))
+
+    if not linhas:
+        return
+
+    cursor = conn_log.cursor()
+    try:
+        cursor.executemany(
+            f"""
+            INSERT INTO `{TABELA_WATERMARKS}`
+                (conn_key, nome_ativo, coluna_referencia, ultimo_max,
+                 data_observacao, data_validacao, data_mudanca)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON DUPLICATE KEY UPDATE
+                coluna_referencia = VALUES(coluna_referencia),
+                ultimo_max = VALUES(ultimo_max),
+                data_observacao = VALUES(data_observacao),
+                data_validacao = VALUES(data_validacao),
+                data_mudanca = COALESCE(VALUES(data_mudanca), data_mudanca)
+            """,
+            linhas
+        )
+        if historico:
+            cursor.executemany(
+                f"""
+                INSERT INTO `{TABELA_HISTORICO}` (conn_key, nome_ativo, valor_max, data_observacao)
+                VALUES (?, ?, ?, ?)
+                """,
+                historico
+            )
+        conn_log.commit()
+        logging.info(f"INFO: {len(linhas)} watermarks atualizados ({len(historico)} avançaram).")
+    except Exception:
+        conn_log.rollback()
+        raise
+    finally:
+        cursor.close()
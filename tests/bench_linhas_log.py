@@ -0,0 +1,103 @@
+# Micro-benchmark do montador de linhas de fat_fiscal (motor_checks.montar_df_log)
+# comparado com o processamento antigo, linha a linha com .apply.
+# Executar com: python tests/bench_linhas_log.py [--linhas 50000] [--repeticoes 3]
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from database import parametros_db  # noqa: E402
+from motor_checks import STATUS_OK_PADRAO, montar_df_log  # noqa: E402
+
+
+def montar_df_log_apply(registros, status_ok=STATUS_OK_PADRAO):
+    """Implementação antiga (uma chamada Python por linha), usada como referência."""
+    df = pd.DataFrame(registros)
+    df['data_atualizacao'] = pd.to_datetime(df['data_atualizacao'])
+    df['hora_atualizacao'] = df['data_atualizacao'].apply(
+        lambda x: x.strftime('%H:%M:%S') if pd.notna(x) else None
+    )
+    df['data_atualizacao'] = df['data_atualizacao'].apply(
+        lambda x: x.strftime('%Y-%m-%d') if pd.notna(x) else None
+    )
+    for col in ['data_atualizacao', 'hora_atualizacao']:
+        df[col] = df[col].fillna(pd.NA).replace({pd.NaT: None})
+    mapa = dict.fromkeys(status_ok, 'OK')
+    df['status_atualizacao'] = df['status_atualizacao'].apply(lambda x: mapa.get(x, 'Failed'))
+    df = df.reindex(columns=[
+        'nome_workspace', 'nome_ativo', 'tipo_ativo', 'status_atualizacao',
+        'data_atualizacao', 'hora_atualizacao', 'tipo_atualizacao', 'dias_sem_atualizar'
+    ])
+    return list(df.itertuples(index=False, name=None))
+
+
+def gerar_registros(n, seed=42):
+    """Registros no formato dos checkers, com ~10% de datas e dias nulos."""
+    rng = np.random.default_rng(seed)
+    base = pd.Timestamp('2026-01-01')
+    datas = base + pd.to_timedelta(rng.integers(0, 300 * 86400, n), unit='s')
+    nulos = rng.random(n) < 0.1
+    status = rng.choice(['Atualizada', 'Desatualizada', 'Completed', 'Failed', 'Sem Histórico'], n)
+    dias = rng.integers(0, 60, n)
+    return [
+        {
+            'nome_workspace': 'dbDrogamais',
+            'nome_ativo': f'ativo_{i}',
+            'tipo_ativo': 'TABELA BRONZE',
+            'status_atualizacao': status[i],
+            'data_atualizacao': None if nulos[i] else datas[i].to_pydatetime(),
+            'tipo_atualizacao': 'Scheduled',
+            'dias_sem_atualizar': None if nulos[i] else int(dias[i]),
+        }
+        for i in range(n)
+    ]
+
+
+def cronometrar(funcao, repeticoes):
+    melhor, resultado = float('inf'), None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def normalizar(linhas):
+    """Iguala a representação dos nulos e de dias (float x int) para comparar."""
+    return [
+        tuple(None if (v is None or (isinstance(v, float) and np.isnan(v)))
+              else int(v) if isinstance(v, (float, np.floating)) else v
+              for v in linha)
+        for linha in linhas
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--linhas', type=int, default=50000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    registros = gerar_registros(args.linhas)
+
+    t_antigo, antigo = cronometrar(lambda: montar_df_log_apply(registros), args.repeticoes)
+    t_novo, novo = cronometrar(lambda: parametros_db(montar_df_log(registros)), args.repeticoes)
+
+    if normalizar(antigo) != normalizar(novo):
+        print("ERRO: As duas implementações geraram linhas diferentes.")
+        sys.exit(1)
+
+    print(f"{args.linhas} linhas (melhor de {args.repeticoes}):")
+    print(f"  .apply linha a linha: {t_antigo * 1000:9.1f} ms")
+    print(f"  vetorizado:           {t_novo * 1000:9.1f} ms")
+    print(f"  ganho:                {t_antigo / t_novo:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# Testes da agenda de ativos (tabelas no prazo puladas até a próxima virada do corte).
+# Executar com: python -m pytest tests/test_agendador.py
+
+import sys
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('mariadb')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from agendador import AgendaAtivos  # noqa: E402
+from check_tables_timestamp import _virada, calcular_data_limite, log_mantido, proximo_corte_apos  # noqa: E402
+from motor_checks import montar_df_atual, montar_df_log  # noqa: E402
+
+AGORA = datetime(2026, 3, 4, 10, 0)
+
+
+def _item(nome, dias, hora='00:00'):
+    return ({'conn_key': 'dbDrogamais', 'workspace_log': 'dbDrogamais', 'nome': nome, 'tipo': 'TABELA BRONZE'}, dias, hora)
+
+
+@pytest.mark.parametrize('dias, hora', [(0, time(0)), (0, time(8, 30)), (1, time(0)), (3, time(6)), (60, time(0))])
+@pytest.mark.parametrize('data_ref', [datetime(2026, 3, 4, 7, 15), datetime(2026, 3, 4, 8, 30), datetime(2026, 3, 3, 0, 0)])
+def test_proximo_corte_coincide_com_calcular_data_limite(dias, hora, data_ref):
+    virada = proximo_corte_apos(data_ref, dias, hora)
+    assert calcular_data_limite(virada, dias, hora) > data_ref
+    assert calcular_data_limite(virada - timedelta(seconds=1), dias, hora) <= data_ref
+
+
+def test_atualizada_pula_ate_a_virada_e_falha_volta_antes():
+    agenda = AgendaAtivos()
+    agenda.configurar(reprobe_falha_min=15, intervalo_max_h=24)
+    d0, d60, falha = _item('d0', 0, '08:00'), _item('d60', 60), _item('falha', 0)
+    itens = [d0, d60, falha]
+
+    # Sem histórico: todas vencidas
+    assert agenda.selecionar(itens, _virada, AGORA) == [0, 1, 2]
+
+    agenda.carregar({
+        ('dbDrogamais', 'd0', 'TABELA BRONZE'): {'verificado_em': AGORA, 'status': 'Atualizada',
+                                                 'data_atualizacao': datetime(2026, 3, 4, 9, 0)},
+        ('dbDrogamais', 'd60', 'TABELA BRONZE'): {'verificado_em': AGORA, 'status': 'Atualizada',
+                                                  'data_atualizacao': datetime(2026, 3, 4, 0, 0)},
+        ('dbDrogamais', 'falha', 'TABELA BRONZE'): {'verificado_em': AGORA, 'status': 'Failed',
+                                                    'data_atualizacao': None},
+    })
+
+    def _nomes(agora):
+        return [itens[pos][0]['nome'] for pos in agenda.selecionar(itens, _virada, agora)]
+
+    assert _nomes(AGORA + timedelta(minutes=10)) == []
+    assert _nomes(AGORA + timedelta(minutes=15)) == ['falha']
+    # D-0 às 08:00 atualizada às 09:00 só pode vencer no dia seguinte às 08:00
+    assert _nomes(datetime(2026, 3, 5, 7, 59)) == ['falha']
+    assert _nomes(datetime(2026, 3, 5, 8, 0)) == ['d0', 'falha']
+    # D-60 é reconfirmada pelo limite de 24h sem consulta
+    assert _nomes(AGORA + timedelta(hours=24)) == ['d0', 'd60', 'falha']
+
+    agenda.forcar_todos()
+    assert agenda.selecionar(itens, _virada, AGORA) == [0, 1, 2]
+
+
+def test_tabela_pulada_repete_o_ultimo_resultado():
+    tabela = _item('d0', 0)[0]
+    estado = {'verificado_em': AGORA, 'status': 'Atualizada', 'data_atualizacao': datetime(2026, 3, 3, 8, 0)}
+
+    log = log_mantido(tabela, estado, AGORA)
+
+    assert log['status_atualizacao'] == 'Atualizada'
+    assert log['data_atualizacao'] == datetime(2026, 3, 3, 8, 0)
+    assert log['dias_sem_atualizar'] == 1 and log['horas_sem_atualizar'] == 26.0
+
+
+def test_tabela_pulada_vence_pelo_intervalo_maximo():
+    item = _item('d60', 60)
+    chave = ('dbDrogamais', 'd60', 'TABELA BRONZE')
+    estado = {'verificado_em': AGORA, 'status': 'Atualizada', 'data_atualizacao': datetime(2026, 3, 4, 0, 0)}
+
+    # Execuções de hora em hora: cada uma lê fat_fiscal_atual e repete a D-60
+    # sem consultá-la; a linha regravada mantém a data_verificacao original
+    for horas in range(1, 24):
+        agora = AGORA + timedelta(hours=horas)
+        agenda = AgendaAtivos()
+        agenda.configurar(reprobe_falha_min=15, intervalo_max_h=24)
+        agenda.carregar({chave: estado})
+        assert agenda.selecionar([item], _virada, agora) == []
+
+        df = montar_df_log([log_mantido(item[0], agenda.estado(item[0]), agora)])
+        linha = montar_df_atual(df, agora).iloc[0]
+        estado = {'verificado_em': linha['data_verificacao'].to_pydatetime(),
+                  'status': 'Atualizada', 'data_atualizacao': estado['data_atualizacao']}
+        assert estado['verificado_em'] == AGORA
+
+    agenda = AgendaAtivos()
+    agenda.configurar(reprobe_falha_min=15, intervalo_max_h=24)
+    agenda.carregar({chave: estado})
+    assert agenda.selecionar([item], _virada, AGORA + timedelta(hours=24)) == [0]
+
+
+def test_linhas_consultadas_recebem_a_hora_da_verificacao():
+    mantido = log_mantido(_item('d60', 60)[0], {'verificado_em': AGORA, 'status': 'Atualizada',
+                                                 'data_atualizacao': datetime(2026, 3, 4, 0, 0)}, AGORA)
+    consultado = {**mantido, 'nome_ativo': 'd0'}
+    del consultado['data_verificacao']
+    agora = AGORA + timedelta(hours=5)
+
+    atual = montar_df_atual(montar_df_log([mantido, consultado]), agora)
+
+    assert list(atual['data_verificacao']) == [AGORA, agora]
@@ -0,0 +1,47 @@
+# Testes do salvamento por diferença do editor de dim_tabelas_fiscal.
+# Executar com: python -m pytest tests/test_db_manager.py
+
+import sys
+from datetime import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('streamlit')
+pytest.importorskip('mariadb')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'interface'))
+
+from modules.db_manager import calcular_alteracoes  # noqa: E402
+
+
+def _carregado():
+    return pd.DataFrame({
+        'nome_ativo': ['a', 'b', 'c'], 'tipo_ativo': ['TABELA'] * 3, 'coluna_referencia': ['dt'] * 3,
+        'conn_key': ['dbDrogamais'] * 3, 'workspace_log': ['dbDrogamais', 'dbDrogamais', None],
+        'dias_tolerancia': [0, 1, 2], 'hora_tolerancia': ['08:00', '00:00', None], 'ativo': [True, True, False],
+    })
+
+
+def test_sem_edicao_nao_gera_alteracoes():
+    editado = _carregado()
+    # Como volta do data_editor: horas como time e números como float
+    editado['hora_tolerancia'] = [time(8, 0), time(0, 0), None]
+    editado['dias_tolerancia'] = editado['dias_tolerancia'].astype(float)
+    assert calcular_alteracoes(_carregado(), editado) == ([], [], [])
+
+
+def test_insercao_atualizacao_e_exclusao_por_nome():
+    editado = _carregado()
+    editado.loc[1, 'dias_tolerancia'] = 5
+    editado = editado[editado['nome_ativo'] != 'c']
+    editado = pd.concat([editado, pd.DataFrame([{'nome_ativo': 'z', 'tipo_ativo': 'TABELA', 'conn_key': 'dbDrogamais'}])])
+
+    inserir, atualizar, excluir = calcular_alteracoes(_carregado(), editado)
+    assert [linha['nome_ativo'] for linha in inserir] == ['z']
+    assert [(linha['nome_ativo'], linha['dias_tolerancia']) for linha in atualizar] == [('b', 5)]
+    assert excluir == ['c']
+
+    with pytest.raises(ValueError):
+        calcular_alteracoes(_carregado(), pd.concat([_carregado(), _carregado().iloc[[0]]]))
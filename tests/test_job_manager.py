@@ -0,0 +1,75 @@
+# Testes do gerenciador de execuções em segundo plano da interface.
+# Executar com: python -m pytest tests/test_job_manager.py
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'interface'))
+
+from modules.job_manager import SRC_DIR, GerenciadorExecucoes  # noqa: E402
+from trava_arquivo import trava_arquivo  # noqa: E402
+
+
+def _aguardar(execucao, limite_s=10):
+    fim = time.monotonic() + limite_s
+    while execucao.em_andamento and time.monotonic() < fim:
+        time.sleep(0.05)
+
+
+def test_uma_execucao_por_vez_com_saida_e_historico(tmp_path):
+    script = tmp_path / 'main.py'
+    script.write_text(
+        "import sys, time\n"
+        "print('linha 1', flush=True)\n"
+        "time.sleep(0.5)\n"
+        "print('args', *sys.argv[1:])\n"
+        "sys.exit(2 if '--falhar' in sys.argv else 0)\n",
+        encoding='utf-8'
+    )
+    gerenciador = GerenciadorExecucoes(script, trava=tmp_path / 'execucao.lock')
+
+    primeira = gerenciador.iniciar(['--verificar-todas'])
+    assert primeira is not None and gerenciador.em_andamento()
+    # Single-flight: o segundo pedido é recusado enquanto o primeiro roda
+    assert gerenciador.iniciar() is None
+
+    _aguardar(primeira)
+    assert (primeira.status, primeira.codigo_saida) == ('Sucesso', 0)
+    assert list(primeira.linhas) == ['linha 1', 'args --verificar-todas']
+
+    segunda = gerenciador.iniciar(['--falhar'])
+    _aguardar(segunda)
+    assert (segunda.status, segunda.codigo_saida) == ('Erro', 2)
+    assert gerenciador.historico() == [segunda, primeira]
+
+
+def test_recusa_com_a_trava_de_outro_processo(tmp_path):
+    script = tmp_path / 'main.py'
+    script.write_text("print('rodou')\n", encoding='utf-8')
+    trava = tmp_path / 'execucao.lock'
+    # Outro processo (aqui um filho) com a trava: exec_main.bat, agendador...
+    dono = subprocess.Popen(
+        [sys.executable, '-c',
+         'import sys, time\n'
+         f'sys.path.insert(0, {str(SRC_DIR)!r})\n'
+         'from trava_arquivo import trava_arquivo\n'
+         f'with trava_arquivo({str(trava)!r}):\n'
+         '    print("ok", flush=True)\n'
+         '    time.sleep(30)\n'],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert dono.stdout.readline().strip() == 'ok'
+        gerenciador = GerenciadorExecucoes(script, trava=trava)
+        assert gerenciador.iniciar() is None
+        with trava_arquivo(trava, esperar=False) as obtida:
+            assert not obtida
+    finally:
+        dono.kill()
+        dono.wait()
+
+    execucao = GerenciadorExecucoes(script, trava=trava).iniciar()
+    _aguardar(execucao)
+    assert list(execucao.linhas) == ['rodou']
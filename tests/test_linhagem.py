@@ -0,0 +1,67 @@
+# Testes do grafo de linhagem (ordem topológica, ciclos e causa a montante).
+# Executar com: python -m pytest tests/test_linhagem.py
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('mariadb')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from check_sincronia import avaliar_linhagem  # noqa: E402
+from linhagem import GrafoLinhagem, montar_grafo  # noqa: E402
+
+CONFIG = {
+    'silver_sync_checks': [
+        {'conn_key': 'db', 'workspace_log': 'db', 'coluna': 'dt', 'nome_bronze': 'b_vendas', 'nome_silver': 's_vendas'},
+    ],
+    'gold_sync_checks': [
+        {'conn_key': 'db', 'workspace_log': 'db', 'coluna': 'dt', 'nome_bronze': 'b_vendas',
+         'nome_silver': 's_vendas', 'nome_gold': 'g_vendas'},
+    ],
+    'powerbi_lineage': [{'workspace': 'Fiscal', 'dataset': 'Vendas', 'origens': ['g_vendas']}],
+}
+
+
+def test_ordem_topologica_e_ciclo():
+    grafo = montar_grafo(CONFIG)
+    assert [grafo.nos[c].nome for c in grafo.ordem_topologica()] == ['b_vendas', 's_vendas', 'g_vendas', 'Fiscal/Vendas']
+
+    grafo = GrafoLinhagem()
+    a, b = grafo.adicionar('silver', 'a', 'db'), grafo.adicionar('gold', 'b', 'db')
+    grafo.ligar(a, b)
+    grafo.ligar(b, a)
+    with pytest.raises(ValueError, match='Ciclo'):
+        grafo.ordem_topologica()
+
+
+def test_coluna_conflitante_na_mesma_tabela():
+    config = {'silver_sync_checks': CONFIG['silver_sync_checks'] + [
+        {'conn_key': 'db', 'workspace_log': 'db', 'coluna': 'outra', 'nome_bronze': 'b_vendas', 'nome_silver': 's_x'},
+    ]}
+    with pytest.raises(ValueError, match='colunas diferentes'):
+        montar_grafo(config)
+
+
+def test_atraso_aponta_a_tabela_a_montante():
+    grafo = montar_grafo(CONFIG)
+    bronze, silver, gold, dataset = grafo.ordem_topologica()
+    valores = {bronze: datetime(2026, 3, 4), silver: datetime(2026, 3, 2), gold: datetime(2026, 3, 2)}
+
+    resultados = avaliar_linhagem(grafo, valores, {bronze: (0, '00:00')}, agora=datetime(2026, 3, 4, 10, 0))
+
+    assert resultados[bronze]['status'] == 'Atualizada' and resultados[bronze]['causa'] is None
+    assert resultados[silver]['status'] == 'Dessincronizado' and resultados[silver]['dias'] == -2
+    # A Gold está igual à Silver, mas atrás da Bronze: continua dessincronizada,
+    # e o atraso dela é explicado pela Silver
+    assert resultados[gold]['status'] == 'Dessincronizado' and resultados[gold]['dias'] == -2
+    assert resultados[gold]['causa'] == silver
+    assert resultados[dataset]['causa'] == silver
+
+    valores[bronze] = ConnectionError('sem conexão')
+    resultados = avaliar_linhagem(grafo, valores)
+    assert resultados[bronze]['status'] == 'Erro na Verificação'
+    assert resultados[gold]['causa'] == bronze
@@ -0,0 +1,60 @@
+# Testes da leitura do fiscal_bi.log no visualizador (tail, índice de execuções e busca).
+# Executar com: python -m pytest tests/test_log_reader.py
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'interface'))
+
+from modules import log_reader  # noqa: E402
+
+
+def _linha(hora, nivel, mensagem):
+    return f"2026-03-04 {hora},000 - {nivel} - {mensagem}\n"
+
+
+def _execucao(hora):
+    return (
+        _linha(hora, 'INFO', '### INICIANDO ORQUESTRADOR DE VERIFICAÇÃO DE DADOS ###')
+        + _linha(hora, 'INFO', "[check_tables_timestamp] ---> Verificando a tabela (dbDrogamais): 'bronze_vendas'")
+        + _linha(hora, 'ERROR', "[check_powerbi] ERRO: 'Painel Vendas' (Comercial): Failed")
+        + 'Traceback (most recent call last):\n'
+        + _linha(hora, 'INFO', '{"evento": "check_fim", "checker": "check_powerbi", "tipo": "powerbi"}')
+    )
+
+
+def test_ultimas_linhas_em_blocos(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_reader, 'TAMANHO_BLOCO', 16)
+    log = tmp_path / 'fiscal_bi.log'
+    log.write_text(''.join(f"linha {i}\n" for i in range(1000)), encoding='utf-8')
+
+    assert log_reader.ler_ultimas_linhas(log, 3) == ['linha 997', 'linha 998', 'linha 999']
+    assert len(log_reader.ler_ultimas_linhas(log, 5000)) == 1000
+
+
+def test_indice_de_execucoes_incremental(tmp_path):
+    log = tmp_path / 'fiscal_bi.log'
+    log.write_text(_execucao('08:00:00') + _execucao('09:00:00'), encoding='utf-8')
+
+    assert [h for _, h in log_reader.indexar_execucoes(log)] == ['2026-03-04 08:00:00,000', '2026-03-04 09:00:00,000']
+
+    with open(log, 'a', encoding='utf-8') as f:
+        f.write(_execucao('10:00:00'))
+    assert len(log_reader.indexar_execucoes(log)) == 3
+
+    data_hora, texto = log_reader.ler_execucao(log, -2)
+    assert data_hora.startswith('2026-03-04 09:00:00')
+    assert texto == _execucao('09:00:00')
+
+
+def test_busca_por_nivel_script_e_ativo(tmp_path):
+    log = tmp_path / 'fiscal_bi.log'
+    log.write_text(_execucao('08:00:00'), encoding='utf-8')
+
+    erros = list(log_reader.buscar(log, nivel='error'))
+    # A linha do traceback herda o nível da linha anterior
+    assert [r['mensagem'][:9] for r in erros] == ["[check_po", 'Traceback']
+
+    assert [r['checker'] for r in log_reader.buscar(log, script='check_powerbi')] == ['check_powerbi'] * 3
+    assert len(list(log_reader.buscar(log, ativo='BRONZE_VENDAS'))) == 1
+    assert len(list(log_reader.buscar(log, limite=2))) == 2
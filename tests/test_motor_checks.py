@@ -0,0 +1,114 @@
+# Testes do motor comum dos checkers (montagem das linhas de log e cache de probes).
+# Executar com: python -m pytest tests/test_motor_checks.py
+
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('mariadb')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_linhas_log import gerar_registros, montar_df_log_apply, normalizar  # noqa: E402
+from database import parametros_db  # noqa: E402
+from eventos import resumir_df_log  # noqa: E402
+import motor_checks  # noqa: E402
+from motor_checks import COLUNAS_LOG, CacheProbes, gravar_logs, montar_df_log  # noqa: E402
+
+
+def test_montar_df_log_equivale_ao_apply():
+    registros = gerar_registros(500)
+    assert normalizar(parametros_db(montar_df_log(registros))) == normalizar(montar_df_log_apply(registros))
+
+
+def test_montar_df_log_nulos_e_status():
+    registros = [
+        {'nome_workspace': 'w', 'nome_ativo': 'a', 'tipo_ativo': 'T', 'status_atualizacao': 'Atualizada',
+         'data_atualizacao': datetime(2026, 3, 4, 5, 6, 7), 'tipo_atualizacao': 'Scheduled',
+         'dias_sem_atualizar': 2, 'horas_sem_atualizar': 50.0},
+        {'nome_workspace': 'w', 'nome_ativo': 'b', 'tipo_ativo': 'T', 'status_atualizacao': 'Sem Histórico',
+         'data_atualizacao': None, 'tipo_atualizacao': 'Scheduled', 'dias_sem_atualizar': None},
+    ]
+    linhas = parametros_db(montar_df_log(registros))
+    assert linhas == [
+        ('w', 'a', 'T', 'OK', '2026-03-04', '05:06:07', 'Scheduled', 2),
+        ('w', 'b', 'T', 'Failed', None, None, 'Scheduled', None),
+    ]
+    assert list(montar_df_log(registros).columns) == COLUNAS_LOG
+
+    resumo = resumir_df_log(montar_df_log(registros))
+    assert (resumo['linhas'], resumo['ok'], resumo['falhas']) == (2, 1, 1)
+    assert resumo['por_tipo_ativo'] == {'T': {'Failed': 1, 'OK': 1}}
+    assert resumo['ativos_com_falha'] == ['w/b']
+
+
+def test_cache_probes_calcula_uma_vez_por_chave():
+    cache = CacheProbes()
+    chamadas = []
+
+    def _calcular(chaves):
+        chamadas.extend(chaves)
+        time.sleep(0.05)
+        return [f"max-{c}" for c in chaves]
+
+    resultados = []
+    threads = [
+        threading.Thread(target=lambda: resultados.append(cache.obter_varios(['t1', 't2'], _calcular)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(chamadas) == ['t1', 't2']
+    assert all(r == ['max-t1', 'max-t2'] for r in resultados)
+    assert cache.acertos == 6
+
+    with pytest.raises(ValueError):
+        cache.obter('t3', lambda: (_ for _ in ()).throw(ValueError('falhou')))
+    with pytest.raises(ValueError):
+        cache.obter('t3', lambda: 'não deveria recalcular')
+
+
+class _ConexaoFalsa:
+    def __init__(self):
+        self.eventos = []
+
+    def commit(self):
+        self.eventos.append('commit')
+
+    def rollback(self):
+        self.eventos.append('rollback')
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize('falha, esperado', [
+    (None, [('fat_fiscal', False), ('fat_fiscal_atual', False), 'commit']),
+    # Só o snapshot falhou: desfaz e grava o histórico sozinho
+    ('fat_fiscal_atual', [('fat_fiscal', False), ('fat_fiscal_atual', False), 'rollback', ('fat_fiscal', True)]),
+    # O histórico falhou: nada é repetido
+    ('fat_fiscal', [('fat_fiscal', False)]),
+])
+def test_gravar_logs_so_repete_o_historico_quando_o_snapshot_falha(monkeypatch, falha, esperado):
+    conn = _ConexaoFalsa()
+
+    def _insert(conn_log, df, tabela, ao_duplicar=None, commit=True):
+        conn.eventos.append((tabela, commit))
+        return tabela != falha
+
+    monkeypatch.setattr(motor_checks, 'get_db_connection', lambda config_key: conn)
+    monkeypatch.setattr(motor_checks, 'chave_execucao_disponivel', lambda: True)
+    monkeypatch.setattr(motor_checks, '_garantir_tabela_atual', lambda conn_log: None)
+    monkeypatch.setattr(motor_checks, 'insert_dataframe', _insert)
+    df = montar_df_log(gerar_registros(3))
+
+    assert gravar_logs(df) is (falha != 'fat_fiscal')
+    assert conn.eventos == esperado
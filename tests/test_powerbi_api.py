@@ -0,0 +1,148 @@
+# Testes do cliente da API do Power BI contra um servidor HTTP falso local.
+# Executar com: python -m pytest tests/test_powerbi_api.py
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+import powerbi_api  # noqa: E402
+
+
+class FakePowerBI(BaseHTTPRequestHandler):
+    """
+    Simula /groups, /groups/{ws}/datasets e /refreshes.
+    - A primeira chamada de refreshes de 'ds-429' responde 429 com Retry-After.
+    - 'ds-404' não existe mais (404).
+    - A listagem de workspaces vem paginada (@odata.nextLink).
+    - As listagens de datasets têm ETag e respondem 304 a If-None-Match.
+    - 'ds-hist' tem 10 refreshes e respeita o $top.
+    """
+    chamadas = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, corpo, headers=None):
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        with self.lock:
+            self.chamadas[self.path] = self.chamadas.get(self.path, 0) + 1
+            n = self.chamadas[self.path]
+        base = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+
+        if self.path == '/groups':
+            return self._json(200, {'value': [{'id': 'ws1', 'name': 'WS 1'}],
+                                    '@odata.nextLink': f"{base}/groups?page=2"})
+        if self.path == '/groups?page=2':
+            return self._json(200, {'value': [{'id': 'ws2', 'name': 'WS 2'}]})
+        if self.path.endswith('/datasets'):
+            ws = self.path.split('/')[2]
+            etag = f'"v1-{ws}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            ids = ['ds-ok', 'ds-429'] if ws == 'ws1' else ['ds-vazio', 'ds-404']
+            return self._json(200, {'value': [{'id': i, 'name': f"BI {i}"} for i in ids]}, {'ETag': etag})
+        if '/refreshes' in self.path:
+            ds = self.path.split('/')[4]
+            if ds == 'ds-404':
+                return self._json(404, {'error': 'not found'})
+            if ds == 'ds-429' and n == 1:
+                return self._json(429, {}, {'Retry-After': '0'})
+            if ds == 'ds-vazio':
+                return self._json(200, {'value': []})
+            if ds == 'ds-hist':
+                # 10 refreshes, do mais novo (r10) para o mais antigo (r1)
+                top = int(self.path.split('$top=')[1])
+                return self._json(200, {'value': [{'requestId': f"r{i}", 'status': 'Completed'}
+                                                  for i in range(10, 0, -1)][:top]})
+            return self._json(200, {'value': [{'requestId': f"r-{ds}", 'status': 'Completed',
+                                               'endTime': '2026-01-01T10:00:00Z', 'refreshType': 'Scheduled'}]})
+        return self._json(404, {})
+
+
+@pytest.fixture
+def servidor():
+    FakePowerBI.chamadas = {}
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakePowerBI)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def test_listar_paginado_segue_next_link(servidor):
+    session = powerbi_api.criar_sessao()
+    workspaces = powerbi_api.listar_paginado(session, f"{servidor}/groups", {})
+    assert [w['id'] for w in workspaces] == ['ws1', 'ws2']
+
+
+def test_coletar_refreshes_respeita_429_e_registra_erros(servidor):
+    session = powerbi_api.criar_sessao(4)
+    datasets = [
+        {'nome_bi': f"BI {ds}", 'workspace_name': 'WS', 'workspace_id': 'ws1', 'dataset_id': ds}
+        for ds in ['ds-ok', 'ds-429', 'ds-vazio', 'ds-404']
+    ]
+    registros = list(powerbi_api.coletar_refreshes(
+        session, datasets, {}, max_concorrencia=4, api_base=servidor, max_tentativas=3
+    ))
+    por_bi = {r['nome_bi']: r for r in registros}
+
+    assert len(registros) == 4
+    assert por_bi['BI ds-ok']['status'] == 'Completed'
+    assert por_bi['BI ds-429']['status'] == 'Completed'
+    assert FakePowerBI.chamadas['/groups/ws1/datasets/ds-429/refreshes?$top=1'] == 2
+    assert por_bi['BI ds-vazio']['status'] == 'Sem Histórico'
+    assert por_bi['BI ds-404']['status'] == 'Erro na API: 404'
+    assert por_bi['BI ds-404']['refreshType'] == 'Erro'
+
+
+def test_listar_datasets_workspaces_usa_etag(servidor):
+    session = powerbi_api.criar_sessao()
+    workspaces = [{'id': 'ws1'}, {'id': 'ws2'}]
+
+    primeira = powerbi_api.listar_datasets_workspaces(session, workspaces, {}, api_base=servidor)
+    assert [d['id'] for d in primeira['ws1'][0]] == ['ds-ok', 'ds-429']
+    assert primeira['ws2'][1] == '"v1-ws2"'
+
+    etags = {ws_id: etag for ws_id, (_, etag) in primeira.items()}
+    segunda = powerbi_api.listar_datasets_workspaces(session, workspaces, {}, etags=etags, api_base=servidor)
+    assert segunda['ws1'] == (None, '"v1-ws1"')
+    assert segunda['ws2'] == (None, '"v1-ws2"')
+
+
+def test_historico_incremental_so_usa_janela_maior_na_lacuna(servidor):
+    session = powerbi_api.criar_sessao()
+    ds = {'nome_bi': 'BI hist', 'workspace_name': 'WS', 'workspace_id': 'ws1', 'dataset_id': 'ds-hist'}
+
+    def _buscar(ancora):
+        registro = powerbi_api.buscar_ultimo_refresh(
+            session, ds, {}, api_base=servidor, janela=3, janela_lacuna=50, ancora=ancora
+        )
+        return [r['requestId'] for r in registro['refreshes']]
+
+    # Âncora dentro da janela pequena: uma única requisição
+    assert _buscar('r8') == ['r10', 'r9']
+    assert _buscar('r10') == []
+    assert '/groups/ws1/datasets/ds-hist/refreshes?$top=50' not in FakePowerBI.chamadas
+
+    # Lacuna (âncora fora da janela) e primeira carga usam $top maior
+    assert _buscar('r5') == ['r10', 'r9', 'r8', 'r7', 'r6']
+    assert len(_buscar(None)) == 10
+    assert FakePowerBI.chamadas['/groups/ws1/datasets/ds-hist/refreshes?$top=50'] == 2